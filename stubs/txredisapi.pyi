@@ -35,6 +35,13 @@ class RedisProtocol(protocol.Protocol):
         only_if_exists: bool = False,
     ) -> "Deferred[None]": ...
     def get(self, key: str) -> "Deferred[Any]": ...
+    def mget(self, keys: List[str]) -> "Deferred[List[Any]]": ...
+    def eval(
+        self,
+        source: str,
+        keys: Optional[List[str]] = None,
+        args: Optional[List[Any]] = None,
+    ) -> "Deferred[Any]": ...
 
 class SubscriberProtocol(RedisProtocol):
     def __init__(self, *args: object, **kwargs: object): ...
@@ -0,0 +1,125 @@
+# Beep beep!
+
+"""Replay a trace of cache lookups recorded with the `caches.access_trace` config
+option against caches of different sizes and eviction policies, to show what
+the hit ratio of the cache would be if it were configured differently.
+"""
+
+import argparse
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+from synapse.config.cache import CACHE_POLICIES
+from synapse.util.caches import trace
+from synapse.util.caches.lrucache import LruCache
+
+# The sizes to replay the trace against, relative to the size of the cache when
+# the trace was recorded, if not given on the command line.
+DEFAULT_SIZE_FACTORS = (0.25, 0.5, 1, 2, 4, 8)
+
+
+def replay(
+    records: Sequence[Tuple[int, int]], size: int, policy: str
+) -> Tuple[int, int]:
+    """Replay the records against a cache of the given size and policy, adding
+    keys which are missed as a caller of the cache would.
+
+    Returns:
+        The number of hits and misses.
+    """
+    cache: LruCache[int, bool] = LruCache(size, apply_cache_factor_from_config=False)
+    assert cache._set_policy is not None
+    cache._set_policy(policy)
+
+    hits = 0
+    misses = 0
+    for kind, key_hash in records:
+        if kind == trace.HIT or kind == trace.MISS:
+            if cache.get(key_hash) is None:
+                misses += 1
+                cache.set(key_hash, True)
+            else:
+                hits += 1
+        elif kind == trace.INVALIDATE:
+            cache.pop(key_hash, None)
+        elif kind == trace.CLEAR:
+            cache.clear()
+
+    return hits, misses
+
+
+def _hit_ratio(hits: int, misses: int) -> float:
+    if not hits + misses:
+        return 0.0
+    return hits / (hits + misses)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay a trace of cache lookups against caches of different "
+        "sizes and policies, and print the hit ratio of each."
+    )
+    parser.add_argument(
+        "trace_file",
+        type=argparse.FileType("rb"),
+        help="A trace file written by the caches.access_trace config option.",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=int,
+        nargs="+",
+        metavar="SIZE",
+        help="The cache sizes to replay against. Defaults to multiples of the "
+        "size of the cache when the trace was recorded.",
+    )
+    parser.add_argument(
+        "-p",
+        "--policies",
+        nargs="+",
+        choices=CACHE_POLICIES,
+        default=list(CACHE_POLICIES),
+        help="The cache policies to replay against.",
+    )
+    parsed = parser.parse_args(args)
+
+    try:
+        header, records_iter = trace.read_trace(parsed.trace_file)
+        records = list(records_iter)
+    except ValueError as e:
+        print("Error reading %s: %s" % (parsed.trace_file.name, e), file=sys.stderr)
+        sys.exit(1)
+
+    recorded_hits = sum(1 for kind, _ in records if kind == trace.HIT)
+    recorded_misses = sum(1 for kind, _ in records if kind == trace.MISS)
+
+    print(
+        "Cache %s: size %d, sampled %.4g of keys, %d lookups traced"
+        % (
+            header.cache_name,
+            header.max_size,
+            header.sample_rate,
+            recorded_hits + recorded_misses,
+        )
+    )
+    print("Recorded hit ratio: %.3f" % _hit_ratio(recorded_hits, recorded_misses))
+    print()
+
+    sizes = parsed.sizes
+    if not sizes:
+        sizes = [max(1, int(header.max_size * f)) for f in DEFAULT_SIZE_FACTORS]
+
+    print("\t".join(["size"] + parsed.policies))
+    for size in sizes:
+        # Only a sample of the keys were traced, so the cache needs to be
+        # scaled down by the same amount.
+        scaled_size = max(1, round(size * header.sample_rate))
+        ratios = [
+            "%.3f" % _hit_ratio(*replay(records, scaled_size, policy))
+            for policy in parsed.policies
+        ]
+        print("\t".join([str(size)] + ratios))
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,7 @@ import logging
 import os
 import re
 import threading
-from typing import Any, Callable, Dict, Mapping, Optional
+from typing import Any, Callable, Dict, FrozenSet, Mapping, Optional
 
 import attr
 
@@ -46,6 +46,23 @@ _CACHES_LOCK = threading.Lock()
 _DEFAULT_FACTOR_SIZE = 0.5
 _DEFAULT_EVENT_CACHE_SIZE = "10K"
 
+# The eviction policies which can be used by caches: either plain
+# least-recently-used, or an approximation of W-TinyLFU which takes into account
+# how frequently entries are used.
+CACHE_POLICIES = ("lru", "tinylfu")
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class CacheTraceConfig:
+    # The directory to write traces to.
+    directory: str
+    # The canonicalised names of the caches to trace.
+    caches: FrozenSet[str]
+    # The fraction of keys to trace.
+    sample_rate: float
+    # The maximum size of each trace file, in bytes.
+    max_bytes: int
+
 
 @attr.s(slots=True, auto_attribs=True)
 class CacheProperties:
@@ -54,6 +71,14 @@ class CacheProperties:
         os.environ.get(_CACHE_PREFIX, _DEFAULT_FACTOR_SIZE)
     )
     resize_all_caches_func: Optional[Callable[[], None]] = None
+    # Map from memory budget group to its size in bytes, and from canonicalised
+    # cache name to the group it is in.
+    memory_budgets: Dict[str, int] = attr.Factory(dict)
+    memory_budget_caches: Dict[str, str] = attr.Factory(dict)
+    # Map from canonicalised cache name to the policy it uses, if not "lru".
+    cache_policies: Dict[str, str] = attr.Factory(dict)
+    # Where to record traces of cache lookups, and which caches to trace.
+    access_trace: Optional[CacheTraceConfig] = None
 
 
 properties = CacheProperties()
@@ -73,6 +98,30 @@ def _canonicalise_cache_name(cache_name: str) -> str:
     return cache_name.lower()
 
 
+def get_memory_budget_group(cache_name: str) -> Optional[str]:
+    """Get the name of the group of caches sharing a memory budget which the
+    given cache is in, if any.
+    """
+    return properties.memory_budget_caches.get(_canonicalise_cache_name(cache_name))
+
+
+def get_cache_policy(cache_name: str) -> str:
+    """Get the eviction policy of the given cache, one of `CACHE_POLICIES`."""
+    return properties.cache_policies.get(_canonicalise_cache_name(cache_name), "lru")
+
+
+def get_access_trace_config(cache_name: str) -> Optional[CacheTraceConfig]:
+    """Get the config for recording a trace of lookups of the given cache, if it
+    is to be traced.
+    """
+    trace_config = properties.access_trace
+    if trace_config is None:
+        return None
+    if _canonicalise_cache_name(cache_name) not in trace_config.caches:
+        return None
+    return trace_config
+
+
 def add_resizable_cache(
     cache_name: str, cache_resize_callback: Callable[[float], None]
 ) -> None:
@@ -109,6 +158,10 @@ class CacheConfig(Config):
     track_memory_usage: bool
     expiry_time_msec: Optional[int]
     sync_response_cache_duration: int
+    memory_budgets: Dict[str, int]
+    memory_budget_caches: Dict[str, str]
+    cache_policies: Dict[str, str]
+    access_trace: Optional[CacheTraceConfig]
 
     @staticmethod
     def reset() -> None:
@@ -117,6 +170,10 @@ class CacheConfig(Config):
             os.environ.get(_CACHE_PREFIX, _DEFAULT_FACTOR_SIZE)
         )
         properties.resize_all_caches_func = None
+        properties.memory_budgets = {}
+        properties.memory_budget_caches = {}
+        properties.cache_policies = {}
+        properties.access_trace = None
         with _CACHES_LOCK:
             _CACHES.clear()
 
@@ -211,6 +268,84 @@ class CacheConfig(Config):
             cache_config.get("sync_response_cache_duration", "2m")
         )
 
+        # Groups of caches which share a budget for the estimated size of their
+        # entries, as well as being limited in their number of entries.
+        self.memory_budgets = {}
+        self.memory_budget_caches = {}
+        memory_budgets = cache_config.get("memory_budgets") or {}
+        if not isinstance(memory_budgets, dict):
+            raise ConfigError("caches.memory_budgets must be a dictionary")
+
+        for group, group_config in memory_budgets.items():
+            if not isinstance(group_config, dict):
+                raise ConfigError(
+                    "caches.memory_budgets.%s must be a dictionary" % (group,)
+                )
+
+            max_size = group_config.get("max_size")
+            if max_size is None:
+                raise ConfigError(
+                    "caches.memory_budgets.%s.max_size must be given" % (group,)
+                )
+            self.memory_budgets[group] = self.parse_size(max_size)
+
+            cache_names = group_config.get("caches")
+            if not isinstance(cache_names, list):
+                raise ConfigError(
+                    "caches.memory_budgets.%s.caches must be a list" % (group,)
+                )
+            for cache_name in cache_names:
+                cache_name = _canonicalise_cache_name(cache_name)
+                if cache_name in self.memory_budget_caches:
+                    raise ConfigError(
+                        "Cache %s is in more than one of caches.memory_budgets"
+                        % (cache_name,)
+                    )
+                self.memory_budget_caches[cache_name] = group
+
+        # The eviction policies of individual caches, if not plain LRU.
+        self.cache_policies = {}
+        cache_policies = cache_config.get("per_cache_policies") or {}
+        if not isinstance(cache_policies, dict):
+            raise ConfigError("caches.per_cache_policies must be a dictionary")
+
+        for cache_name, policy in cache_policies.items():
+            if policy not in CACHE_POLICIES:
+                raise ConfigError(
+                    "caches.per_cache_policies.%s must be one of %s"
+                    % (cache_name, ", ".join(CACHE_POLICIES))
+                )
+            self.cache_policies[_canonicalise_cache_name(cache_name)] = policy
+
+        # Recording traces of lookups of a sample of the keys of some caches,
+        # for replaying offline with `synapse_replay_cache_trace`.
+        self.access_trace = None
+        access_trace = cache_config.get("access_trace")
+        if access_trace is not None:
+            if not isinstance(access_trace, dict):
+                raise ConfigError("caches.access_trace must be a dictionary")
+
+            directory = access_trace.get("directory")
+            if not isinstance(directory, str):
+                raise ConfigError("caches.access_trace.directory must be given")
+
+            cache_names = access_trace.get("caches")
+            if not isinstance(cache_names, list):
+                raise ConfigError("caches.access_trace.caches must be a list")
+
+            sample_rate = access_trace.get("sample_rate", 0.01)
+            if not isinstance(sample_rate, (int, float)) or not 0 < sample_rate <= 1:
+                raise ConfigError(
+                    "caches.access_trace.sample_rate must be a number between 0 and 1"
+                )
+
+            self.access_trace = CacheTraceConfig(
+                directory=self.abspath(directory),
+                caches=frozenset(_canonicalise_cache_name(c) for c in cache_names),
+                sample_rate=float(sample_rate),
+                max_bytes=self.parse_size(access_trace.get("max_file_size", "100M")),
+            )
+
     def resize_all_caches(self) -> None:
         """Ensure all cache sizes are up-to-date.
 
@@ -224,6 +359,11 @@ class CacheConfig(Config):
         # needing an instance of CacheConfig
         properties.resize_all_caches_func = self.resize_all_caches
 
+        properties.memory_budgets = self.memory_budgets
+        properties.memory_budget_caches = self.memory_budget_caches
+        properties.cache_policies = self.cache_policies
+        properties.access_trace = self.access_trace
+
         # block other threads from modifying _CACHES while we iterate it.
         with _CACHES_LOCK:
             for cache_name, callback in _CACHES.items():
@@ -22,7 +22,7 @@
 import argparse
 import logging
 import os
-from typing import Any, List
+from typing import Any, List, Optional
 
 from synapse.config._base import Config, ConfigError
 from synapse.types import JsonDict
@@ -51,7 +51,9 @@ class DatabaseConnectionConfig:
             section of main config. Has three fields: `name` for database
             module name, `args` for the args to give to the database
             connector, and optional `data_stores` that is a list of stores to
-            provision on this database (defaulting to all).
+            provision on this database (defaulting to all). May also have
+            `replicas`, a list of read replicas of the database, each with
+            `args` for the connector which override those of the database.
     """
 
     def __init__(self, name: str, db_config: dict):
@@ -76,6 +78,57 @@ class DatabaseConnectionConfig:
         # changed the name).
         self.databases = data_stores
 
+        replicas = db_config.get("replicas") or []
+        if not isinstance(replicas, list) or not all(
+            isinstance(replica, dict) for replica in replicas
+        ):
+            raise ConfigError("'replicas' must be a list of objects")
+        if replicas and db_engine != "psycopg2":
+            raise ConfigError("Read replicas are only supported with postgres")
+
+        # The read replicas of the database, which are connected to with the
+        # same args as the database apart from those given for each replica.
+        self.replicas = [
+            DatabaseConnectionConfig(
+                "%s-replica%d" % (name, i),
+                {
+                    "name": db_engine,
+                    "args": {**db_config.get("args", {}), **replica.get("args", {})},
+                    "txn_limit": db_config.get("txn_limit", 0),
+                },
+            )
+            for i, replica in enumerate(replicas)
+        ]
+
+        if db_config.get("async_interactions", False):
+            if db_engine != "psycopg2":
+                raise ConfigError(
+                    "'async_interactions' is only supported with postgres"
+                )
+            try:
+                import greenlet  # noqa: F401
+            except ImportError:
+                raise ConfigError(
+                    "'async_interactions' requires the greenlet library to be"
+                    " installed"
+                )
+
+        # How far behind the database a replica may be, and how often to check.
+        self.replica_max_lag_ms: int = db_config.get("replica_max_lag_ms", 5000)
+        self.replica_poll_interval_ms: int = db_config.get(
+            "replica_poll_interval_ms", 100
+        )
+
+        # Whether to keep samples of the slowest interactions, and how slow they
+        # must be for their slowest statement to be EXPLAINed.
+        self.profile_interactions: bool = db_config.get("profile_interactions", False)
+        self.explain_threshold_ms: Optional[int] = db_config.get("explain_threshold_ms")
+        if self.explain_threshold_ms is not None and (
+            not isinstance(self.explain_threshold_ms, int)
+            or self.explain_threshold_ms < 0
+        ):
+            raise ConfigError("'explain_threshold_ms' must be a non-negative integer")
+
 
 class DatabaseConfig(Config):
     section = "database"
@@ -435,3 +435,61 @@ class ExperimentalConfig(Config):
             "beeper_user_notification_counts_enabled",
             False,
         )
+
+        # Whether to share the database rows of events between workers through
+        # the external (Redis) cache, and for how long to keep them there.
+        self.beeper_shared_event_cache_enabled: bool = experimental.get(
+            "beeper_shared_event_cache_enabled", False
+        )
+        self.beeper_shared_event_cache_expiry_ms: int = experimental.get(
+            "beeper_shared_event_cache_expiry_ms", 60 * 60 * 1000
+        )
+
+        # How to encode values written to the external (Redis) cache, either
+        # "json" or the more compact "msgpack". Values in either format can be
+        # read whatever this is set to.
+        self.beeper_external_cache_codec: str = experimental.get(
+            "beeper_external_cache_codec", "json"
+        )
+        if self.beeper_external_cache_codec not in ("json", "msgpack"):
+            raise ConfigError(
+                "beeper_external_cache_codec must be one of 'json' or 'msgpack'",
+                ("experimental", "beeper_external_cache_codec"),
+            )
+
+        # Whether to use the more compact, array-backed implementation of
+        # `StreamChangeCache`.
+        self.beeper_compact_stream_change_cache: bool = experimental.get(
+            "beeper_compact_stream_change_cache", False
+        )
+
+        # Whether to keep the JSON of events fetched from the database, and
+        # only decode the fields of them which are used, so that more events fit
+        # in the event cache.
+        self.beeper_compact_events: bool = experimental.get(
+            "beeper_compact_events", False
+        )
+
+        # Whether to send updates to replication streams in batches with the
+        # RDATA_BATCH command, rather than an RDATA command for each row. All
+        # instances must understand RDATA_BATCH before this is enabled.
+        self.beeper_replication_rdata_batches: bool = experimental.get(
+            "beeper_replication_rdata_batches", False
+        )
+
+        # How long to wait, in milliseconds, for more updates to the caches,
+        # receipts and typing replication streams before handling them together
+        # in a single batch. Updates which have already arrived are handled
+        # together if this is 0, and each update is handled separately if it
+        # isn't set.
+        self.beeper_replication_coalesce_window_ms: Optional[int] = experimental.get(
+            "beeper_replication_coalesce_window_ms"
+        )
+        if self.beeper_replication_coalesce_window_ms is not None and (
+            not isinstance(self.beeper_replication_coalesce_window_ms, int)
+            or self.beeper_replication_coalesce_window_ms < 0
+        ):
+            raise ConfigError(
+                "beeper_replication_coalesce_window_ms must be a non-negative integer",
+                ("experimental", "beeper_replication_coalesce_window_ms"),
+            )
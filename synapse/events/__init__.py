@@ -29,12 +29,14 @@ from typing import (
     Dict,
     Generic,
     Iterable,
+    Iterator,
     List,
     Optional,
     Tuple,
     Type,
     TypeVar,
     Union,
+    cast,
     overload,
 )
 
@@ -46,7 +48,8 @@ from synapse.api.constants import RelationTypes
 from synapse.api.room_versions import EventFormatVersions, RoomVersion, RoomVersions
 from synapse.synapse_rust.events import EventInternalMetadata
 from synapse.types import JsonDict, StrCollection
-from synapse.util.caches import intern_dict
+from synapse.util import json_decoder
+from synapse.util.caches import KNOWN_KEYS, intern_dict
 from synapse.util.frozenutils import freeze
 from synapse.util.stringutils import strtobool
 
@@ -482,6 +485,249 @@ class FrozenEventV3(FrozenEventV2):
         return self._event_id
 
 
+# The fields of compact events which are decoded when the event is built,
+# rather than when they are first used, as nearly every use of an event
+# needs them.
+_COMPACT_EVENT_EAGER_KEYS = (
+    "event_id",
+    "type",
+    "room_id",
+    "sender",
+    "state_key",
+    "content",
+    "depth",
+    "origin_server_ts",
+)
+
+
+class _CompactEventDict(collections.abc.MutableMapping):
+    """The `_dict` of a compact event: the JSON of the event, with only the
+    fields in `_COMPACT_EVENT_EAGER_KEYS` decoded until any others are used.
+
+    When any other field is first looked up, the JSON is decoded once into all
+    the fields and the signatures, and then dropped, so that the event takes
+    about as much memory as any other event from then on. The signatures and
+    unsigned data aren't fields of the dict, as with other events, but are kept
+    in `signatures` once decoded and `unsigned` from the start, as the unsigned
+    data is small and used whenever the event is served.
+    """
+
+    __slots__ = ("_json", "_keys", "_fields", "_decoded", "signatures", "unsigned")
+
+    def __init__(self, event_json: bytes, event_dict: JsonDict):
+        # The JSON and keys of the event, until all the fields have been
+        # decoded into `_fields`.
+        self._json: Optional[bytes] = event_json
+        self._keys: Optional[Tuple[str, ...]] = tuple(
+            KNOWN_KEYS.get(key, key)
+            for key in event_dict
+            if key not in ("signatures", "unsigned")
+        )
+        self._fields = intern_dict(
+            {
+                key: freeze(event_dict[key]) if USE_FROZEN_DICTS else event_dict[key]
+                for key in _COMPACT_EVENT_EAGER_KEYS
+                if key in event_dict
+            }
+        )
+
+        # The decoded event, while the event is being built.
+        self._decoded: Optional[JsonDict] = event_dict
+
+        self.signatures: Optional[Dict[str, Dict[str, str]]] = None
+        self.unsigned: JsonDict = dict(event_dict.get("unsigned", {}))
+
+    def release(self) -> None:
+        """Drop the decoded event passed in when building the event."""
+        self._decoded = None
+
+    def decode(self) -> JsonDict:
+        """Decode the whole event into a new dict, which includes the signatures
+        and unsigned data unless all the fields have been decoded already.
+        """
+        if self._keys is None:
+            return dict(self._fields)
+
+        assert self._json is not None
+        if self._decoded is not None:
+            event_dict = dict(self._decoded)
+        else:
+            event_dict = json_decoder.decode(self._json.decode("utf-8"))
+
+        # Apply any changes made to the fields since the event was built.
+        for key in list(event_dict):
+            if key not in self._keys and key not in ("signatures", "unsigned"):
+                del event_dict[key]
+        event_dict.update(self._fields)
+        return event_dict
+
+    def decode_remaining(self) -> None:
+        """Decode the JSON into all the fields which haven't been decoded yet,
+        and the signatures if they haven't been either, and drop the JSON.
+        """
+        if self._keys is None:
+            return
+
+        assert self._json is not None
+        if self._decoded is not None:
+            event_dict = self._decoded
+        else:
+            event_dict = json_decoder.decode(self._json.decode("utf-8"))
+
+        fields = {}
+        for key in self._keys:
+            if key in self._fields:
+                fields[key] = self._fields[key]
+            else:
+                value = event_dict.get(key)
+                fields[key] = freeze(value) if USE_FROZEN_DICTS else value
+        self._fields = fields
+
+        if self.signatures is None:
+            self.signatures = event_dict.get("signatures", {})
+
+        self._json = None
+        self._keys = None
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._fields[key]
+        except KeyError:
+            pass
+
+        if self._keys is None or key not in self._keys:
+            raise KeyError(key)
+
+        self.decode_remaining()
+        return self._fields[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._keys is not None and key not in self._keys:
+            self._keys += (key,)
+        self._fields[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if self._keys is None:
+            del self._fields[key]
+            return
+
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys = tuple(k for k in self._keys if k != key)
+        self._fields.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        return key in (self._fields if self._keys is None else self._keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields if self._keys is None else self._keys)
+
+    def __len__(self) -> int:
+        return len(self._fields if self._keys is None else self._keys)
+
+
+class _CompactEvent(EventBase):
+    """An event which keeps its JSON, rather than the decoded event, and only
+    decodes the fields which are used.
+
+    This makes events which are cached, but rarely used in full, much smaller:
+    the signatures, hashes, and prev and auth events in particular are only
+    needed to send the event over federation. Which fields have been used can be
+    seen in `_dict._fields`.
+    """
+
+    def __init__(
+        self,
+        event_json: str,
+        event_dict: JsonDict,
+        room_version: RoomVersion,
+        internal_metadata_dict: Optional[JsonDict] = None,
+        rejected_reason: Optional[str] = None,
+    ):
+        assert room_version.event_format == self.format_version
+
+        self.room_version = room_version
+        self.rejected_reason = rejected_reason
+
+        # `_dict` is only ever used as a mapping.
+        self._dict = cast(
+            JsonDict, _CompactEventDict(event_json.encode("utf-8"), event_dict)
+        )
+
+        self.internal_metadata = EventInternalMetadata(internal_metadata_dict or {})
+
+        # Work out the event ID (if it isn't in the event) while the decoded
+        # event is to hand, rather than decoding it again later.
+        self._event_id: Optional[str] = event_dict.get("event_id")
+        self._event_id = self.event_id
+        self._compact_dict.release()
+
+    @property
+    def _compact_dict(self) -> _CompactEventDict:
+        return cast(_CompactEventDict, self._dict)
+
+    @property
+    def signatures(self) -> Dict[str, Dict[str, str]]:
+        compact_dict = self._compact_dict
+        if compact_dict.signatures is None:
+            compact_dict.decode_remaining()
+            assert compact_dict.signatures is not None
+        return compact_dict.signatures
+
+    @signatures.setter
+    def signatures(self, signatures: Dict[str, Dict[str, str]]) -> None:
+        self._compact_dict.signatures = signatures
+
+    @property
+    def unsigned(self) -> JsonDict:
+        return self._compact_dict.unsigned
+
+    @unsigned.setter
+    def unsigned(self, unsigned: JsonDict) -> None:
+        self._compact_dict.unsigned = unsigned
+
+    def get_dict(self) -> JsonDict:
+        # Decode the event without keeping the fields which haven't been used,
+        # or build it from the fields if they have all been decoded already.
+        compact_dict = self._compact_dict
+        d = compact_dict.decode()
+        if compact_dict.signatures is not None:
+            d["signatures"] = compact_dict.signatures
+        else:
+            d.setdefault("signatures", {})
+        d["unsigned"] = dict(compact_dict.unsigned)
+
+        return d
+
+    def get_templated_pdu_json(self) -> JsonDict:
+        template_json = self.get_dict()
+        template_json.pop("signatures")
+        template_json.pop("unsigned")
+        template_json.pop("hashes")
+
+        return template_json
+
+    def items(self) -> List[Tuple[str, Optional[Any]]]:
+        d = self._compact_dict.decode()
+        return [(key, d[key]) for key in self._compact_dict]
+
+    def freeze(self) -> None:
+        # The fields are frozen as they are decoded, if needed.
+        pass
+
+
+class CompactFrozenEvent(_CompactEvent, FrozenEvent):
+    pass
+
+
+class CompactFrozenEventV2(_CompactEvent, FrozenEventV2):
+    pass
+
+
+class CompactFrozenEventV3(_CompactEvent, FrozenEventV3):
+    pass
+
+
 def _event_type_from_format_version(
     format_version: int,
 ) -> Type[Union[FrozenEvent, FrozenEventV2, FrozenEventV3]]:
@@ -518,6 +764,35 @@ def make_event_from_dict(
     )
 
 
+def make_compact_event_from_json(
+    event_json: str,
+    event_dict: JsonDict,
+    room_version: RoomVersion = RoomVersions.V1,
+    internal_metadata_dict: Optional[JsonDict] = None,
+    rejected_reason: Optional[str] = None,
+) -> EventBase:
+    """Construct a compact EventBase from the JSON of an event, and the event
+    decoded from it.
+
+    The event keeps the JSON, and decodes the fields of the event from it as
+    they are used, which takes less memory than `make_event_from_dict` for
+    events which are kept in caches.
+    """
+    event_type: Type[_CompactEvent]
+    if room_version.event_format == EventFormatVersions.ROOM_V1_V2:
+        event_type = CompactFrozenEvent
+    elif room_version.event_format == EventFormatVersions.ROOM_V3:
+        event_type = CompactFrozenEventV2
+    elif room_version.event_format == EventFormatVersions.ROOM_V4_PLUS:
+        event_type = CompactFrozenEventV3
+    else:
+        raise Exception("No event format %r" % (room_version.event_format,))
+
+    return event_type(
+        event_json, event_dict, room_version, internal_metadata_dict, rejected_reason
+    )
+
+
 @attr.s(slots=True, frozen=True, auto_attribs=True)
 class _EventRelation:
     # The target event of the relation.
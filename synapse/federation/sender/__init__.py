@@ -500,6 +500,15 @@ class FederationSender(AbstractFederationSender):
                     logger.debug("All events processed")
                     break
 
+                # Look up the destinations of the whole batch of events in the
+                # external cache at once, rather than an event at a time.
+                prev_state_groups = await self._external_cache.get_many(
+                    "event_to_prev_state_group", event_entries.keys()
+                )
+                joined_hosts_by_state_group = await self._external_cache.get_many(
+                    "get_joined_hosts", {str(sg) for sg in prev_state_groups.values()}
+                )
+
                 async def handle_event(event: EventBase) -> None:
                     # Only send events for this server.
                     send_on_behalf_of = event.internal_metadata.get_send_on_behalf_of()
@@ -579,13 +588,9 @@ class FederationSender(AbstractFederationSender):
                         # We check the external cache for the destinations, which is
                         # stored per state group.
 
-                        sg = await self._external_cache.get(
-                            "event_to_prev_state_group", event.event_id
-                        )
+                        sg = prev_state_groups.get(event.event_id)
                         if sg:
-                            destinations = await self._external_cache.get(
-                                "get_joined_hosts", str(sg)
-                            )
+                            destinations = joined_hosts_by_state_group.get(str(sg))
                             if destinations is None:
                                 # Add logging to help track down https://github.com/matrix-org/synapse/issues/13444
                                 logger.info(
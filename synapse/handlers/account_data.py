@@ -21,11 +21,13 @@
 #
 import logging
 import random
-from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Mapping, Optional, Tuple
 
 from synapse.api.constants import AccountDataTypes
 from synapse.replication.http.account_data import (
     ReplicationAddRoomAccountDataRestServlet,
+    ReplicationAddRoomAccountDataTypesRestServlet,
+    ReplicationAddRoomsAccountDataRestServlet,
     ReplicationAddTagRestServlet,
     ReplicationAddUserAccountDataRestServlet,
     ReplicationRemoveRoomAccountDataRestServlet,
@@ -60,6 +62,12 @@ class AccountDataHandler:
         self._add_room_data_client = (
             ReplicationAddRoomAccountDataRestServlet.make_client(hs)
         )
+        self._add_rooms_data_client = (
+            ReplicationAddRoomsAccountDataRestServlet.make_client(hs)
+        )
+        self._add_room_data_types_client = (
+            ReplicationAddRoomAccountDataTypesRestServlet.make_client(hs)
+        )
         self._remove_room_data_client = (
             ReplicationRemoveRoomAccountDataRestServlet.make_client(hs)
         )
@@ -141,6 +149,92 @@ class AccountDataHandler:
             )
             return response["max_stream_id"]
 
+    async def add_account_data_to_rooms(
+        self,
+        user_id: str,
+        room_ids: StrCollection,
+        account_data_type: str,
+        content: JsonDict,
+    ) -> int:
+        """Add the same account_data to many rooms for a user.
+
+        The rooms are all updated in a single transaction, and clients are only
+        notified once.
+
+        Args:
+            user_id: The user to add the account_data for.
+            room_ids: The rooms to add the account_data to.
+            account_data_type: The type of account_data to add.
+            content: A json object to associate with the account_data.
+
+        Returns:
+            The maximum stream ID.
+        """
+        if self._instance_name in self._account_data_writers:
+            max_stream_id = await self._store.add_account_data_to_rooms(
+                user_id, room_ids, account_data_type, content
+            )
+
+            self._notifier.on_new_event(
+                StreamKeyType.ACCOUNT_DATA, max_stream_id, users=[user_id]
+            )
+
+            for room_id in room_ids:
+                await self._notify_modules(user_id, room_id, account_data_type, content)
+
+            return max_stream_id
+        else:
+            response = await self._add_rooms_data_client(
+                instance_name=random.choice(self._account_data_writers),
+                user_id=user_id,
+                room_ids=room_ids,
+                account_data_type=account_data_type,
+                content=content,
+            )
+            return response["max_stream_id"]
+
+    async def add_account_data_types_to_room(
+        self,
+        user_id: str,
+        room_id: str,
+        account_data: Mapping[str, JsonDict],
+    ) -> int:
+        """Add several types of account_data to a room for a user.
+
+        All the types are written in a single transaction, and clients are only
+        notified once.
+
+        Args:
+            user_id: The user to add the account_data for.
+            room_id: The room to add the account_data to.
+            account_data: A map of account_data type to the json object to
+                associate with it.
+
+        Returns:
+            The maximum stream ID.
+        """
+        if self._instance_name in self._account_data_writers:
+            max_stream_id = await self._store.add_account_data_types_to_room(
+                user_id, room_id, account_data
+            )
+
+            self._notifier.on_new_event(
+                StreamKeyType.ACCOUNT_DATA, max_stream_id, users=[user_id]
+            )
+
+            for account_data_type, content in account_data.items():
+                await self._notify_modules(user_id, room_id, account_data_type, content)
+
+            return max_stream_id
+        else:
+            response = await self._add_room_data_types_client(
+                instance_name=random.choice(self._account_data_writers),
+                user_id=user_id,
+                room_id=room_id,
+                account_data=account_data,
+            )
+            return response["max_stream_id"]
+
     async def remove_account_data_for_room(
         self, user_id: str, room_id: str, account_data_type: str
     ) -> Optional[int]:
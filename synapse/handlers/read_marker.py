@@ -20,7 +20,7 @@
 #
 
 import logging
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Mapping, Optional
 
 from synapse.api.constants import ReceiptTypes
 from synapse.api.errors import SynapseError
@@ -45,12 +45,22 @@ class ReadMarkerHandler:
         user_id: str,
         event_id: str,
         extra_content: Optional[JsonDict] = None,
+        account_data: Optional[Mapping[str, JsonDict]] = None,
     ) -> None:
         """Updates the read marker for a given user in a given room if the event ID given
         is ahead in the stream relative to the current read marker.
 
         This uses a notifier to indicate that account data should be sent down /sync if
         the read marker has changed.
+
+        Args:
+            room_id: The room to update the read marker in.
+            user_id: The user to update the read marker for.
+            event_id: The event ID to move the read marker to.
+            extra_content: Additional content to store with the read marker.
+            account_data: Other room account data to write in the same
+                transaction as the read marker, regardless of whether the read
+                marker is updated.
         """
 
         async with self.read_marker_linearizer.queue((room_id, user_id)):
@@ -76,7 +86,16 @@ class ReadMarkerHandler:
                     should_update = event_ordering > old_event_ordering
 
             if should_update:
-                content = content = {"event_id": event_id, **(extra_content or {})}
-                await self.account_data_handler.add_account_data_to_room(
-                    user_id, room_id, ReceiptTypes.FULLY_READ, content
+                content = {"event_id": event_id, **(extra_content or {})}
+                if not account_data:
+                    await self.account_data_handler.add_account_data_to_room(
+                        user_id, room_id, ReceiptTypes.FULLY_READ, content
+                    )
+                    return
+
+                account_data = {**account_data, ReceiptTypes.FULLY_READ: content}
+
+            if account_data:
+                await self.account_data_handler.add_account_data_types_to_room(
+                    user_id, room_id, account_data
                 )
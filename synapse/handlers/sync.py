@@ -2014,6 +2014,16 @@ class SyncHandler:
         newly_joined_rooms = room_changes.newly_joined_rooms
         newly_left_rooms = room_changes.newly_left_rooms
 
+        # Beeper: fetch the previews for all the rooms up front, rather than
+        # one room at a time as each room entry is generated.
+        beeper_previews: Mapping[str, Optional[Tuple[str, int]]] = {}
+        beeper_preview_events: Mapping[str, EventBase] = {}
+        if sync_result_builder.sync_config.beeper_previews:
+            (
+                beeper_previews,
+                beeper_preview_events,
+            ) = await self._beeper_prefetch_previews(sync_result_builder, room_entries)
+
         # 4. We need to apply further processing to `room_entries` (rooms considered
         # joined or archived).
         async def handle_room_entries(room_entry: "RoomSyncResultBuilder") -> None:
@@ -2026,6 +2036,8 @@ class SyncHandler:
                 tags=tags_by_room.get(room_entry.room_id),
                 account_data=account_data_by_room.get(room_entry.room_id, {}),
                 always_include=sync_result_builder.full_state,
+                beeper_previews=beeper_previews,
+                beeper_preview_events=beeper_preview_events,
             )
             logger.debug("Generated room entry for %s", room_entry.room_id)
 
@@ -2037,6 +2049,41 @@ class SyncHandler:
 
         return set(newly_joined_rooms), set(newly_left_rooms)
 
+    async def _beeper_prefetch_previews(
+        self,
+        sync_result_builder: "SyncResultBuilder",
+        room_entries: List["RoomSyncResultBuilder"],
+    ) -> Tuple[Mapping[str, Optional[Tuple[str, int]]], Mapping[str, EventBase]]:
+        """Fetch the previews, and the preview events, for all the joined rooms
+        which may have new events in this sync.
+
+        Returns:
+            A map from room ID to preview, as returned by
+            `beeper_preview_event_for_room_id_and_user_id`, and a map from event
+            ID to preview event.
+        """
+        # Rooms which definitely have no new events won't have their previews
+        # generated, see `_generate_room_entry`.
+        room_ids = [
+            room_entry.room_id
+            for room_entry in room_entries
+            if room_entry.rtype == "joined" and room_entry.events != []
+        ]
+        if not room_ids:
+            return {}, {}
+
+        previews = await self.store.beeper_preview_events_for_room_ids_and_user_id(
+            room_ids,
+            sync_result_builder.sync_config.user.to_string(),
+            sync_result_builder.now_token.room_key,
+        )
+
+        preview_events = await self.store.get_events_as_list(
+            [preview[0] for preview in previews.values() if preview is not None]
+        )
+
+        return previews, {event.event_id: event for event in preview_events}
+
     async def _have_rooms_changed(
         self, sync_result_builder: "SyncResultBuilder"
     ) -> bool:
@@ -2393,6 +2440,8 @@ class SyncHandler:
         tags: Optional[Mapping[str, JsonMapping]],
         account_data: Mapping[str, JsonMapping],
         always_include: bool = False,
+        beeper_previews: Optional[Mapping[str, Optional[Tuple[str, int]]]] = None,
+        beeper_preview_events: Optional[Mapping[str, EventBase]] = None,
     ) -> None:
         """Populates the `joined` and `archived` section of `sync_result_builder`
         based on the `room_builder`.
@@ -2423,6 +2472,10 @@ class SyncHandler:
             account_data: List of new account data for room
             always_include: Always include this room in the sync response,
                 even if empty.
+            beeper_previews: Previews that have already been fetched, by room
+                ID. Previews for any other rooms are fetched as needed.
+            beeper_preview_events: Preview events that have already been
+                fetched, by event ID.
         """
         newly_joined = room_builder.newly_joined
         full_state = (
@@ -2575,11 +2628,12 @@ class SyncHandler:
 
                 # Only generate previews if we have new events that would change it
                 if batch.events and sync_config.beeper_previews:
-                    preview = (
-                        await self.store.beeper_preview_event_for_room_id_and_user_id(
+                    if beeper_previews is not None and room_id in beeper_previews:
+                        preview = beeper_previews[room_id]
+                    else:
+                        preview = await self.store.beeper_preview_event_for_room_id_and_user_id(
                             room_id=room_id, user_id=user_id, to_key=now_token.room_key
                         )
-                    )
 
                     if preview:
                         preview_event_id, preview_origin_server_ts = preview
@@ -2595,10 +2649,17 @@ class SyncHandler:
                             if ev.event_id == preview_event_id:
                                 break
                         else:
-                            room_sync.preview["event"] = await self.store.get_event(
-                                preview_event_id,
-                                allow_none=True,
-                            )
+                            preview_event: Optional[EventBase] = None
+                            if beeper_preview_events:
+                                preview_event = beeper_preview_events.get(
+                                    preview_event_id
+                                )
+                            if preview_event is None:
+                                preview_event = await self.store.get_event(
+                                    preview_event_id,
+                                    allow_none=True,
+                                )
+                            room_sync.preview["event"] = preview_event
                     else:
                         # This should never happen!
                         logger.warning("Beeper preview is missing! roomID=%s", room_id)
@@ -41,7 +41,7 @@ from synapse.types import (
     StreamKeyType,
     UserID,
 )
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 from synapse.util.metrics import Measure
 from synapse.util.retryutils import filter_destinations_by_retry_limiter
 from synapse.util.wheel_timer import WheelTimer
@@ -279,8 +279,8 @@ class TypingWriterHandler(FollowerTypingHandler):
         self._member_typing_until: Dict[RoomMember, int] = {}
 
         # caches which room_ids changed at which serials
-        self._typing_stream_change_cache = StreamChangeCache(
-            "TypingStreamChangeCache", self._latest_room_serial
+        self._typing_stream_change_cache = create_stream_change_cache(
+            hs, "TypingStreamChangeCache", self._latest_room_serial
         )
 
     def _handle_timeout_for_member(self, now: int, member: RoomMember) -> None:
@@ -32,7 +32,10 @@ async def get_badge_count(store: DataStore, user_id: str, group_by_room: bool) -
 
     badge = len(invites)
 
-    room_to_count = await store.get_unread_counts_by_room_for_user(user_id)
+    if store.user_notification_counts_enabled:
+        room_to_count = await store.beeper_get_unread_counts_by_room_for_user(user_id)
+    else:
+        room_to_count = await store.get_unread_counts_by_room_for_user(user_id)
     for _room_id, notify_count in room_to_count.items():
         if notify_count == 0:
             continue
@@ -20,13 +20,13 @@
 #
 
 import logging
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING, Mapping, Tuple
 
 from twisted.web.server import Request
 
 from synapse.http.server import HttpServer
 from synapse.replication.http._base import ReplicationEndpoint
-from synapse.types import JsonDict
+from synapse.types import JsonDict, StrCollection
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -161,6 +161,101 @@ class ReplicationAddRoomAccountDataRestServlet(ReplicationEndpoint):
         return 200, {"max_stream_id": max_stream_id}
 
 
+class ReplicationAddRoomsAccountDataRestServlet(ReplicationEndpoint):
+    """Add the same room account data to many rooms on the appropriate account
+    data worker.
+
+    Request format:
+
+        POST /_synapse/replication/add_rooms_account_data/:user_id/:account_data_type
+
+        {
+            "room_ids": [ ... ],
+            "content": { ... },
+        }
+
+    """
+
+    NAME = "add_rooms_account_data"
+    PATH_ARGS = ("user_id", "account_data_type")
+    CACHE = False
+
+    def __init__(self, hs: "HomeServer"):
+        super().__init__(hs)
+
+        self.handler = hs.get_account_data_handler()
+
+    @staticmethod
+    async def _serialize_payload(  # type: ignore[override]
+        user_id: str,
+        room_ids: StrCollection,
+        account_data_type: str,
+        content: JsonDict,
+    ) -> JsonDict:
+        payload = {
+            "room_ids": list(room_ids),
+            "content": content,
+        }
+
+        return payload
+
+    async def _handle_request(  # type: ignore[override]
+        self,
+        request: Request,
+        content: JsonDict,
+        user_id: str,
+        account_data_type: str,
+    ) -> Tuple[int, JsonDict]:
+        max_stream_id = await self.handler.add_account_data_to_rooms(
+            user_id, content["room_ids"], account_data_type, content["content"]
+        )
+
+        return 200, {"max_stream_id": max_stream_id}
+
+
+class ReplicationAddRoomAccountDataTypesRestServlet(ReplicationEndpoint):
+    """Add several types of room account data for a room on the appropriate
+    account data worker.
+
+    Request format:
+
+        POST /_synapse/replication/add_room_account_data_types/:user_id/:room_id
+
+        {
+            "account_data": { "<type>": { ... }, ... },
+        }
+
+    """
+
+    NAME = "add_room_account_data_types"
+    PATH_ARGS = ("user_id", "room_id")
+    CACHE = False
+
+    def __init__(self, hs: "HomeServer"):
+        super().__init__(hs)
+
+        self.handler = hs.get_account_data_handler()
+
+    @staticmethod
+    async def _serialize_payload(  # type: ignore[override]
+        user_id: str, room_id: str, account_data: Mapping[str, JsonDict]
+    ) -> JsonDict:
+        payload = {
+            "account_data": account_data,
+        }
+
+        return payload
+
+    async def _handle_request(  # type: ignore[override]
+        self, request: Request, content: JsonDict, user_id: str, room_id: str
+    ) -> Tuple[int, JsonDict]:
+        max_stream_id = await self.handler.add_account_data_types_to_room(
+            user_id, room_id, content["account_data"]
+        )
+
+        return 200, {"max_stream_id": max_stream_id}
+
+
 class ReplicationRemoveRoomAccountDataRestServlet(ReplicationEndpoint):
     """Remove room account data on the appropriate account data worker.
 
@@ -289,6 +384,8 @@ class ReplicationRemoveTagRestServlet(ReplicationEndpoint):
 def register_servlets(hs: "HomeServer", http_server: HttpServer) -> None:
     ReplicationAddUserAccountDataRestServlet(hs).register(http_server)
     ReplicationAddRoomAccountDataRestServlet(hs).register(http_server)
+    ReplicationAddRoomsAccountDataRestServlet(hs).register(http_server)
+    ReplicationAddRoomAccountDataTypesRestServlet(hs).register(http_server)
     ReplicationAddTagRestServlet(hs).register(http_server)
     ReplicationRemoveTagRestServlet(hs).register(http_server)
 
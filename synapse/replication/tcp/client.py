@@ -164,6 +164,7 @@ class ReplicationDataHandler:
         elif stream_name == EventsStream.NAME:
             # We shouldn't get multiple rows per token for events stream, so
             # we don't need to optimise this for multiple rows.
+            current_state_changed = False
             for row in rows:
                 if row.type != EventsStreamEventRow.TypeId:
                     # The row's data is an `EventsStreamCurrentStateRow`.
@@ -171,7 +172,7 @@ class ReplicationDataHandler:
                     # extremities (see `update_current_state`), no new events are
                     # persisted, so we must poke the replication callbacks ourselves.
                     # This functionality is used when finishing up a partial state join.
-                    self.notifier.notify_replication()
+                    current_state_changed = True
                     continue
                 assert isinstance(row, EventsStreamRow)
                 assert isinstance(row.data, EventsStreamEventRow)
@@ -217,6 +218,9 @@ class ReplicationDataHandler:
                     self._state_storage_controller.get_server_acl_for_room.invalidate(
                         (row.data.room_id,)
                     )
+
+            if current_state_changed:
+                self.notifier.notify_replication()
         elif stream_name == UnPartialStatedRoomStream.NAME:
             for row in rows:
                 assert isinstance(row, UnPartialStatedRoomStreamRow)
@@ -20,10 +20,14 @@
 #
 
 import logging
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Collection, Dict, Mapping, Optional, Tuple, Union
 
+import msgpack
+from immutabledict import immutabledict
 from prometheus_client import Counter, Histogram
 
+from twisted.internet import defer
+
 from synapse.logging import opentracing
 from synapse.logging.context import make_deferred_yieldable
 from synapse.util import json_decoder, json_encoder
@@ -62,6 +66,58 @@ response_timer = Histogram(
 
 logger = logging.getLogger(__name__)
 
+# Values encoded with msgpack are prefixed with a byte which can't start a JSON
+# value, so that they can be told apart from JSON values written by workers
+# configured differently. It also stops txredisapi from trying to convert them
+# to numbers.
+_MSGPACK_PREFIX = b"\x00"
+
+
+def _msgpack_default(obj: Any) -> Any:
+    """Makes immutabledicts serializable by msgpack, which only packs dicts."""
+    if isinstance(obj, immutabledict):
+        return dict(obj)
+    raise TypeError("Can not serialize value of type %s" % (type(obj).__name__,))
+
+
+# Sets KEYS[1] to ARGV[1] with an expiry of ARGV[3] milliseconds, unless its
+# version in KEYS[2] is no longer ARGV[2] (where "" is no version).
+_SET_IF_UNCHANGED_SCRIPT = """
+local version = redis.call('GET', KEYS[2])
+if (version or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+return 1
+"""
+
+# Deletes KEYS[1] and increments its version in KEYS[2], which expires after
+# ARGV[1] milliseconds.
+_INVALIDATE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def _decode_value(result: Union[int, float, str, bytes]) -> Any:
+    """Decode a value read from Redis, which may be JSON or msgpack."""
+
+    # txredisapi converts anything which looks like a number to one.
+    if isinstance(result, (int, float)):
+        return result
+
+    # ... and decodes anything which is valid UTF-8.
+    if isinstance(result, str):
+        if not result.startswith("\x00"):
+            return json_decoder.decode(result)
+        result = result.encode("utf-8")
+    elif not result.startswith(_MSGPACK_PREFIX):
+        return json_decoder.decode(result.decode("utf-8"))
+
+    return msgpack.unpackb(result[len(_MSGPACK_PREFIX) :], raw=False)
+
 
 class ExternalCache:
     """A cache backed by an external Redis. Does nothing if no Redis is
@@ -76,9 +132,16 @@ class ExternalCache:
         else:
             self._redis_connection = None
 
+        self._use_msgpack = hs.config.experimental.beeper_external_cache_codec == (
+            "msgpack"
+        )
+
     def _get_redis_key(self, cache_name: str, key: str) -> str:
         return "cache_v1:%s:%s" % (cache_name, key)
 
+    def _get_version_key(self, cache_name: str, key: str) -> str:
+        return "cache_v1_version:%s:%s" % (cache_name, key)
+
     def is_enabled(self) -> bool:
         """Whether the external cache is used or not.
 
@@ -87,6 +150,15 @@ class ExternalCache:
         """
         return self._redis_connection is not None
 
+    def _encode_value(self, value: Any) -> Union[str, bytes]:
+        # txredisapi requires the value to be string, bytes or numbers, so we
+        # encode stuff in JSON, or msgpack if configured.
+        if self._use_msgpack:
+            return _MSGPACK_PREFIX + msgpack.packb(
+                value, use_bin_type=True, default=_msgpack_default
+            )
+        return json_encoder.encode(value)
+
     async def set(self, cache_name: str, key: str, value: Any, expiry_ms: int) -> None:
         """Add the key/value to the named cache, with the expiry time given."""
 
@@ -95,9 +167,7 @@ class ExternalCache:
 
         set_counter.labels(cache_name).inc()
 
-        # txredisapi requires the value to be string, bytes or numbers, so we
-        # encode stuff in JSON.
-        encoded_value = json_encoder.encode(value)
+        encoded_value = self._encode_value(value)
 
         logger.debug("Caching %s %s: %r", cache_name, key, encoded_value)
 
@@ -136,8 +206,208 @@ class ExternalCache:
         if not result:
             return None
 
-        # For some reason the integers get magically converted back to integers
-        if isinstance(result, int):
-            return result
+        return _decode_value(result)
+
+    async def get_many(self, cache_name: str, keys: Collection[str]) -> Dict[str, Any]:
+        """Look up many keys in the named cache with a single request.
+
+        Returns:
+            A map from key to value, for the keys which were found.
+        """
+
+        if self._redis_connection is None or not keys:
+            return {}
 
-        return json_decoder.decode(result)
+        keys = list(keys)
+
+        with opentracing.start_active_span(
+            "ExternalCache.get_many",
+            tags={opentracing.SynapseTags.CACHE_NAME: cache_name},
+        ):
+            with response_timer.labels("get_many").time():
+                results = await make_deferred_yieldable(
+                    self._redis_connection.mget(
+                        [self._get_redis_key(cache_name, key) for key in keys]
+                    )
+                )
+
+        found = {}
+        for key, result in zip(keys, results):
+            if not result:
+                continue
+
+            found[key] = _decode_value(result)
+
+        get_counter.labels(cache_name, True).inc(len(found))
+        get_counter.labels(cache_name, False).inc(len(keys) - len(found))
+
+        return found
+
+    async def set_many(
+        self, cache_name: str, values: Mapping[str, Any], expiry_ms: int
+    ) -> None:
+        """Add many key/values to the named cache, with the expiry time given.
+
+        The values are all encoded up front and then sent together, rather than
+        waiting for each to be set in turn. Redis has no multi-key SET which
+        takes an expiry, but txredisapi writes each command without waiting for
+        the previous reply, so this still only costs a single round trip.
+        """
+
+        if self._redis_connection is None or not values:
+            return
+
+        set_counter.labels(cache_name).inc(len(values))
+
+        encoded_values = {
+            self._get_redis_key(cache_name, key): self._encode_value(value)
+            for key, value in values.items()
+        }
+
+        with opentracing.start_active_span(
+            "ExternalCache.set_many",
+            tags={opentracing.SynapseTags.CACHE_NAME: cache_name},
+        ):
+            with response_timer.labels("set_many").time():
+                await make_deferred_yieldable(
+                    defer.gatherResults(
+                        [
+                            self._redis_connection.set(
+                                redis_key, encoded_value, pexpire=expiry_ms
+                            )
+                            for redis_key, encoded_value in encoded_values.items()
+                        ],
+                        consumeErrors=True,
+                    )
+                )
+
+    async def get_many_versioned(
+        self, cache_name: str, keys: Collection[str]
+    ) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Look up many keys in the named cache, along with how many times each
+        has been invalidated with `invalidate_many`, with a single request.
+
+        The versions are passed to `set_many_if_unchanged` to write back values
+        for keys which were missing, read from the source of truth after this
+        was called.
+
+        Returns:
+            A map from key to value, for the keys which were found, and a map
+            from key to version, for the keys which have been invalidated.
+        """
+
+        if self._redis_connection is None or not keys:
+            return {}, {}
+
+        keys = list(keys)
+
+        with opentracing.start_active_span(
+            "ExternalCache.get_many_versioned",
+            tags={opentracing.SynapseTags.CACHE_NAME: cache_name},
+        ):
+            with response_timer.labels("get_many_versioned").time():
+                results = await make_deferred_yieldable(
+                    self._redis_connection.mget(
+                        [self._get_redis_key(cache_name, key) for key in keys]
+                        + [self._get_version_key(cache_name, key) for key in keys]
+                    )
+                )
+
+        found = {}
+        versions = {}
+        for key, result, version in zip(
+            keys, results[: len(keys)], results[len(keys) :]
+        ):
+            if result:
+                found[key] = _decode_value(result)
+            if version is not None:
+                versions[key] = int(version)
+
+        get_counter.labels(cache_name, True).inc(len(found))
+        get_counter.labels(cache_name, False).inc(len(keys) - len(found))
+
+        return found, versions
+
+    async def set_many_if_unchanged(
+        self,
+        cache_name: str,
+        values: Mapping[str, Any],
+        versions: Mapping[str, int],
+        expiry_ms: int,
+    ) -> None:
+        """Add many key/values to the named cache, with the expiry time given,
+        unless they have been invalidated since their versions were read with
+        `get_many_versioned`.
+
+        This stops values which were read from the source of truth before it
+        changed from being written back after they were invalidated.
+        """
+
+        if self._redis_connection is None or not values:
+            return
+
+        set_counter.labels(cache_name).inc(len(values))
+
+        with opentracing.start_active_span(
+            "ExternalCache.set_many_if_unchanged",
+            tags={opentracing.SynapseTags.CACHE_NAME: cache_name},
+        ):
+            with response_timer.labels("set_many_if_unchanged").time():
+                await make_deferred_yieldable(
+                    defer.gatherResults(
+                        [
+                            self._redis_connection.eval(
+                                _SET_IF_UNCHANGED_SCRIPT,
+                                [
+                                    self._get_redis_key(cache_name, key),
+                                    self._get_version_key(cache_name, key),
+                                ],
+                                [
+                                    self._encode_value(value),
+                                    str(versions.get(key, "")),
+                                    expiry_ms,
+                                ],
+                            )
+                            for key, value in values.items()
+                        ],
+                        consumeErrors=True,
+                    )
+                )
+
+    async def invalidate_many(
+        self, cache_name: str, keys: Collection[str], expiry_ms: int
+    ) -> None:
+        """Remove many keys from the named cache, and bump their versions so that
+        values read before now aren't written back by `set_many_if_unchanged`.
+
+        Args:
+            cache_name: The name of the cache.
+            keys: The keys to remove.
+            expiry_ms: How long to keep the versions for. This must be longer
+                than it takes to read values from the source of truth.
+        """
+
+        if self._redis_connection is None or not keys:
+            return
+
+        with opentracing.start_active_span(
+            "ExternalCache.invalidate_many",
+            tags={opentracing.SynapseTags.CACHE_NAME: cache_name},
+        ):
+            with response_timer.labels("invalidate_many").time():
+                await make_deferred_yieldable(
+                    defer.gatherResults(
+                        [
+                            self._redis_connection.eval(
+                                _INVALIDATE_SCRIPT,
+                                [
+                                    self._get_redis_key(cache_name, key),
+                                    self._get_version_key(cache_name, key),
+                                ],
+                                [expiry_ms],
+                            )
+                            for key in keys
+                        ],
+                        consumeErrors=True,
+                    )
+                )
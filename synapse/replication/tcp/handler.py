@@ -19,6 +19,7 @@
 # [This file includes modifications made by New Vector Limited]
 #
 #
+import itertools
 import logging
 from typing import (
     TYPE_CHECKING,
@@ -49,6 +50,7 @@ from synapse.replication.tcp.commands import (
     LockReleasedCommand,
     NewActiveTaskCommand,
     PositionCommand,
+    RdataBatchCommand,
     RdataCommand,
     RemoteServerUpCommand,
     ReplicateCommand,
@@ -88,11 +90,21 @@ remove_pusher_counter = Counter("synapse_replication_tcp_resource_remove_pusher"
 
 user_ip_cache_counter = Counter("synapse_replication_tcp_resource_user_ip_cache", "")
 
+# number of RDATA and RDATA_BATCH commands which were handled together with an
+# earlier command for the same stream
+coalesced_rdata_counter = Counter(
+    "synapse_replication_tcp_protocol_coalesced_rdata", "", ["stream_name"]
+)
+
+# The streams whose updates can be handled together in a single batch, even if
+# they were sent with different tokens, as the rows don't depend on their own
+# token. See `ReplicationCommandHandler._process_coalesced_rdata`.
+COALESCED_STREAMS = (CachesStream.NAME, ReceiptsStream.NAME, TypingStream.NAME)
+
 
 # the type of the entries in _command_queues_by_stream
-_StreamCommandQueue = Deque[
-    Tuple[Union[RdataCommand, PositionCommand], IReplicationConnection]
-]
+_StreamCommand = Union[RdataCommand, RdataBatchCommand, PositionCommand]
+_StreamCommandQueue = Deque[Tuple[_StreamCommand, IReplicationConnection]]
 
 
 class ReplicationCommandHandler:
@@ -109,6 +121,13 @@ class ReplicationCommandHandler:
         self._instance_id = hs.get_instance_id()
         self._instance_name = hs.get_instance_name()
 
+        # Beeper: how long to wait for more updates to the `COALESCED_STREAMS`
+        # to arrive before handling them together, or None to handle them
+        # as they arrive.
+        self._coalesce_window_ms = (
+            hs.config.experimental.beeper_replication_coalesce_window_ms
+        )
+
         # Additional Redis channel suffixes to subscribe to.
         self._channels_to_subscribe_to: List[str] = []
 
@@ -292,7 +311,7 @@ class ReplicationCommandHandler:
             self._channels_to_subscribe_to.append(channel_name)
 
     def _add_command_to_stream_queue(
-        self, conn: IReplicationConnection, cmd: Union[RdataCommand, PositionCommand]
+        self, conn: IReplicationConnection, cmd: _StreamCommand
     ) -> None:
         """Queue the given received command for processing
 
@@ -326,19 +345,59 @@ class ReplicationCommandHandler:
 
         self._processing_streams.add(stream_name)
         try:
+            coalesce = (
+                self._coalesce_window_ms is not None
+                and stream_name in COALESCED_STREAMS
+            )
+            if coalesce and self._coalesce_window_ms:
+                # Wait for more updates to arrive, so they can be handled
+                # together.
+                await self._clock.sleep(self._coalesce_window_ms / 1000)
+
             queue = self._command_queues_by_stream.get(stream_name)
             while queue:
                 cmd, conn = queue.popleft()
                 try:
-                    await self._process_command(cmd, conn, stream_name)
+                    if coalesce and isinstance(cmd, (RdataCommand, RdataBatchCommand)):
+                        await self._process_coalesced_rdata(
+                            stream_name, conn, self._pop_rdata_run(queue, conn, cmd)
+                        )
+                    else:
+                        await self._process_command(cmd, conn, stream_name)
                 except Exception:
                     logger.exception("Failed to handle command %s", cmd)
         finally:
             self._processing_streams.discard(stream_name)
 
+    def _pop_rdata_run(
+        self,
+        queue: _StreamCommandQueue,
+        conn: IReplicationConnection,
+        cmd: Union[RdataCommand, RdataBatchCommand],
+    ) -> List[Union[RdataCommand, RdataBatchCommand]]:
+        """Pops the RDATA and RDATA_BATCH commands queued after the given command
+        that came from the same instance over the same connection, stopping at
+        the first other command (e.g. a POSITION).
+        """
+        cmds = [cmd]
+        while queue:
+            next_cmd, next_conn = queue[0]
+            if (
+                not isinstance(next_cmd, (RdataCommand, RdataBatchCommand))
+                or next_conn is not conn
+                or next_cmd.instance_name != cmd.instance_name
+            ):
+                break
+            queue.popleft()
+            cmds.append(next_cmd)
+
+        if len(cmds) > 1:
+            coalesced_rdata_counter.labels(cmd.stream_name).inc(len(cmds) - 1)
+        return cmds
+
     async def _process_command(
         self,
-        cmd: Union[PositionCommand, RdataCommand],
+        cmd: _StreamCommand,
         conn: IReplicationConnection,
         stream_name: str,
     ) -> None:
@@ -346,6 +405,8 @@ class ReplicationCommandHandler:
             await self._process_position(stream_name, conn, cmd)
         elif isinstance(cmd, RdataCommand):
             await self._process_rdata(stream_name, conn, cmd)
+        elif isinstance(cmd, RdataBatchCommand):
+            await self._process_rdata_batch(stream_name, conn, cmd)
         else:
             # This shouldn't be possible
             raise Exception("Unrecognised command %s in stream queue", cmd.NAME)
@@ -570,6 +631,137 @@ class ReplicationCommandHandler:
         else:
             await self.on_rdata(stream_name, cmd.instance_name, cmd.token, rows)
 
+    def on_RDATA_BATCH(
+        self, conn: IReplicationConnection, cmd: RdataBatchCommand
+    ) -> None:
+        if cmd.instance_name == self._instance_name:
+            # Ignore RDATA_BATCH that are just our own echoes
+            return
+
+        stream_name = cmd.stream_name
+        inbound_rdata_count.labels(stream_name).inc(len(cmd.updates))
+
+        # Queued for the same reasons as RDATA, see `on_RDATA`.
+        self._add_command_to_stream_queue(conn, cmd)
+
+    async def _process_rdata_batch(
+        self, stream_name: str, conn: IReplicationConnection, cmd: RdataBatchCommand
+    ) -> None:
+        """Process an RDATA_BATCH command, as a batched series of RDATA for each
+        token in it.
+
+        Called after the command has been popped off the queue of inbound commands
+        """
+        stream = self._streams[stream_name]
+
+        try:
+            updates = [(token, stream.parse_row(row)) for token, row in cmd.updates]
+        except Exception as e:
+            raise Exception(
+                "Failed to parse RDATA_BATCH: %r %r" % (stream_name, cmd.updates)
+            ) from e
+
+        # As with RDATA, drop the rows if we've not yet processed a POSITION for
+        # this stream on this connection.
+        sbc = self._streams_by_connection.get(conn)
+        if not sbc or stream_name not in sbc:
+            logger.debug(
+                "Discarding RDATA_BATCH for unconnected stream %s -> %s",
+                stream_name,
+                cmd.updates[-1][0] if cmd.updates else None,
+            )
+            return
+
+        # Any rows from a batched series of RDATA belong with the first token.
+        rows = self._pending_batches.pop(stream_name, [])
+
+        for token, token_updates in itertools.groupby(updates, key=lambda u: u[0]):
+            rows.extend(row for _, row in token_updates)
+
+            current_token = stream.current_token(cmd.instance_name)
+            if token <= current_token:
+                logger.debug(
+                    "Discarding RDATA_BATCH from stream %s at position %s before previous position %s",
+                    stream_name,
+                    token,
+                    current_token,
+                )
+            else:
+                await self.on_rdata(stream_name, cmd.instance_name, token, rows)
+
+            rows = []
+
+    async def _process_coalesced_rdata(
+        self,
+        stream_name: str,
+        conn: IReplicationConnection,
+        cmds: List[Union[RdataCommand, RdataBatchCommand]],
+    ) -> None:
+        """Process a run of RDATA and RDATA_BATCH commands from the same instance
+        together, as a single batch of rows with the last token.
+
+        This is only done for the `COALESCED_STREAMS`, where the rows don't
+        depend on their own token, so that the cache invalidations and notifier
+        wake ups for a burst of updates are done once rather than for each row.
+        """
+        stream = self._streams[stream_name]
+        instance_name = cmds[0].instance_name
+
+        updates: List[Tuple[Optional[int], Any]] = []
+        for cmd in cmds:
+            try:
+                if isinstance(cmd, RdataCommand):
+                    updates.append((cmd.token, stream.parse_row(cmd.row)))
+                else:
+                    updates.extend(
+                        (token, stream.parse_row(row)) for token, row in cmd.updates
+                    )
+            except Exception as e:
+                raise Exception(
+                    "Failed to parse %s: %r %r" % (cmd.NAME, stream_name, cmd.to_line())
+                ) from e
+
+        # As with RDATA, drop the rows if we've not yet processed a POSITION for
+        # this stream on this connection.
+        sbc = self._streams_by_connection.get(conn)
+        if not sbc or stream_name not in sbc:
+            logger.debug(
+                "Discarding %d coalesced RDATA for unconnected stream %s",
+                len(cmds),
+                stream_name,
+            )
+            return
+
+        current_token = stream.current_token(instance_name)
+
+        rows = self._pending_batches.pop(stream_name, [])
+        batch_rows: list = []
+        batch_token: Optional[int] = None
+        for token, row in updates:
+            rows.append(row)
+            if token is None:
+                # Part of a batched series of RDATA, see `_process_rdata`.
+                continue
+
+            if token <= current_token:
+                logger.debug(
+                    "Discarding RDATA from stream %s at position %s before previous position %s",
+                    stream_name,
+                    token,
+                    current_token,
+                )
+            else:
+                batch_rows.extend(rows)
+                batch_token = token
+            rows = []
+
+        if rows:
+            # The run ended part way through a batched series of RDATA.
+            self._pending_batches[stream_name] = rows
+
+        if batch_token is not None:
+            await self.on_rdata(stream_name, instance_name, batch_token, batch_rows)
+
     async def on_rdata(
         self, stream_name: str, instance_name: str, token: int, rows: list
     ) -> None:
@@ -833,6 +1025,12 @@ class ReplicationCommandHandler:
         """
         self.send_command(RdataCommand(stream_name, self._instance_name, token, data))
 
+    def stream_updates(self, stream_name: str, updates: List[Tuple[int, Any]]) -> None:
+        """Called when new updates are available to stream to Redis subscribers,
+        to send them in a single RDATA_BATCH.
+        """
+        self.send_command(RdataBatchCommand(stream_name, self._instance_name, updates))
+
     def on_lock_released(
         self, instance_name: str, lock_name: str, lock_key: str
     ) -> None:
@@ -50,6 +50,7 @@ from synapse.replication.tcp.commands import (
     ErrorCommand,
     NameCommand,
     PingCommand,
+    RdataBatchCommand,
     ReplicateCommand,
     ServerCommand,
     parse_command_from_line,
@@ -317,8 +318,6 @@ class BaseReplicationStreamProtocol(LineOnlyReceiver):
             self._queue_command(cmd)
             return
 
-        tcp_outbound_commands_counter.labels(cmd.NAME, self.name).inc()
-
         string = "%s %s" % (cmd.NAME, cmd.to_line())
         if "\n" in string:
             raise Exception("Unexpected newline in command: %r", string)
@@ -326,11 +325,20 @@ class BaseReplicationStreamProtocol(LineOnlyReceiver):
         encoded_string = string.encode("utf-8")
 
         if len(encoded_string) > self.MAX_LENGTH:
+            if isinstance(cmd, RdataBatchCommand):
+                # The batch is too long for the other side to read, so fall
+                # back to sending an RDATA for each row.
+                for rdata_cmd in cmd.to_rdata_commands():
+                    self.send_command(rdata_cmd, do_buffer)
+                return
+
             raise Exception(
                 "Failed to send command %s as too long (%d > %d)"
                 % (cmd.NAME, len(encoded_string), self.MAX_LENGTH)
             )
 
+        tcp_outbound_commands_counter.labels(cmd.NAME, self.name).inc()
+
         self.sendLine(encoded_string)
 
         self.last_sent_command = self.clock.time_msec()
@@ -46,6 +46,10 @@ stream_updates_counter = Counter(
 
 logger = logging.getLogger(__name__)
 
+# The most rows to send in an RDATA_BATCH command, unless there are more rows
+# with the same token.
+RDATA_BATCH_SIZE = 500
+
 
 class ReplicationStreamProtocolFactory(ServerFactory):
     """Factory for new replication connections."""
@@ -86,6 +90,12 @@ class ReplicationStreamer:
 
         self._replication_torture_level = hs.config.server.replication_torture_level
 
+        # Whether to send updates in RDATA_BATCH commands, rather than an RDATA
+        # for each row.
+        self._send_rdata_batches = (
+            hs.config.experimental.beeper_replication_rdata_batches
+        )
+
         self.notifier.add_replication_callback(self.on_notifier_poke)
 
         # Keeps track of whether we are currently checking for updates
@@ -267,20 +277,29 @@ class ReplicationStreamer:
                             )
                             continue
 
-                        # Some streams return multiple rows with the same stream IDs,
-                        # we need to make sure they get sent out in batches. We do
-                        # this by setting the current token to all but the last of
-                        # a series of updates with the same token to have a None
-                        # token. See RdataCommand for more details.
-                        batched_updates = _batch_updates(updates)
-
-                        for token, row in batched_updates:
-                            try:
-                                self.command_handler.stream_update(
-                                    stream.NAME, token, row
-                                )
-                            except Exception:
-                                logger.exception("Failed to replicate")
+                        if self._send_rdata_batches:
+                            for batch in _split_updates(updates, RDATA_BATCH_SIZE):
+                                try:
+                                    self.command_handler.stream_updates(
+                                        stream.NAME, batch
+                                    )
+                                except Exception:
+                                    logger.exception("Failed to replicate")
+                        else:
+                            # Some streams return multiple rows with the same stream IDs,
+                            # we need to make sure they get sent out in batches. We do
+                            # this by setting the current token to all but the last of
+                            # a series of updates with the same token to have a None
+                            # token. See RdataCommand for more details.
+                            batched_updates = _batch_updates(updates)
+
+                            for token, row in batched_updates:
+                                try:
+                                    self.command_handler.stream_update(
+                                        stream.NAME, token, row
+                                    )
+                                except Exception:
+                                    logger.exception("Failed to replicate")
 
                         # The last token we send may not match the current
                         # token, in which case we want to send out a `POSITION`
@@ -333,3 +352,31 @@ def _batch_updates(
 
     new_updates.append(updates[-1])
     return new_updates
+
+
+def _split_updates(
+    updates: List[Tuple[Token, StreamRow]], max_rows: int
+) -> List[List[Tuple[Token, StreamRow]]]:
+    """Splits a list of updates into lists of about `max_rows` updates, to send
+    in RDATA_BATCH commands. Updates with the same token are always kept in the
+    same list, so lists may be longer than `max_rows`.
+
+    For example, with `max_rows` of 2:
+
+        [(1, _), (1, _), (1, _), (2, _), (3, _), (4, _)]
+
+    becomes:
+
+        [[(1, _), (1, _), (1, _)], [(2, _), (3, _)], [(4, _)]]
+    """
+    batches: List[List[Tuple[Token, StreamRow]]] = []
+    batch: List[Tuple[Token, StreamRow]] = []
+    for update in updates:
+        if len(batch) >= max_rows and batch[-1][0] != update[0]:
+            batches.append(batch)
+            batch = []
+        batch.append(update)
+
+    if batch:
+        batches.append(batch)
+    return batches
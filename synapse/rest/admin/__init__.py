@@ -48,6 +48,7 @@ from synapse.rest.admin.background_updates import (
     BackgroundUpdateRestServlet,
     BackgroundUpdateStartJobRestServlet,
 )
+from synapse.rest.admin.database import DatabaseInteractionsRestServlet
 from synapse.rest.admin.devices import (
     DeleteDevicesRestServlet,
     DeviceRestServlet,
@@ -322,6 +323,7 @@ def register_servlets(hs: "HomeServer", http_server: HttpServer) -> None:
     BackgroundUpdateEnabledRestServlet(hs).register(http_server)
     BackgroundUpdateRestServlet(hs).register(http_server)
     BackgroundUpdateStartJobRestServlet(hs).register(http_server)
+    DatabaseInteractionsRestServlet(hs).register(http_server)
     ExperimentalFeaturesRestServlet(hs).register(http_server)
 
 
@@ -0,0 +1,74 @@
+# Beep beep!
+
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Tuple
+
+from synapse.api.errors import SynapseError
+from synapse.http.servlet import RestServlet, parse_boolean, parse_integer
+from synapse.http.site import SynapseRequest
+from synapse.rest.admin._base import admin_patterns, assert_requester_is_admin
+from synapse.types import JsonDict
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+
+class DatabaseInteractionsRestServlet(RestServlet):
+    """Get the database interactions which take the most time in total, and
+    samples of the slowest of them.
+    """
+
+    PATTERNS = admin_patterns("/database/interactions$")
+
+    def __init__(self, hs: "HomeServer"):
+        self._auth = hs.get_auth()
+        self._data_stores = hs.get_datastores()
+
+    async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        await assert_requester_is_admin(self._auth, request)
+
+        limit = parse_integer(request, "limit", default=10)
+        if limit < 0:
+            raise SynapseError(
+                HTTPStatus.BAD_REQUEST, "'limit' parameter must be non-negative"
+            )
+        include_params = parse_boolean(request, "include_params", default=False)
+
+        databases = {}
+        for db in self._data_stores.databases:
+            busiest = [
+                {"desc": desc, "count": count, "total_time_ms": int(cum_time * 1000)}
+                for desc, count, cum_time in db.get_busiest_interactions(limit)
+            ]
+
+            slowest = []
+            if db.profiler is not None:
+                for sample in db.profiler.get_slowest(limit):
+                    slowest.append(
+                        {
+                            "desc": sample.desc,
+                            "ts": sample.ts,
+                            "duration_ms": int(sample.duration * 1000),
+                            "rows": sample.rows,
+                            "fetched_bytes": sample.fetched_bytes,
+                            "statements": sample.statements,
+                            "slowest_statement": {
+                                "sql": sample.slowest_sql,
+                                "params": sample.slowest_params
+                                if include_params
+                                else None,
+                                "duration_ms": int(sample.slowest_duration * 1000),
+                                "plan": sample.plan,
+                            }
+                            if sample.slowest_duration is not None
+                            else None,
+                        }
+                    )
+
+            databases[db.name()] = {
+                "profiling": db.profiler is not None,
+                "busiest": busiest,
+                "slowest": slowest,
+            }
+
+        return HTTPStatus.OK, {"databases": databases}
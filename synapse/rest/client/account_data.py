@@ -21,7 +21,7 @@
 
 import json
 import logging
-from typing import TYPE_CHECKING, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 from synapse.api.constants import AccountDataTypes, ReceiptTypes
 from synapse.api.errors import AuthError, Codes, NotFoundError, SynapseError
@@ -367,28 +367,36 @@ class RoomBeeperInboxStateServlet(RestServlet):
 
         body = parse_json_object_from_request(request)
 
+        # Everything is written in one account data transaction, along with the
+        # fully read marker if there is one.
+        account_data: Dict[str, JsonDict] = {}
+
         if "done" in body:
             delta_ms = body["done"].get("at_delta") or 0
-            done = {"updated_ts": ts, "at_ts": ts + delta_ms}
-            await self.handler.add_account_data_to_room(
-                user_id, room_id, "com.beeper.inbox.done", done
-            )
+            account_data["com.beeper.inbox.done"] = {
+                "updated_ts": ts,
+                "at_ts": ts + delta_ms,
+            }
             logger.info(f"SetBeeperDone done_delta_ms={delta_ms}")
 
         if "marked_unread" in body:
-            marked_unread = {"unread": body["marked_unread"], "ts": ts}
-            await self.handler.add_account_data_to_room(
-                user_id, room_id, "m.marked_unread", marked_unread
-            )
+            account_data["m.marked_unread"] = {
+                "unread": body["marked_unread"],
+                "ts": ts,
+            }
             logger.info(f"SetBeeperMarkedUnread marked_unread={body['marked_unread']}")
 
         if "read_markers" in body:
             await self.read_marker_client.handle_read_marker(
-                room_id, body["read_markers"], requester
+                room_id, body["read_markers"], requester, account_data=account_data
             )
             logger.info(
                 f"SetBeeperReadMarkers read_markers={json.dumps(body['read_markers'])}"
             )
+        elif account_data:
+            await self.handler.add_account_data_types_to_room(
+                user_id, room_id, account_data
+            )
 
         return 200, {}
 
@@ -417,13 +425,20 @@ class BeeperInboxBatchArchiveServlet(RestServlet):
         ts = self.clock.time_msec()
         body = parse_json_object_from_request(request)
 
-        done = {"updated_ts": ts, "at_ts": ts}
-        for room_id in body["room_ids"]:
-            # TODO in transaction
-            await self.handler.add_account_data_to_room(
-                requester.user.to_string(), room_id, "com.beeper.inbox.done", done
+        room_ids = body.get("room_ids")
+        if not isinstance(room_ids, list) or not all(
+            isinstance(room_id, str) and RoomID.is_valid(room_id)
+            for room_id in room_ids
+        ):
+            raise SynapseError(
+                400, "room_ids must be a list of room IDs", Codes.INVALID_PARAM
             )
 
+        done = {"updated_ts": ts, "at_ts": ts}
+        await self.handler.add_account_data_to_rooms(
+            requester.user.to_string(), room_ids, "com.beeper.inbox.done", done
+        )
+
         return 200, {}
 
 
@@ -20,7 +20,7 @@
 #
 
 import logging
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING, Mapping, Optional, Tuple
 
 from synapse.api.constants import ReceiptTypes
 from synapse.http.server import HttpServer
@@ -46,6 +46,7 @@ class ReadMarkerRestServlet(RestServlet):
         self.config = hs.config
         self.receipts_handler = hs.get_receipts_handler()
         self.read_marker_handler = hs.get_read_marker_handler()
+        self.account_data_handler = hs.get_account_data_handler()
         self.presence_handler = hs.get_presence_handler()
 
         self._known_receipt_types = {
@@ -65,8 +66,15 @@ class ReadMarkerRestServlet(RestServlet):
 
     # Beeper: The endpoint and underlying method are separated here so `inbox_state`
     # can use the same function.
+    #
+    # Any `account_data` given is written for the room in the same transaction as
+    # the fully read marker.
     async def handle_read_marker(
-        self, room_id: str, body: dict, requester: Requester
+        self,
+        room_id: str,
+        body: dict,
+        requester: Requester,
+        account_data: Optional[Mapping[str, JsonDict]] = None,
     ) -> Tuple[int, JsonDict]:
         await self.presence_handler.bump_presence_active_time(
             requester.user, requester.device_id
@@ -94,7 +102,9 @@ class ReadMarkerRestServlet(RestServlet):
                     user_id=requester.user.to_string(),
                     event_id=event_id,
                     extra_content=body.get("com.beeper.fully_read.extra", None),
+                    account_data=account_data,
                 )
+                account_data = None
             else:
                 await self.receipts_handler.received_client_receipt(
                     room_id,
@@ -106,6 +116,11 @@ class ReadMarkerRestServlet(RestServlet):
                     extra_content=body.get("com.beeper.read.extra", None),
                 )
 
+        if account_data:
+            await self.account_data_handler.add_account_data_types_to_room(
+                requester.user.to_string(), room_id, account_data
+            )
+
         return 200, {}
 
 
@@ -0,0 +1,337 @@
+# Beep beep!
+
+"""A connection pool which runs interactions on the reactor, rather than on a
+threadpool.
+
+Each interaction runs in its own greenlet, on a psycopg2 connection in "green"
+mode (see https://www.psycopg.org/docs/advanced.html#support-for-coroutine-libraries).
+Whenever psycopg2 would block waiting for the database, the greenlet switches
+back to the reactor, and is switched back to once the connection's socket is
+ready. This keeps the synchronous `LoggingTransaction` API for interactions,
+without a thread hop for each one or a limit of one running interaction per
+thread.
+
+Interactions run this way must not block on anything other than the database,
+as they hold up the reactor while they run.
+"""
+
+import collections
+import logging
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, cast
+
+import greenlet
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from zope.interface import implementer
+
+from twisted.enterprise.adbapi import ConnectionLost
+from twisted.internet import defer
+from twisted.internet.interfaces import IReactorFDSet, IReadDescriptor, IWriteDescriptor
+from twisted.python.failure import Failure
+
+from synapse.logging.context import current_context, set_current_context
+from synapse.types import ISynapseReactor
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionGreenlet(greenlet.greenlet):  # type: ignore[misc]
+    """A greenlet running an interaction on a connection of an
+    `AsyncConnectionPool`.
+    """
+
+    def __init__(
+        self,
+        pool: "AsyncConnectionPool",
+        conn: Optional["_AsyncConnection"],
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        deferred: "defer.Deferred[Any]",
+    ):
+        super().__init__(parent=pool.main_greenlet)
+        self.pool = pool
+        self.conn = conn
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deferred = deferred
+
+    def run(self) -> Tuple[bool, Any]:
+        """Run the interaction, returning whether it succeeded along with its
+        result or failure.
+        """
+        try:
+            if self.conn is None:
+                self.conn = _AsyncConnection(self.pool)
+            conn = self.conn
+        except BaseException:
+            return False, Failure()
+
+        try:
+            result = self.func(conn, *self.args, **self.kwargs)
+            conn.commit()
+            return True, result
+        except BaseException:
+            failure = Failure()
+            try:
+                conn.rollback()
+            except BaseException:
+                logger.exception("Rollback failed")
+            return False, failure
+
+    def wait(self, native_conn: psycopg2.extensions.connection) -> None:
+        """Wait for psycopg2 to finish talking to the database, switching back
+        to the reactor whenever it would block.
+        """
+        while True:
+            state = native_conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            elif state == psycopg2.extensions.POLL_READ:
+                self._wait_for_fd(native_conn.fileno(), writing=False)
+            elif state == psycopg2.extensions.POLL_WRITE:
+                self._wait_for_fd(native_conn.fileno(), writing=True)
+            else:
+                raise psycopg2.OperationalError("Bad state from poll: %r" % (state,))
+
+    def _wait_for_fd(self, fd: int, writing: bool) -> None:
+        reactor = cast(IReactorFDSet, self.pool.reactor)
+        descriptor = _Descriptor(self, fd)
+        if writing:
+            reactor.addWriter(descriptor)
+        else:
+            reactor.addReader(descriptor)
+
+        # The reactor runs with its own logcontext while we're switched out.
+        context = current_context()
+        try:
+            self.parent.switch()
+        finally:
+            if writing:
+                reactor.removeWriter(descriptor)
+            else:
+                reactor.removeReader(descriptor)
+            set_current_context(context)
+
+
+@implementer(IReadDescriptor, IWriteDescriptor)
+class _Descriptor:
+    """Resumes a greenlet once a connection's socket is ready."""
+
+    def __init__(self, conn_greenlet: _ConnectionGreenlet, fd: int):
+        self._greenlet = conn_greenlet
+        self._fd = fd
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def doRead(self) -> None:
+        self._greenlet.pool.switch_to(self._greenlet)
+
+    def doWrite(self) -> None:
+        self._greenlet.pool.switch_to(self._greenlet)
+
+    def connectionLost(self, reason: Failure) -> None:
+        self._greenlet.pool.switch_to(self._greenlet, reason)
+
+    def logPrefix(self) -> str:
+        return "AsyncConnectionPool"
+
+
+def _wait_callback(native_conn: psycopg2.extensions.connection) -> None:
+    current = greenlet.getcurrent()
+    if isinstance(current, _ConnectionGreenlet):
+        current.wait(native_conn)
+    else:
+        # Connections used from threads just block.
+        psycopg2.extras.wait_select(native_conn)
+
+
+class _AsyncConnection:
+    """A wrapper around a psycopg2 connection, which reconnects if the connection
+    dies, in the same way as `adbapi.Connection`.
+    """
+
+    def __init__(self, pool: "AsyncConnectionPool"):
+        self._pool = pool
+        self._connection: Optional[psycopg2.extensions.connection] = None
+        self.reconnect()
+
+    def close(self) -> None:
+        # Connections are closed by the pool.
+        pass
+
+    def rollback(self) -> None:
+        assert self._connection is not None
+        try:
+            self._connection.rollback()
+            cur = self._connection.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            self._connection.commit()
+            return
+        except BaseException:
+            logger.exception("Rollback failed")
+
+        self.disconnect()
+        raise ConnectionLost()
+
+    def reconnect(self) -> None:
+        self.disconnect()
+        self._connection = self._pool.connect()
+
+    def disconnect(self) -> None:
+        if self._connection is not None:
+            self._pool.disconnect(self._connection)
+            self._connection = None
+
+    @property
+    def closed(self) -> bool:
+        return self._connection is None or bool(self._connection.closed)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+
+class AsyncConnectionPool:
+    """A pool of psycopg2 connections which runs interactions on the reactor.
+
+    Has the parts of the API of `adbapi.ConnectionPool` which `DatabasePool`
+    uses.
+
+    Args:
+        reactor
+        max_connections: The most connections to open at once. Interactions
+            wait for a connection when they are all in use.
+        openfun: Called with each new connection.
+        connkw: The args to connect with.
+    """
+
+    def __init__(
+        self,
+        reactor: ISynapseReactor,
+        max_connections: int,
+        openfun: Callable[[psycopg2.extensions.connection], None],
+        connkw: Dict[str, Any],
+    ):
+        self.reactor = reactor
+        self._max_connections = max_connections
+        self._openfun = openfun
+        self._connkw = connkw
+
+        # Interactions are only started and resumed from the reactor's greenlet.
+        self.main_greenlet = greenlet.getcurrent()
+
+        self._free_connections: Deque[_AsyncConnection] = collections.deque()
+        self._num_connections = 0
+        self._pending: Deque[
+            Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any], defer.Deferred]
+        ] = collections.deque()
+
+        self.running = True
+
+        # This applies to all psycopg2 connections, but connections used from
+        # threads still just block.
+        psycopg2.extensions.set_wait_callback(_wait_callback)
+
+        reactor.addSystemEventTrigger("during", "shutdown", self.close)
+
+    def threadID(self) -> int:
+        """Get an ID for the connection of the running interaction, which
+        `adbapi.ConnectionPool` has one of for each thread.
+        """
+        current = greenlet.getcurrent()
+        assert isinstance(current, _ConnectionGreenlet)
+        return id(current.conn)
+
+    def connect(self) -> psycopg2.extensions.connection:
+        conn = psycopg2.connect(**self._connkw)
+        self._openfun(conn)
+        return conn
+
+    def disconnect(self, conn: psycopg2.extensions.connection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def runWithConnection(
+        self, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> "defer.Deferred[Any]":
+        """Run a function with a connection, in a greenlet on the reactor.
+
+        The connection is committed if the function returns, and rolled back if
+        it raises.
+        """
+        d: "defer.Deferred[Any]" = defer.Deferred()
+        self._pending.append((func, args, kwargs, d))
+        self._start_pending()
+        return d
+
+    def _start_pending(self) -> None:
+        if greenlet.getcurrent() is not self.main_greenlet:
+            # Only the reactor's greenlet can be switched back to while an
+            # interaction waits for the database.
+            self.reactor.callLater(0, self._start_pending)
+            return
+
+        while self._pending and (
+            self._free_connections or self._num_connections < self._max_connections
+        ):
+            func, args, kwargs, d = self._pending.popleft()
+            if self._free_connections:
+                conn: Optional[_AsyncConnection] = self._free_connections.popleft()
+            else:
+                conn = None
+                self._num_connections += 1
+
+            conn_greenlet = _ConnectionGreenlet(self, conn, func, args, kwargs, d)
+            self.switch_to(conn_greenlet)
+
+    def switch_to(
+        self, conn_greenlet: _ConnectionGreenlet, failure: Optional[Failure] = None
+    ) -> None:
+        """Start or resume an interaction, until it next waits for the database
+        or finishes.
+        """
+        assert greenlet.getcurrent() is self.main_greenlet
+
+        context = current_context()
+        try:
+            if failure is not None:
+                outcome = conn_greenlet.throw(failure.value)
+            else:
+                outcome = conn_greenlet.switch()
+        finally:
+            set_current_context(context)
+
+        if conn_greenlet.dead:
+            self._finished(conn_greenlet, outcome)
+
+    def _finished(
+        self, conn_greenlet: _ConnectionGreenlet, outcome: Tuple[bool, Any]
+    ) -> None:
+        conn = conn_greenlet.conn
+        if conn is None or conn.closed or not self.running:
+            self._num_connections -= 1
+            if conn is not None:
+                conn.disconnect()
+        else:
+            self._free_connections.append(conn)
+
+        succeeded, result = outcome
+        if succeeded:
+            conn_greenlet.deferred.callback(result)
+        else:
+            conn_greenlet.deferred.errback(result)
+
+        self._start_pending()
+
+    def close(self) -> None:
+        self.running = False
+        while self._free_connections:
+            conn = self._free_connections.popleft()
+            self._num_connections -= 1
+            conn.disconnect()
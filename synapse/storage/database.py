@@ -19,7 +19,9 @@
 # [This file includes modifications made by New Vector Limited]
 #
 #
+import hashlib
 import inspect
+import io
 import logging
 import time
 import types
@@ -40,9 +42,11 @@ from typing import (
     Tuple,
     Type,
     TypeVar,
+    Union,
     cast,
     overload,
 )
+from weakref import WeakKeyDictionary
 
 import attr
 from prometheus_client import Counter, Histogram
@@ -63,12 +67,23 @@ from synapse.metrics import LaterGauge, register_threadpool
 from synapse.metrics.background_process_metrics import run_as_background_process
 from synapse.storage.background_updates import BackgroundUpdater
 from synapse.storage.engines import BaseDatabaseEngine, PostgresEngine, Sqlite3Engine
+from synapse.storage.profiling import InteractionProfiler, StatementSample
+from synapse.storage.replicas import (
+    REPLICA_SAFE_INTERACTIONS,
+    DatabaseReplica,
+    DatabaseReplicas,
+    replica_routing_counter,
+)
 from synapse.storage.types import Connection, Cursor, SQLQueryParameters
 from synapse.util.async_helpers import delay_cancellation
 from synapse.util.iterutils import batch_iter
 
 if TYPE_CHECKING:
+    import psycopg2.extensions
+
     from synapse.server import HomeServer
+    from synapse.storage.async_pool import AsyncConnectionPool
+    from synapse.types import ISynapseReactor
 
 # python 3 does not have a maximum int value
 MAX_TXN_ID = 2**63 - 1
@@ -85,6 +100,41 @@ sql_query_timer = Histogram("synapse_storage_query_time", "sec", ["verb"])
 sql_txn_count = Counter("synapse_storage_transaction_time_count", "sec", ["desc"])
 sql_txn_duration = Counter("synapse_storage_transaction_time_sum", "sec", ["desc"])
 
+# Per-interaction distributions, with fewer buckets than the default as there are
+# many interactions.
+_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+sql_txn_schedule_time = Histogram(
+    "synapse_storage_transaction_schedule_seconds",
+    "Time spent waiting for a database connection, by interaction",
+    ["desc"],
+    buckets=_TIME_BUCKETS,
+)
+sql_txn_time = Histogram(
+    "synapse_storage_transaction_duration_seconds",
+    "Time spent running transactions, including retries, by interaction",
+    ["desc"],
+    buckets=_TIME_BUCKETS,
+)
+sql_txn_rows = Histogram(
+    "synapse_storage_transaction_rows",
+    "Rows returned or affected by transactions, by interaction. Only affected rows"
+    " are counted on SQLite",
+    ["desc"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+sql_txn_fetched_bytes = Histogram(
+    "synapse_storage_transaction_fetched_bytes",
+    "Approximate bytes of rows fetched by transactions, by interaction. Only"
+    " measured for databases with `profile_interactions` enabled",
+    ["desc"],
+    buckets=(0, 1024, 10240, 102400, 1048576, 10485760, 104857600),
+)
+
+# The fewest rows which `simple_copy_many_txn` inserts with COPY. COPY costs an
+# extra round trip to the database over a multi-row INSERT, so it is only worth
+# it for larger batches.
+COPY_MIN_ROWS = 100
+
 
 # Unique indexes which have been added in background updates. Maps from table name
 # to the name of the background update which added the unique index to that table.
@@ -147,6 +197,35 @@ def make_pool(
     return connection_pool
 
 
+def make_async_pool(
+    reactor: "ISynapseReactor",
+    db_config: DatabaseConnectionConfig,
+    engine: BaseDatabaseEngine,
+) -> "AsyncConnectionPool":
+    """Get a connection pool for the database which runs interactions on the
+    reactor.
+    """
+    # This needs greenlet, so is only imported when used.
+    from synapse.storage.async_pool import AsyncConnectionPool
+
+    def _on_new_connection(conn: Connection) -> None:
+        with LoggingContext("db.on_new_connection"):
+            engine.on_new_connection(
+                LoggingDatabaseConnection(conn, engine, "on_new_connection")
+            )
+
+    return AsyncConnectionPool(
+        reactor,
+        max_connections=db_config.config.get("async_max_connections", 50),
+        openfun=_on_new_connection,
+        connkw={
+            k: v
+            for k, v in db_config.config.get("args", {}).items()
+            if not k.startswith("cp_")
+        },
+    )
+
+
 def make_conn(
     db_config: DatabaseConnectionConfig,
     engine: BaseDatabaseEngine,
@@ -189,6 +268,7 @@ class LoggingDatabaseConnection:
         after_callbacks: Optional[List["_CallbackListEntry"]] = None,
         async_after_callbacks: Optional[List["_AsyncCallbackListEntry"]] = None,
         exception_callbacks: Optional[List["_CallbackListEntry"]] = None,
+        profile: bool = False,
     ) -> "LoggingTransaction":
         if not txn_name:
             txn_name = self.default_txn_name
@@ -200,6 +280,7 @@ class LoggingDatabaseConnection:
             after_callbacks=after_callbacks,
             async_after_callbacks=async_after_callbacks,
             exception_callbacks=exception_callbacks,
+            profile=profile,
         )
 
     def close(self) -> None:
@@ -238,6 +319,52 @@ P = ParamSpec("P")
 R = TypeVar("R")
 
 
+@attr.s(slots=True, auto_attribs=True)
+class _Statement:
+    """A SQL statement, in the forms needed to log and execute it.
+
+    These are cached, as working them out for every execution takes a noticeable
+    amount of CPU, and the same few hundred statements are executed over and
+    over again.
+    """
+
+    # The statement on a single line, for logging.
+    one_line_sql: str
+    # The statement converted to the param style of the database engine.
+    engine_sql: str
+    # The first word of the statement, for metrics.
+    verb: str
+    # A name for the statement, if it is ever prepared on the server. This is
+    # derived from the SQL, so that it stays the same if the statement is
+    # dropped from the cache and cached again.
+    name: str
+    # Whether the statement can be prepared on the server.
+    preparable: bool
+    # How many times the statement has been executed, if counted.
+    executions: int = 0
+
+
+# The statements which can be prepared on the server.
+_PREPARABLE_VERBS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"))
+
+# The most statements to cache for each database engine. Statements built with
+# a varying number of parameters (e.g. by `make_in_list_sql_clause`) mean that
+# there may be an unbounded number of them, so the cache is cleared when full.
+_STATEMENT_CACHE_SIZE = 10000
+
+# Map from database engine to a map from SQL to the cached statement.
+_statement_caches: "WeakKeyDictionary[BaseDatabaseEngine, Dict[str, _Statement]]" = (
+    WeakKeyDictionary()
+)
+
+
+def _get_statement_cache(database_engine: BaseDatabaseEngine) -> Dict[str, _Statement]:
+    statements = _statement_caches.get(database_engine)
+    if statements is None:
+        statements = _statement_caches.setdefault(database_engine, {})
+    return statements
+
+
 class LoggingTransaction:
     """An object that almost-transparently proxies for the 'txn' object
     passed to the constructor. Adds logging and metrics to the .execute()
@@ -259,6 +386,8 @@ class LoggingTransaction:
             to that have been added by `call_on_exception` which should be run
             if transaction ends with an error. None indicates that no callbacks
             should be allowed to be scheduled to run.
+        profile: Whether to measure the bytes of rows fetched, and keep the
+            slowest statement executed, for `InteractionProfiler`.
     """
 
     __slots__ = [
@@ -268,6 +397,12 @@ class LoggingTransaction:
         "after_callbacks",
         "async_after_callbacks",
         "exception_callbacks",
+        "_statements",
+        "_profile",
+        "rows",
+        "statement_count",
+        "fetched_bytes",
+        "slowest_statement",
     ]
 
     def __init__(
@@ -278,6 +413,7 @@ class LoggingTransaction:
         after_callbacks: Optional[List[_CallbackListEntry]] = None,
         async_after_callbacks: Optional[List[_AsyncCallbackListEntry]] = None,
         exception_callbacks: Optional[List[_CallbackListEntry]] = None,
+        profile: bool = False,
     ):
         self.txn = txn
         self.name = name
@@ -286,6 +422,18 @@ class LoggingTransaction:
         self.async_after_callbacks = async_after_callbacks
         self.exception_callbacks = exception_callbacks
 
+        self._statements = _get_statement_cache(database_engine)
+
+        # The rows returned or affected by the statements executed, which on
+        # sqlite is only those affected.
+        self.rows = 0
+        self.statement_count = 0
+
+        self._profile = profile
+        # Roughly how many bytes of rows have been fetched, if profiling.
+        self.fetched_bytes = 0
+        self.slowest_statement: Optional[StatementSample] = None
+
     def call_after(
         self, callback: Callable[P, object], *args: P.args, **kwargs: P.kwargs
     ) -> None:
@@ -347,17 +495,33 @@ class LoggingTransaction:
         self.exception_callbacks.append((callback, args, kwargs))
 
     def fetchone(self) -> Optional[Tuple]:
-        return self.txn.fetchone()
+        row = self.txn.fetchone()
+        if self._profile and row is not None:
+            self.fetched_bytes += _approximate_size(row)
+        return row
 
     def fetchmany(self, size: Optional[int] = None) -> List[Tuple]:
-        return self.txn.fetchmany(size=size)
+        rows = self.txn.fetchmany(size=size)
+        if self._profile:
+            self.fetched_bytes += sum(_approximate_size(row) for row in rows)
+        return rows
 
     def fetchall(self) -> List[Tuple]:
-        return self.txn.fetchall()
+        rows = self.txn.fetchall()
+        if self._profile:
+            self.fetched_bytes += sum(_approximate_size(row) for row in rows)
+        return rows
 
     def __iter__(self) -> Iterator[Tuple]:
+        if self._profile:
+            return self._iter_profiled()
         return self.txn.__iter__()
 
+    def _iter_profiled(self) -> Iterator[Tuple]:
+        for row in self.txn:
+            self.fetched_bytes += _approximate_size(row)
+            yield row
+
     @property
     def rowcount(self) -> int:
         return self.txn.rowcount
@@ -421,9 +585,63 @@ class LoggingTransaction:
             values,
         )
 
+    def copy_from(self, table: str, keys: Iterable[str], data: str) -> None:
+        """Insert rows into a table with `COPY ... FROM STDIN`. Only available
+        when using postgres.
+
+        Args:
+            table: The table to insert into.
+            keys: The columns to insert.
+            data: The rows, in the text format of COPY.
+        """
+        assert isinstance(self.database_engine, PostgresEngine)
+        cursor = cast("psycopg2.extensions.cursor", self.txn)
+
+        sql = "COPY %s (%s) FROM STDIN" % (table, ", ".join(keys))
+        self._do_execute(
+            lambda the_sql: cursor.copy_expert(the_sql, io.StringIO(data)), sql
+        )
+
     def execute(self, sql: str, parameters: SQLQueryParameters = ()) -> None:
+        engine = self.database_engine
+        if (
+            isinstance(engine, PostgresEngine)
+            and engine.prepared_statement_threshold is not None
+            and isinstance(parameters, (list, tuple))
+        ):
+            statement = self._get_statement(sql)
+            statement.executions += 1
+            if (
+                statement.preparable
+                and statement.executions > engine.prepared_statement_threshold
+            ):
+                self._do_execute(
+                    self._execute_prepared, sql, parameters, engine, statement
+                )
+                return
+
         self._do_execute(self.txn.execute, sql, parameters)
 
+    def _execute_prepared(
+        self,
+        sql: str,
+        parameters: Sequence[Any],
+        engine: PostgresEngine,
+        statement: _Statement,
+    ) -> None:
+        """Execute a statement as a server-side prepared statement, or as a
+        normal statement if it can't be prepared.
+        """
+        if not engine.execute_prepared(
+            cast("psycopg2.extensions.cursor", self.txn),
+            statement.name,
+            statement.engine_sql,
+            parameters,
+        ):
+            logger.info("Unable to prepare statement: %s", statement.one_line_sql)
+            statement.preparable = False
+            self.txn.execute(sql, parameters)
+
     def executemany(self, sql: str, *args: Any) -> None:
         """Repeatedly execute the same piece of SQL with different parameters.
 
@@ -453,6 +671,25 @@ class LoggingTransaction:
         "Strip newlines out of SQL so that the loggers in the DB are on one line"
         return " ".join(line.strip() for line in sql.splitlines() if line.strip())
 
+    def _get_statement(self, sql: str) -> _Statement:
+        statement = self._statements.get(sql)
+        if statement is None:
+            if len(self._statements) >= _STATEMENT_CACHE_SIZE:
+                self._statements.clear()
+
+            one_line_sql = self._make_sql_one_line(sql)
+            verb = sql.split()[0]
+            statement = _Statement(
+                one_line_sql=one_line_sql,
+                engine_sql=self.database_engine.convert_param_style(sql),
+                verb=verb,
+                name="synapse_"
+                + hashlib.blake2b(sql.encode("utf-8"), digest_size=16).hexdigest(),
+                preparable=verb.upper() in _PREPARABLE_VERBS and "%" not in sql,
+            )
+            self._statements[sql] = statement
+        return statement
+
     def _do_execute(
         self,
         func: Callable[Concatenate[str, P], R],
@@ -460,13 +697,16 @@ class LoggingTransaction:
         *args: P.args,
         **kwargs: P.kwargs,
     ) -> R:
-        # Generate a one-line version of the SQL to better log it.
-        one_line_sql = self._make_sql_one_line(sql)
+        # Look up the one-line version of the SQL to better log it, and the SQL
+        # converted for the database engine.
+        statement = self._get_statement(sql)
+        one_line_sql = statement.one_line_sql
 
         # TODO(paul): Maybe use 'info' and 'debug' for values?
         sql_logger.debug("[SQL] {%s} %s", self.name, one_line_sql)
 
-        sql = self.database_engine.convert_param_style(sql)
+        original_sql = sql
+        sql = statement.engine_sql
         if args:
             try:
                 sql_logger.debug("[SQL values] {%s} %r", self.name, args[0])
@@ -484,14 +724,36 @@ class LoggingTransaction:
                     opentracing.tags.DATABASE_STATEMENT: one_line_sql,
                 },
             ):
-                return func(sql, *args, **kwargs)
+                result = func(sql, *args, **kwargs)
+            rowcount = self.txn.rowcount
+            if rowcount > 0:
+                self.rows += rowcount
+            return result
         except Exception as e:
             sql_logger.debug("[SQL FAIL] {%s} %s", self.name, e)
             raise
         finally:
             secs = time.time() - start
             sql_logger.debug("[SQL time] {%s} %f sec", self.name, secs)
-            sql_query_timer.labels(sql.split()[0]).observe(secs)
+            sql_query_timer.labels(statement.verb).observe(secs)
+
+            self.statement_count += 1
+            if self._profile and (
+                self.slowest_statement is None or secs > self.slowest_statement.duration
+            ):
+                # Only statements executed on their own with a single set of
+                # parameters can be EXPLAINed with them.
+                single = cast(object, func) in (
+                    self.txn.execute,
+                    self._execute_prepared,
+                )
+                self.slowest_statement = StatementSample(
+                    sql=original_sql,
+                    one_line_sql=one_line_sql,
+                    params=args[0] if args else (),
+                    duration=secs,
+                    explainable=single and statement.verb.upper() in _PREPARABLE_VERBS,
+                )
 
     def close(self) -> None:
         self.txn.close()
@@ -508,6 +770,17 @@ class LoggingTransaction:
         self.close()
 
 
+def _approximate_size(row: Tuple) -> int:
+    """Roughly how many bytes a row took to fetch from the database."""
+    size = 0
+    for value in row:
+        if isinstance(value, (str, bytes, memoryview)):
+            size += len(value)
+        elif value is not None:
+            size += 8
+    return size
+
+
 class PerformanceCounters:
     def __init__(self) -> None:
         self.current_counters: Dict[str, Tuple[int, float]] = {}
@@ -542,6 +815,15 @@ class PerformanceCounters:
 
         return top_n_counters
 
+    def busiest(self, limit: int) -> List[Tuple[str, int, float]]:
+        """Get the keys with the most time spent on them in total, along with
+        their count and total time, busiest first.
+        """
+        counters = sorted(
+            self.current_counters.items(), key=lambda item: item[1][1], reverse=True
+        )
+        return [(name, count, cum_time) for name, (count, cum_time) in counters[:limit]]
+
 
 class DatabasePool:
     """Wraps a single physical database and connection pool.
@@ -563,6 +845,25 @@ class DatabasePool:
         self._txn_limit = database_config.config.get("txn_limit", 0)
         self._database_config = database_config
         self._db_pool = make_pool(hs.get_reactor(), database_config, engine)
+        # Interactions run on the reactor rather than on threads, if configured.
+        self._async_pool: Optional["AsyncConnectionPool"] = None
+        if database_config.config.get("async_interactions", False):
+            self._async_pool = make_async_pool(
+                hs.get_reactor(), database_config, engine
+            )
+        self.replicas = DatabaseReplicas(
+            hs,
+            self,
+            [
+                DatabaseReplica(
+                    replica_config.name,
+                    make_pool(hs.get_reactor(), replica_config, engine),
+                )
+                for replica_config in database_config.replicas
+            ],
+            max_lag_ms=database_config.replica_max_lag_ms,
+            poll_interval_ms=database_config.replica_poll_interval_ms,
+        )
 
         self.updates = BackgroundUpdater(hs, self)
         LaterGauge(
@@ -586,6 +887,13 @@ class DatabasePool:
 
         self.engine = engine
 
+        # Keeps samples of the slowest interactions, if configured.
+        self.profiler: Optional[InteractionProfiler] = None
+        if database_config.profile_interactions:
+            self.profiler = InteractionProfiler(
+                hs, self, database_config.explain_threshold_ms
+            )
+
         # A set of tables that are not safe to use native upserts in.
         self._unsafe_to_upsert_tables = set(UNIQUE_INDEX_BACKGROUND_UPDATES.keys())
 
@@ -668,6 +976,13 @@ class DatabasePool:
 
         self._clock.looping_call(loop, 10000)
 
+    def get_busiest_interactions(self, limit: int) -> List[Tuple[str, int, float]]:
+        """Get the interactions which have spent the most time in transactions
+        in total, along with their count and total time in seconds, busiest
+        first.
+        """
+        return self._txn_perf_counters.busiest(limit)
+
     def new_transaction(
         self,
         conn: LoggingDatabaseConnection,
@@ -758,6 +1073,13 @@ class DatabasePool:
 
         transaction_logger.debug("[TXN START] {%s}", name)
 
+        # Totals over all attempts at the transaction.
+        profiler = self.profiler
+        rows = 0
+        statement_count = 0
+        fetched_bytes = 0
+        slowest_statement: Optional[StatementSample] = None
+
         try:
             i = 0
             N = 5
@@ -767,6 +1089,7 @@ class DatabasePool:
                     after_callbacks=after_callbacks,
                     async_after_callbacks=async_after_callbacks,
                     exception_callbacks=exception_callbacks,
+                    profile=profiler is not None,
                 )
                 try:
                     with opentracing.start_active_span(
@@ -851,6 +1174,16 @@ class DatabasePool:
                     # [1]: https://github.com/python/cpython/blob/v3.8.0/Modules/_sqlite/connection.c#L465
                     # [2]: https://github.com/python/cpython/blob/v3.8.0/Modules/_sqlite/cursor.c#L236
                     cursor.close()
+
+                    rows += cursor.rows
+                    statement_count += cursor.statement_count
+                    fetched_bytes += cursor.fetched_bytes
+                    if cursor.slowest_statement is not None and (
+                        slowest_statement is None
+                        or cursor.slowest_statement.duration
+                        > slowest_statement.duration
+                    ):
+                        slowest_statement = cursor.slowest_statement
         except Exception as e:
             transaction_logger.debug("[TXN FAIL] {%s} %s", name, e)
             raise
@@ -866,6 +1199,19 @@ class DatabasePool:
             self._txn_perf_counters.update(desc, duration)
             sql_txn_count.labels(desc).inc(1)
             sql_txn_duration.labels(desc).inc(duration)
+            sql_txn_time.labels(desc).observe(duration)
+            sql_txn_rows.labels(desc).observe(rows)
+
+            if profiler is not None:
+                sql_txn_fetched_bytes.labels(desc).observe(fetched_bytes)
+                profiler.record(
+                    desc,
+                    duration,
+                    rows,
+                    fetched_bytes,
+                    statement_count,
+                    slowest_statement,
+                )
 
     async def runInteraction(
         self,
@@ -874,6 +1220,7 @@ class DatabasePool:
         *args: Any,
         db_autocommit: bool = False,
         isolation_level: Optional[int] = None,
+        replica_streams: Optional[Collection[str]] = None,
         **kwargs: Any,
     ) -> R:
         """Starts a transaction on the database and runs a given function
@@ -897,6 +1244,11 @@ class DatabasePool:
                 correctly handle that case.
 
             isolation_level: Set the server isolation level for this transaction.
+            replica_streams: If given, `func` only reads from the database and
+                may run on a read replica which has caught up with these
+                streams, falling back to the database if there is none. If not
+                given, whether `func` may run on a replica is taken from the
+                store method marked with `replica_safe` for `desc`, if any.
             args: positional args to pass to `func`
             kwargs: named args to pass to `func`
 
@@ -904,6 +1256,15 @@ class DatabasePool:
             The result of func
         """
 
+        if replica_streams is None:
+            replica_streams = REPLICA_SAFE_INTERACTIONS.get(desc)
+        replica = None
+        if replica_streams is not None and self.replicas.replicas:
+            replica = self.replicas.get_replica(replica_streams)
+            replica_routing_counter.labels(
+                desc, "primary" if replica is None else "replica"
+            ).inc()
+
         async def _runInteraction() -> R:
             after_callbacks: List[_CallbackListEntry] = []
             async_after_callbacks: List[_AsyncCallbackListEntry] = []
@@ -912,21 +1273,44 @@ class DatabasePool:
             if not current_context():
                 logger.warning("Starting db txn '%s' from sentinel context", desc)
 
+            async def run(replica: Optional[DatabaseReplica]) -> R:
+                return await self.runWithConnection(
+                    # mypy seems to have an issue with this, maybe a bug?
+                    self.new_transaction,  # type: ignore[arg-type]
+                    desc,
+                    after_callbacks,
+                    async_after_callbacks,
+                    exception_callbacks,
+                    func,
+                    *args,
+                    db_autocommit=db_autocommit,
+                    isolation_level=isolation_level,
+                    replica=replica,
+                    on_reactor=True,
+                    txn_desc=desc,
+                    **kwargs,
+                )
+
             try:
                 with opentracing.start_active_span(f"db.{desc}"):
-                    result = await self.runWithConnection(
-                        # mypy seems to have an issue with this, maybe a bug?
-                        self.new_transaction,  # type: ignore[arg-type]
-                        desc,
-                        after_callbacks,
-                        async_after_callbacks,
-                        exception_callbacks,
-                        func,
-                        *args,
-                        db_autocommit=db_autocommit,
-                        isolation_level=isolation_level,
-                        **kwargs,
-                    )
+                    if replica is None:
+                        result = await run(None)
+                    else:
+                        try:
+                            result = await run(replica)
+                        except self.engine.module.OperationalError as e:
+                            logger.warning(
+                                "Failed to run %s on read replica %s, falling back"
+                                " to the database: %s",
+                                desc,
+                                replica.name,
+                                e,
+                            )
+                            replica_routing_counter.labels(desc, "fallback").inc()
+                            after_callbacks.clear()
+                            async_after_callbacks.clear()
+                            exception_callbacks.clear()
+                            result = await run(None)
 
                 # We order these assuming that async functions call out to external
                 # systems (e.g. to invalidate a cache) and the sync functions make these
@@ -935,7 +1319,7 @@ class DatabasePool:
                     await async_callback(*async_args, **async_kwargs)
                 for after_callback, after_args, after_kwargs in after_callbacks:
                     after_callback(*after_args, **after_kwargs)
-                return cast(R, result)
+                return result
             except Exception:
                 for exception_callback, after_args, after_kwargs in exception_callbacks:
                     exception_callback(*after_args, **after_kwargs)
@@ -956,6 +1340,9 @@ class DatabasePool:
         *args: Any,
         db_autocommit: bool = False,
         isolation_level: Optional[int] = None,
+        replica: Optional[DatabaseReplica] = None,
+        on_reactor: bool = False,
+        txn_desc: Optional[str] = None,
         **kwargs: Any,
     ) -> R:
         """Wraps the .runWithConnection() method on the underlying db_pool.
@@ -969,6 +1356,13 @@ class DatabasePool:
                 i.e. outside of a transaction. This is useful for transaction
                 that are only a single query. Currently only affects postgres.
             isolation_level: Set the server isolation level for this transaction.
+            replica: The read replica to run `func` on, rather than the
+                database.
+            on_reactor: Whether `func` may run on the reactor, if the database
+                is configured to run interactions there. `func` must not block
+                on anything but the database if so.
+            txn_desc: The description of the transaction `func` runs, if any,
+                for metrics.
             kwargs: named args to pass to `func`
 
         Returns:
@@ -984,6 +1378,14 @@ class DatabasePool:
             assert isinstance(curr_context, LoggingContext)
             parent_context = curr_context
 
+        db_pool: Union[adbapi.ConnectionPool, "AsyncConnectionPool"]
+        if replica is not None:
+            db_pool = replica.pool
+        elif on_reactor and self._async_pool is not None:
+            db_pool = self._async_pool
+        else:
+            db_pool = self._db_pool
+
         start_time = monotonic_time()
 
         def inner_func(conn: _PoolConnection, *args: P.args, **kwargs: P.kwargs) -> R:
@@ -1002,10 +1404,14 @@ class DatabasePool:
                 ):
                     sched_duration_sec = monotonic_time() - start_time
                     sql_scheduling_timer.observe(sched_duration_sec)
+                    if txn_desc is not None:
+                        sql_txn_schedule_time.labels(txn_desc).observe(
+                            sched_duration_sec
+                        )
                     context.add_database_scheduled(sched_duration_sec)
 
                     if self._txn_limit > 0:
-                        tid = self._db_pool.threadID()
+                        tid = db_pool.threadID()
                         self._txn_counters[tid] += 1
 
                         if self._txn_counters[tid] > self._txn_limit:
@@ -1044,16 +1450,24 @@ class DatabasePool:
                             self.engine.attempt_to_set_isolation_level(conn, None)
 
         return await make_deferred_yieldable(
-            self._db_pool.runWithConnection(inner_func, *args, **kwargs)
+            db_pool.runWithConnection(inner_func, *args, **kwargs)
         )
 
-    async def execute(self, desc: str, query: str, *args: Any) -> List[Tuple[Any, ...]]:
+    async def execute(
+        self,
+        desc: str,
+        query: str,
+        *args: Any,
+        replica_streams: Optional[Collection[str]] = None,
+    ) -> List[Tuple[Any, ...]]:
         """Runs a single query for a result set.
 
         Args:
             desc: description of the transaction, for logging and metrics
             query - The query string to execute
             *args - Query args.
+            replica_streams: The streams the query depends on, if it may run on
+                a read replica. See `runInteraction`.
         Returns:
             The result of decoder(results)
         """
@@ -1062,7 +1476,9 @@ class DatabasePool:
             txn.execute(query, args)
             return txn.fetchall()
 
-        return await self.runInteraction(desc, interaction)
+        return await self.runInteraction(
+            desc, interaction, replica_streams=replica_streams
+        )
 
     # "Simple" SQL API methods that operate on a single table with no JOINs,
     # no complex WHERE clauses, just a dict of values for columns.
@@ -1158,6 +1574,43 @@ class DatabasePool:
 
             txn.execute_batch(sql, values)
 
+    @staticmethod
+    def simple_copy_many_txn(
+        txn: LoggingTransaction,
+        table: str,
+        keys: Sequence[str],
+        values: Collection[Iterable[Any]],
+    ) -> None:
+        """Executes an INSERT query on the named table, in the same way as
+        `simple_insert_many_txn` but faster for a large number of rows.
+
+        On postgres, at least `COPY_MIN_ROWS` rows are sent with
+        `COPY ... FROM STDIN`. Otherwise, or if the rows can't be sent that way,
+        this falls back to `simple_insert_many_txn`.
+
+        Args:
+            txn: The transaction to use.
+            table: string giving the table name
+            keys: list of column names
+            values: for each row, a list of values in the same order as `keys`
+        """
+        # If there's nothing to insert, then skip executing the query.
+        if not values:
+            return
+
+        engine = txn.database_engine
+        if (
+            len(values) >= COPY_MIN_ROWS
+            and isinstance(engine, PostgresEngine)
+            and engine.supports_copy
+        ):
+            data = engine.encode_copy_rows(values)
+            if data is not None:
+                txn.copy_from(table, keys, data)
+                return
+
+        DatabasePool.simple_insert_many_txn(txn, table, keys, values)
+
     async def simple_upsert(
         self,
         table: str,
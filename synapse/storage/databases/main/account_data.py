@@ -24,6 +24,7 @@ import re
 from typing import (
     TYPE_CHECKING,
     Any,
+    Collection,
     Dict,
     FrozenSet,
     Iterable,
@@ -53,7 +54,7 @@ from synapse.storage.util.id_generators import (
 from synapse.types import JsonDict, JsonMapping
 from synapse.util import json_encoder
 from synapse.util.caches.descriptors import cached
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -113,8 +114,8 @@ class AccountDataWorkerStore(PushRulesWorkerStore, CacheInvalidationWorkerStore)
             )
 
         account_max = self.get_max_account_data_stream_id()
-        self._account_data_stream_cache = StreamChangeCache(
-            "AccountDataAndTagsChangeCache", account_max
+        self._account_data_stream_cache = create_stream_change_cache(
+            hs, "AccountDataAndTagsChangeCache", account_max
         )
 
         self.db_pool.updates.register_background_index_update(
@@ -600,6 +601,107 @@ class AccountDataWorkerStore(PushRulesWorkerStore, CacheInvalidationWorkerStore)
 
         return self._account_data_id_gen.get_current_token()
 
+    async def add_account_data_to_rooms(
+        self,
+        user_id: str,
+        room_ids: Collection[str],
+        account_data_type: str,
+        content: JsonDict,
+    ) -> int:
+        """Add the same account_data to many rooms for a user, in a single
+        transaction.
+
+        Args:
+            user_id: The user to add the account_data for.
+            room_ids: The rooms to add the account_data to.
+            account_data_type: The type of account_data to add.
+            content: A json object to associate with the account_data.
+
+        Returns:
+            The maximum stream ID.
+        """
+        assert self._can_write_to_account_data
+
+        # Each room may only appear once in a batch upsert.
+        room_ids = list(dict.fromkeys(room_ids))
+        if not room_ids:
+            return self._account_data_id_gen.get_current_token()
+
+        content_json = json_encoder.encode(content)
+
+        async with self._account_data_id_gen.get_next_mult(len(room_ids)) as next_ids:
+            await self.db_pool.simple_upsert_many(
+                table="room_account_data",
+                key_names=("user_id", "room_id", "account_data_type"),
+                key_values=[
+                    (user_id, room_id, account_data_type) for room_id in room_ids
+                ],
+                value_names=("stream_id", "content"),
+                value_values=[(next_id, content_json) for next_id in next_ids],
+                desc="add_account_data_to_rooms",
+            )
+
+            self._account_data_stream_cache.entity_has_changed(user_id, next_ids[-1])
+            self.get_room_account_data_for_user.invalidate((user_id,))
+            for room_id in room_ids:
+                self.get_account_data_for_room.invalidate((user_id, room_id))
+                self.get_account_data_for_room_and_type.prefill(
+                    (user_id, room_id, account_data_type), content
+                )
+
+        return self._account_data_id_gen.get_current_token()
+
+    async def add_account_data_types_to_room(
+        self,
+        user_id: str,
+        room_id: str,
+        account_data: Mapping[str, JsonDict],
+    ) -> int:
+        """Add several types of account_data to a room for a user, in a single
+        transaction.
+
+        Args:
+            user_id: The user to add the account_data for.
+            room_id: The room to add the account_data to.
+            account_data: A map of account_data type to the json object to
+                associate with it.
+
+        Returns:
+            The maximum stream ID.
+        """
+        assert self._can_write_to_account_data
+
+        if not account_data:
+            return self._account_data_id_gen.get_current_token()
+
+        async with self._account_data_id_gen.get_next_mult(
+            len(account_data)
+        ) as next_ids:
+            await self.db_pool.simple_upsert_many(
+                table="room_account_data",
+                key_names=("user_id", "room_id", "account_data_type"),
+                key_values=[
+                    (user_id, room_id, account_data_type)
+                    for account_data_type in account_data
+                ],
+                value_names=("stream_id", "content"),
+                value_values=[
+                    (next_id, json_encoder.encode(content))
+                    for next_id, content in zip(next_ids, account_data.values())
+                ],
+                desc="add_account_data_types_to_room",
+            )
+
+            self._account_data_stream_cache.entity_has_changed(user_id, next_ids[-1])
+            self.get_room_account_data_for_user.invalidate((user_id,))
+            self.get_account_data_for_room.invalidate((user_id, room_id))
+            for account_data_type, content in account_data.items():
+                self.get_account_data_for_room_and_type.prefill(
+                    (user_id, room_id, account_data_type), content
+                )
+
+        return self._account_data_id_gen.get_current_token()
+
     async def remove_account_data_for_room(
         self, user_id: str, room_id: str, account_data_type: str
     ) -> int:
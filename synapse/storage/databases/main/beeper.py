@@ -1,23 +1,90 @@
 # Beep beep!
 
 import logging
-from typing import TYPE_CHECKING, List, Optional, Tuple, cast
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Collection,
+    Deque,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    cast,
+)
+
+from prometheus_client import Gauge
 
-from synapse.events import EventBase
+from synapse.api.constants import EventTypes, Membership, RelationTypes
+from synapse.events import EventBase, relation_from_event
 from synapse.metrics.background_process_metrics import wrap_as_background_process
 from synapse.storage._base import SQLBaseStore
 from synapse.storage.database import (
     DatabasePool,
     LoggingDatabaseConnection,
     LoggingTransaction,
+    make_in_list_sql_clause,
+    make_tuple_comparison_clause,
+    make_tuple_in_list_sql_clause,
 )
-from synapse.types import RoomStreamToken
+from synapse.storage.engines import PostgresEngine
+from synapse.types import JsonDict, RoomStreamToken
+from synapse.util import json_decoder
+from synapse.util.caches.descriptors import cached, cachedList
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
+from synapse.util.caches.treecache import TreeCache
+from synapse.util.iterutils import batch_iter
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
 
 logger = logging.getLogger(__name__)
 
+# Event types which can be the room preview for everyone in the room. Reactions
+# are only ever the preview for the sender of the event they react to.
+BEEPER_PREVIEW_EVENT_TYPES = (
+    EventTypes.Message,
+    EventTypes.Encrypted,
+    "m.sticker",
+)
+
+# Event types which may change the preview of a room when they are persisted.
+BEEPER_PREVIEW_INVALIDATING_EVENT_TYPES = BEEPER_PREVIEW_EVENT_TYPES + (
+    EventTypes.Redaction,
+    EventTypes.Reaction,
+)
+
+# How long to wait before aggregating the notification counts for an event, to
+# avoid serialization failures with receipts clearing the counts of recent events.
+NOTIFICATION_COUNTS_AGGREGATION_DELAY_MS = 60 * 60 * 1000
+
+# The number of (user, room) partitions of notification counts to aggregate in
+# each transaction.
+NOTIFICATION_COUNTS_AGGREGATION_BATCH_SIZE = 1000
+
+# How often to re-run the background update pruning the notification counts of
+# users who have left rooms or been deactivated, and of tombstoned rooms.
+NOTIFICATION_COUNTS_PRUNE_INTERVAL_MS = 24 * 60 * 60 * 1000
+
+notification_counts_backlog_gauge = Gauge(
+    "synapse_beeper_notification_counts_aggregation_backlog",
+    "Number of notification count rows after the aggregation watermark, estimated"
+    " on postgres",
+)
+
+notification_counts_aggregated_rate_gauge = Gauge(
+    "synapse_beeper_notification_counts_aggregated_rows_per_second",
+    "Rate at which notification count rows were aggregated in the last pass",
+)
+
+notification_counts_lag_gauge = Gauge(
+    "synapse_beeper_notification_counts_aggregation_lag",
+    "Number of events stream positions the notification counts aggregation is behind",
+)
+
 
 class BeeperStore(SQLBaseStore):
     def __init__(
@@ -42,80 +109,774 @@ class BeeperStore(SQLBaseStore):
                 self.beeper_aggregate_notification_counts, 30 * 1000
             )
             self.is_aggregating_notification_counts = False
+            self._clock.looping_call(
+                self.beeper_schedule_notification_counts_prune,
+                NOTIFICATION_COUNTS_PRUNE_INTERVAL_MS,
+            )
+
+        # Samples of (timestamp, events stream position), oldest first, used to
+        # work out how far notification counts can be aggregated.
+        self._notification_counts_positions: Deque[Tuple[int, int]] = deque()
+        self._notification_counts_initial_upper_bound: Optional[int] = None
+        # The stream ordering up to which notification counts have been aggregated.
+        self._notification_counts_watermark = 0
+
+        self.db_pool.updates.register_background_index_update(
+            update_name="beeper_user_notification_counts_stream_ordering_idx",
+            index_name="beeper_user_notification_counts_stream_ordering_idx",
+            table="beeper_user_notification_counts",
+            columns=("event_stream_ordering",),
+        )
+
+        # Whether the materialized preview tables have been fully populated, see
+        # `_beeper_have_materialized_previews`.
+        self._beeper_previews_populated = False
+
+        # Map from (room ID, user ID) to the events stream position a preview was
+        # computed at and the preview. Entries are only used while the room has
+        # no preview-changing events after that position, according to
+        # `_beeper_preview_stream_cache`.
+        self._beeper_preview_cache: LruCache[
+            Tuple[str, str], Tuple[int, Optional[Tuple[str, int]]]
+        ] = LruCache(
+            max_size=50000,
+            cache_name="beeper_preview_cache",
+            cache_type=TreeCache,
+        )
+
+        # The stores which track the events stream position are initialised
+        # after this one, so look it up directly.
+        cur = db_conn.cursor(txn_name="beeper_get_max_stream_ordering")
+        cur.execute("SELECT COALESCE(MAX(stream_ordering), 0) FROM events")
+        (max_stream_ordering,) = cast(Tuple[int], cur.fetchone())
+        cur.close()
+
+        self._beeper_preview_stream_cache = create_stream_change_cache(
+            hs, "BeeperPreviewStreamChangeCache", max_stream_ordering
+        )
+
+        self.db_pool.updates.register_background_update_handler(
+            "beeper_room_previews_populate",
+            self._beeper_room_previews_populate,
+        )
+
+        # Indexes for finding the latest message or reaction in a room before a
+        # given stream ordering, see `_beeper_compute_preview_txn`.
+        self.db_pool.updates.register_background_index_update(
+            update_name="beeper_events_preview_idx",
+            index_name="beeper_events_preview_idx",
+            table="events",
+            columns=("room_id", "stream_ordering"),
+            where_clause="type IN ('m.room.message', 'm.room.encrypted', 'm.sticker')",
+        )
+        self.db_pool.updates.register_background_index_update(
+            update_name="beeper_events_reaction_idx",
+            index_name="beeper_events_reaction_idx",
+            table="events",
+            columns=("room_id", "stream_ordering"),
+            where_clause="type = 'm.reaction'",
+        )
+
+        self.db_pool.updates.register_background_update_handler(
+            "beeper_user_notification_counts_prune",
+            self._beeper_user_notification_counts_prune,
+        )
 
     async def beeper_preview_event_for_room_id_and_user_id(
         self, room_id: str, user_id: str, to_key: RoomStreamToken
     ) -> Optional[Tuple[str, int]]:
+        """Get the preview event for a room, as seen by the given user.
+
+        Returns:
+            The ID of the preview event (or of its latest edit, if it has been
+            edited) and the origin server timestamp of the preview event, or None
+            if the room has nothing to preview.
+        """
+        cached = self._beeper_get_cached_preview(room_id, user_id, to_key)
+        if cached is not None:
+            return cached[1]
+
+        use_materialized = await self._beeper_have_materialized_previews()
+
         def beeper_preview_txn(txn: LoggingTransaction) -> Optional[Tuple[str, int]]:
-            sql = """
-            WITH latest_event AS (
-                SELECT e.event_id, e.origin_server_ts
-                FROM events AS e
-                LEFT JOIN redactions as r
-                    ON e.event_id = r.redacts
-                -- Look to see if this event itself is an edit, as we don't want to
-                -- use edits ever as the "latest event"
-                LEFT JOIN event_relations as is_edit
-                    ON e.event_id = is_edit.event_id AND is_edit.relation_type = 'm.replace'
-                WHERE
-                    e.stream_ordering <= ?
-                    AND e.room_id = ?
-                    AND is_edit.event_id IS NULL
-                    AND r.redacts IS NULL
-                    AND e.type IN (
-                        'm.room.message',
-                        'm.room.encrypted',
-                        'm.reaction',
-                        'm.sticker'
+            if not use_materialized:
+                return self._beeper_compute_preview_txn(
+                    txn, room_id, user_id, to_key.stream
+                )
+
+            previews = self._beeper_get_previews_txn(txn, [room_id], user_id, to_key)
+            return previews[room_id]
+
+        preview = await self.db_pool.runInteraction(
+            "beeper_preview_for_room_id_and_user_id",
+            beeper_preview_txn,
+        )
+        self._beeper_preview_cache[(room_id, user_id)] = (to_key.stream, preview)
+        return preview
+
+    async def beeper_preview_events_for_room_ids_and_user_id(
+        self, room_ids: Collection[str], user_id: str, to_key: RoomStreamToken
+    ) -> Mapping[str, Optional[Tuple[str, int]]]:
+        """Bulk version of `beeper_preview_event_for_room_id_and_user_id`.
+
+        Returns:
+            A map from room ID to its preview, as returned by
+            `beeper_preview_event_for_room_id_and_user_id`.
+        """
+        results: Dict[str, Optional[Tuple[str, int]]] = {}
+        missing_room_ids = []
+        for room_id in room_ids:
+            cached = self._beeper_get_cached_preview(room_id, user_id, to_key)
+            if cached is not None:
+                results[room_id] = cached[1]
+            else:
+                missing_room_ids.append(room_id)
+
+        if not missing_room_ids:
+            return results
+
+        use_materialized = await self._beeper_have_materialized_previews()
+
+        def beeper_previews_txn(
+            txn: LoggingTransaction,
+        ) -> Dict[str, Optional[Tuple[str, int]]]:
+            previews: Dict[str, Optional[Tuple[str, int]]] = {}
+
+            if not use_materialized:
+                for room_id in missing_room_ids:
+                    previews[room_id] = self._beeper_compute_preview_txn(
+                        txn, room_id, user_id, to_key.stream
                     )
-                    AND CASE
-                        -- Only find non-redacted reactions to our own messages
-                        WHEN (e.type = 'm.reaction') THEN (
-                            SELECT ? = ee.sender AND ee.event_id NOT IN (
-                                SELECT redacts FROM redactions WHERE redacts = ee.event_id
-                            ) FROM events as ee
-                            WHERE ee.event_id = (
-                                SELECT eer.relates_to_id FROM event_relations AS eer
-                                WHERE eer.event_id = e.event_id
-                            )
+                return previews
+
+            for batch in batch_iter(missing_room_ids, 500):
+                previews.update(
+                    self._beeper_get_previews_txn(txn, batch, user_id, to_key)
+                )
+            return previews
+
+        previews = await self.db_pool.runInteraction(
+            "beeper_previews_for_room_ids_and_user_id",
+            beeper_previews_txn,
+        )
+        for room_id, preview in previews.items():
+            self._beeper_preview_cache[(room_id, user_id)] = (to_key.stream, preview)
+
+        results.update(previews)
+        return results
+
+    def _beeper_get_cached_preview(
+        self, room_id: str, user_id: str, to_key: RoomStreamToken
+    ) -> Optional[Tuple[int, Optional[Tuple[str, int]]]]:
+        """Get the entry for a room in `_beeper_preview_cache`, if it is still
+        valid at `to_key`.
+
+        Returns:
+            The stream position the preview was cached at and the preview, or
+            None if there is no valid entry.
+        """
+        entry = self._beeper_preview_cache.get((room_id, user_id))
+        if entry is None:
+            return None
+
+        stream_ordering, _ = entry
+        if to_key.stream < stream_ordering:
+            # The preview may have changed between `to_key` and when it was cached.
+            return None
+
+        if self._beeper_preview_stream_cache.has_entity_changed(
+            room_id, stream_ordering
+        ):
+            return None
+
+        return entry
+
+    async def _beeper_have_materialized_previews(self) -> bool:
+        """Whether `beeper_room_previews` and `beeper_user_room_previews` have been
+        populated for all rooms, so that previews can be read from them.
+        """
+        if not self._beeper_previews_populated:
+            self._beeper_previews_populated = (
+                await self.db_pool.updates.has_completed_background_update(
+                    "beeper_room_previews_populate"
+                )
+            )
+
+        return self._beeper_previews_populated
+
+    def _beeper_get_previews_txn(
+        self,
+        txn: LoggingTransaction,
+        room_ids: Collection[str],
+        user_id: str,
+        to_key: RoomStreamToken,
+    ) -> Dict[str, Optional[Tuple[str, int]]]:
+        """Read the preview events for the given rooms from the materialized
+        preview tables.
+
+        The tables always hold the current preview, so for any room where that is
+        newer than `to_key` we fall back to computing the preview from `events`.
+        """
+        # Map from room ID to the preview event ID, its stream ordering and its
+        # origin server timestamp.
+        candidates: Dict[str, Tuple[str, int, int]] = {}
+
+        clause, args = make_in_list_sql_clause(
+            self.database_engine, "room_id", room_ids
+        )
+
+        sql = f"""
+            SELECT room_id, event_id, edit_event_id, event_stream_ordering, origin_server_ts
+            FROM beeper_room_previews
+            WHERE {clause}
+        """
+        txn.execute(sql, args)
+        for room_id, event_id, edit_event_id, stream_ordering, ts in txn:
+            candidates[room_id] = (edit_event_id or event_id, stream_ordering, ts)
+
+        # Reactions to the user's own messages override the room preview if they
+        # are more recent.
+        sql = f"""
+            SELECT room_id, event_id, event_stream_ordering, origin_server_ts
+            FROM beeper_user_room_previews
+            WHERE user_id = ? AND {clause}
+        """
+        txn.execute(sql, [user_id] + args)
+        for room_id, event_id, stream_ordering, ts in txn:
+            existing = candidates.get(room_id)
+            if existing is None or existing[1] < stream_ordering:
+                candidates[room_id] = (event_id, stream_ordering, ts)
+
+        results: Dict[str, Optional[Tuple[str, int]]] = {}
+        for room_id in room_ids:
+            candidate = candidates.get(room_id)
+            if candidate is None:
+                results[room_id] = None
+            elif candidate[1] > to_key.stream:
+                results[room_id] = self._beeper_compute_preview_txn(
+                    txn, room_id, user_id, to_key.stream
+                )
+            else:
+                results[room_id] = (candidate[0], candidate[2])
+
+        return results
+
+    def _beeper_compute_preview_txn(
+        self, txn: LoggingTransaction, room_id: str, user_id: str, stream: int
+    ) -> Optional[Tuple[str, int]]:
+        """Compute the preview event for a room as of the given stream ordering
+        directly from the `events` table.
+
+        The preview is the latest message which isn't an edit or redacted, or a
+        later non-redacted reaction to one of the user's non-redacted messages.
+        If the preview has been edited, the latest edit is returned instead.
+        """
+        # The type list must match the `beeper_events_preview_idx` index.
+        sql = """
+            SELECT e.event_id, e.stream_ordering, e.origin_server_ts
+            FROM events AS e
+            WHERE
+                e.room_id = ?
+                AND e.type IN ('m.room.message', 'm.room.encrypted', 'm.sticker')
+                AND e.stream_ordering <= ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM redactions AS r WHERE r.redacts = e.event_id
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM event_relations AS is_edit
+                    WHERE
+                        is_edit.event_id = e.event_id
+                        AND is_edit.relation_type = 'm.replace'
+                )
+            ORDER BY e.stream_ordering DESC
+            LIMIT 1
+        """
+        txn.execute(sql, (room_id, stream))
+        message = cast(Optional[Tuple[str, int, int]], txn.fetchone())
+
+        # Only reactions after the latest message can be the preview.
+        args: List[Any] = [room_id, stream, user_id]
+        after_message_clause = ""
+        if message is not None:
+            after_message_clause = "AND e.stream_ordering > ?"
+            args.append(message[1])
+
+        sql = f"""
+            SELECT e.event_id, e.origin_server_ts
+            FROM events AS e
+            INNER JOIN event_relations AS er USING (event_id)
+            INNER JOIN events AS target ON target.event_id = er.relates_to_id
+            WHERE
+                e.room_id = ?
+                AND e.type = 'm.reaction'
+                AND e.stream_ordering <= ?
+                AND target.sender = ?
+                {after_message_clause}
+                AND NOT EXISTS (
+                    SELECT 1 FROM redactions AS r WHERE r.redacts = e.event_id
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM redactions AS r WHERE r.redacts = target.event_id
+                )
+            ORDER BY e.stream_ordering DESC
+            LIMIT 1
+        """
+        txn.execute(sql, args)
+        reaction = cast(Optional[Tuple[str, int]], txn.fetchone())
+        if reaction is not None:
+            return reaction
+
+        if message is None:
+            return None
+
+        event_id, _, origin_server_ts = message
+
+        # Use the latest edit of the message, if there is one.
+        sql = """
+            SELECT e.event_id
+            FROM event_relations AS er
+            INNER JOIN events AS e USING (event_id)
+            WHERE er.relates_to_id = ? AND er.relation_type = 'm.replace'
+            ORDER BY e.origin_server_ts DESC
+            LIMIT 1
+        """
+        txn.execute(sql, (event_id,))
+        edit = txn.fetchone()
+        if edit is not None:
+            event_id = edit[0]
+
+        return event_id, origin_server_ts
+
+    def beeper_update_room_previews_txn(
+        self, txn: LoggingTransaction, events: List[EventBase]
+    ) -> None:
+        """Update the materialized preview tables for newly persisted events.
+
+        Args:
+            txn: The transaction the events are being persisted in. The events
+                must already have been inserted into `events`, `redactions` and
+                `event_relations`.
+            events: The (non-rejected) events being persisted.
+        """
+        if not events:
+            return
+
+        # Events that may have been redacted before they arrived should never be
+        # used as a preview.
+        clause, args = make_in_list_sql_clause(
+            self.database_engine, "redacts", [event.event_id for event in events]
+        )
+        txn.execute(f"SELECT redacts FROM redactions WHERE {clause}", args)
+        redacted_event_ids = {redacts for redacts, in txn}
+
+        for event in events:
+            if event.type == EventTypes.Redaction and event.redacts is not None:
+                self._beeper_handle_preview_redaction_txn(
+                    txn, event.room_id, event.redacts
+                )
+                continue
+
+            if event.event_id in redacted_event_ids or event.is_state():
+                continue
+
+            stream_ordering = event.internal_metadata.stream_ordering
+            assert stream_ordering is not None
+
+            relation = relation_from_event(event)
+            if relation and relation.rel_type == RelationTypes.REPLACE:
+                # Edits are never previews themselves, but replace the content of
+                # the preview if they edit it.
+                txn.execute(
+                    """
+                    UPDATE beeper_room_previews
+                    SET edit_event_id = ?, edit_origin_server_ts = ?
+                    WHERE
+                        room_id = ? AND event_id = ?
+                        AND (
+                            edit_origin_server_ts IS NULL
+                            OR edit_origin_server_ts <= ?
                         )
-                        ELSE (true) END
-                ORDER BY e.stream_ordering DESC
-                LIMIT 1
-            ),
-            latest_edit_for_latest_event AS (
-                SELECT e.event_id, e_replacement.event_id as replacement_event_id
-                FROM latest_event e
-                -- Find any events that edit this event, as we'll want to use the new content from
-                -- the edit as the preview
-                LEFT JOIN event_relations as er
-                    ON e.event_id = er.relates_to_id AND er.relation_type = 'm.replace'
-                LEFT JOIN events as e_replacement
-                    ON er.event_id = e_replacement.event_id
-                ORDER BY e_replacement.origin_server_ts DESC
-                LIMIT 1
+                    """,
+                    (
+                        event.event_id,
+                        event.origin_server_ts,
+                        event.room_id,
+                        relation.parent_id,
+                        event.origin_server_ts,
+                    ),
+                )
+            elif event.type in BEEPER_PREVIEW_EVENT_TYPES:
+                self._beeper_upsert_room_preview_txn(
+                    txn,
+                    event.room_id,
+                    event.event_id,
+                    stream_ordering,
+                    event.origin_server_ts,
+                )
+            elif event.type == EventTypes.Reaction and relation:
+                row = self.db_pool.simple_select_one_txn(
+                    txn,
+                    table="events",
+                    keyvalues={"event_id": relation.parent_id},
+                    retcols=("sender",),
+                    allow_none=True,
+                )
+                # Only reactions to local users' (non-redacted) messages matter.
+                if (
+                    row is None
+                    or not self.hs.is_mine_id(row[0])
+                    or relation.parent_id in redacted_event_ids
+                    or self.db_pool.simple_select_one_onecol_txn(
+                        txn,
+                        table="redactions",
+                        keyvalues={"redacts": relation.parent_id},
+                        retcol="1",
+                        allow_none=True,
+                    )
+                ):
+                    continue
+
+                txn.execute(
+                    """
+                    INSERT INTO beeper_user_room_previews (
+                        user_id, room_id, event_id, relates_to_id,
+                        event_stream_ordering, origin_server_ts
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, room_id)
+                    DO UPDATE SET
+                        event_id = excluded.event_id,
+                        relates_to_id = excluded.relates_to_id,
+                        event_stream_ordering = excluded.event_stream_ordering,
+                        origin_server_ts = excluded.origin_server_ts
+                    WHERE
+                        beeper_user_room_previews.event_stream_ordering
+                            < excluded.event_stream_ordering
+                    """,
+                    (
+                        row[0],
+                        event.room_id,
+                        event.event_id,
+                        relation.parent_id,
+                        stream_ordering,
+                        event.origin_server_ts,
+                    ),
+                )
+
+    def _beeper_upsert_room_preview_txn(
+        self,
+        txn: LoggingTransaction,
+        room_id: str,
+        event_id: str,
+        stream_ordering: int,
+        origin_server_ts: int,
+    ) -> None:
+        """Make the given event the room preview, unless the current preview is
+        more recent.
+        """
+        txn.execute(
+            """
+            INSERT INTO beeper_room_previews (
+                room_id, event_id, event_stream_ordering, origin_server_ts
+            )
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (room_id)
+            DO UPDATE SET
+                event_id = excluded.event_id,
+                event_stream_ordering = excluded.event_stream_ordering,
+                origin_server_ts = excluded.origin_server_ts,
+                edit_event_id = NULL,
+                edit_origin_server_ts = NULL
+            WHERE
+                beeper_room_previews.event_stream_ordering
+                    < excluded.event_stream_ordering
+            """,
+            (room_id, event_id, stream_ordering, origin_server_ts),
+        )
+
+        # Edits can arrive before the event they edit, e.g. over federation.
+        txn.execute(
+            """
+            SELECT er.event_id, e.origin_server_ts
+            FROM event_relations AS er
+            INNER JOIN events AS e USING (event_id)
+            WHERE er.relates_to_id = ? AND er.relation_type = ?
+            ORDER BY e.origin_server_ts DESC
+            LIMIT 1
+            """,
+            (event_id, RelationTypes.REPLACE),
+        )
+        edit_row = txn.fetchone()
+        if edit_row:
+            self.db_pool.simple_update_txn(
+                txn,
+                table="beeper_room_previews",
+                keyvalues={"room_id": room_id, "event_id": event_id},
+                updatevalues={
+                    "edit_event_id": edit_row[0],
+                    "edit_origin_server_ts": edit_row[1],
+                },
             )
-            SELECT COALESCE(lefle.replacement_event_id, le.event_id), le.origin_server_ts
-            FROM latest_event le
-            LEFT JOIN latest_edit_for_latest_event lefle ON le.event_id = lefle.event_id
+
+    def _beeper_handle_preview_redaction_txn(
+        self, txn: LoggingTransaction, room_id: str, redacted_event_id: str
+    ) -> None:
+        """Recalculate any previews affected by the given event being redacted."""
+        row = self.db_pool.simple_select_one_txn(
+            txn,
+            table="beeper_room_previews",
+            keyvalues={"room_id": room_id},
+            retcols=("event_id", "edit_event_id"),
+            allow_none=True,
+        )
+        if row is not None and redacted_event_id in row:
+            self._beeper_recompute_room_preview_txn(txn, room_id)
+
+        txn.execute(
             """
+            SELECT user_id FROM beeper_user_room_previews
+            WHERE room_id = ? AND (event_id = ? OR relates_to_id = ?)
+            """,
+            (room_id, redacted_event_id, redacted_event_id),
+        )
+        for (user_id,) in txn.fetchall():
+            self._beeper_recompute_user_room_preview_txn(txn, room_id, user_id)
 
+    def _beeper_recompute_room_preview_txn(
+        self, txn: LoggingTransaction, room_id: str
+    ) -> None:
+        """Recalculate the row in `beeper_room_previews` for the given room from
+        the `events` table.
+        """
+        clause, args = make_in_list_sql_clause(
+            self.database_engine, "e.type", BEEPER_PREVIEW_EVENT_TYPES
+        )
+        sql = f"""
+            SELECT e.event_id, e.stream_ordering, e.origin_server_ts
+            FROM events AS e
+            LEFT JOIN redactions AS r
+                ON e.event_id = r.redacts
+            LEFT JOIN event_relations AS is_edit
+                ON e.event_id = is_edit.event_id AND is_edit.relation_type = ?
+            WHERE
+                e.room_id = ?
+                AND {clause}
+                AND is_edit.event_id IS NULL
+                AND r.redacts IS NULL
+            ORDER BY e.stream_ordering DESC
+            LIMIT 1
+        """
+        txn.execute(sql, [RelationTypes.REPLACE, room_id] + args)
+        row = txn.fetchone()
+
+        self.db_pool.simple_delete_txn(
+            txn, table="beeper_room_previews", keyvalues={"room_id": room_id}
+        )
+        if row:
+            self._beeper_upsert_room_preview_txn(txn, room_id, *row)
+
+    def _beeper_recompute_user_room_preview_txn(
+        self, txn: LoggingTransaction, room_id: str, user_id: str
+    ) -> None:
+        """Recalculate the row in `beeper_user_room_previews` for the given room
+        and user from the `events` table.
+        """
+        sql = """
+            SELECT e.event_id, eer.relates_to_id, e.stream_ordering, e.origin_server_ts
+            FROM events AS e
+            INNER JOIN event_relations AS eer
+                ON e.event_id = eer.event_id AND eer.relation_type != ?
+            INNER JOIN events AS target
+                ON eer.relates_to_id = target.event_id
+            LEFT JOIN redactions AS r
+                ON e.event_id = r.redacts
+            LEFT JOIN redactions AS target_r
+                ON target.event_id = target_r.redacts
+            WHERE
+                e.room_id = ?
+                AND e.type = ?
+                AND target.sender = ?
+                AND r.redacts IS NULL
+                AND target_r.redacts IS NULL
+            ORDER BY e.stream_ordering DESC
+            LIMIT 1
+        """
+        txn.execute(sql, (RelationTypes.REPLACE, room_id, EventTypes.Reaction, user_id))
+        row = txn.fetchone()
+
+        self.db_pool.simple_delete_txn(
+            txn,
+            table="beeper_user_room_previews",
+            keyvalues={"user_id": user_id, "room_id": room_id},
+        )
+        if row:
+            self.db_pool.simple_insert_txn(
+                txn,
+                table="beeper_user_room_previews",
+                values={
+                    "user_id": user_id,
+                    "room_id": room_id,
+                    "event_id": row[0],
+                    "relates_to_id": row[1],
+                    "event_stream_ordering": row[2],
+                    "origin_server_ts": row[3],
+                },
+            )
+
+    async def _beeper_room_previews_populate(
+        self, progress: JsonDict, batch_size: int
+    ) -> int:
+        """Background update to populate the materialized preview tables for rooms
+        which existed before the tables were added.
+        """
+        last_room_id: str = progress.get("last_room_id", "")
+
+        def _beeper_room_previews_populate_txn(txn: LoggingTransaction) -> int:
             txn.execute(
-                sql,
-                (
-                    to_key.stream,
-                    room_id,
-                    user_id,
-                ),
+                """
+                SELECT room_id FROM rooms
+                WHERE room_id > ?
+                ORDER BY room_id ASC
+                LIMIT ?
+                """,
+                (last_room_id, batch_size),
             )
+            room_ids = [room_id for room_id, in txn.fetchall()]
 
-            return cast(Optional[Tuple[str, int]], txn.fetchone())
+            for room_id in room_ids:
+                self._beeper_recompute_room_preview_txn(txn, room_id)
 
-        return await self.db_pool.runInteraction(
-            "beeper_preview_for_room_id_and_user_id",
-            beeper_preview_txn,
+                # Find everyone who has had their messages reacted to, and
+                # calculate the preview for the local users.
+                txn.execute(
+                    """
+                    SELECT DISTINCT target.sender
+                    FROM events AS e
+                    INNER JOIN event_relations AS eer USING (event_id)
+                    INNER JOIN events AS target
+                        ON eer.relates_to_id = target.event_id
+                    WHERE e.room_id = ? AND e.type = ?
+                    """,
+                    (room_id, EventTypes.Reaction),
+                )
+                for (user_id,) in txn.fetchall():
+                    if self.hs.is_mine_id(user_id):
+                        self._beeper_recompute_user_room_preview_txn(
+                            txn, room_id, user_id
+                        )
+
+            if room_ids:
+                self.db_pool.updates._background_update_progress_txn(
+                    txn,
+                    "beeper_room_previews_populate",
+                    {"last_room_id": room_ids[-1]},
+                )
+
+            return len(room_ids)
+
+        count = await self.db_pool.runInteraction(
+            "_beeper_room_previews_populate",
+            _beeper_room_previews_populate_txn,
+        )
+
+        if count < batch_size:
+            await self.db_pool.updates._end_background_update(
+                "beeper_room_previews_populate"
+            )
+
+        return count
+
+    async def _beeper_user_notification_counts_prune(
+        self, progress: JsonDict, batch_size: int
+    ) -> int:
+        """Background update to delete the notification counts of users in rooms
+        they are no longer joined to, rooms which have been tombstoned and users
+        who have been deactivated.
+
+        Counts are checked one (user, room) pair at a time, in order.
+        """
+        last_user_id: Optional[str] = progress.get("last_user_id")
+        last_room_id: Optional[str] = progress.get("last_room_id")
+        pruned: int = progress.get("pruned", 0)
+
+        def _beeper_user_notification_counts_prune_txn(
+            txn: LoggingTransaction,
+        ) -> Tuple[int, int]:
+            after_clause = ""
+            args: List[Any] = [EventTypes.Tombstone]
+            if last_user_id is not None and last_room_id is not None:
+                clause, after_args = make_tuple_comparison_clause(
+                    [("c.user_id", last_user_id), ("c.room_id", last_room_id)]
+                )
+                after_clause = f"WHERE {clause}"
+                args.extend(after_args)
+
+            txn.execute(
+                f"""
+                SELECT DISTINCT
+                    c.user_id, c.room_id, m.membership, u.deactivated, t.event_id
+                FROM beeper_user_notification_counts AS c
+                LEFT JOIN local_current_membership AS m
+                    ON m.user_id = c.user_id AND m.room_id = c.room_id
+                LEFT JOIN users AS u ON u.name = c.user_id
+                LEFT JOIN current_state_events AS t
+                    ON t.room_id = c.room_id AND t.type = ? AND t.state_key = ''
+                {after_clause}
+                ORDER BY c.user_id, c.room_id
+                LIMIT ?
+                """,
+                args + [batch_size],
+            )
+            rows = txn.fetchall()
+            if not rows:
+                return 0, 0
+
+            to_prune = [
+                (user_id, room_id)
+                for user_id, room_id, membership, deactivated, tombstone_id in rows
+                if membership != Membership.JOIN or deactivated or tombstone_id
+            ]
+            txn.execute_batch(
+                """
+                DELETE FROM beeper_user_notification_counts
+                WHERE user_id = ? AND room_id = ?
+                """,
+                to_prune,
+            )
+            self._invalidate_cache_and_stream_bulk(  # type: ignore[attr-defined]
+                txn,
+                self._beeper_get_notification_count_for_room,
+                [(room_id, user_id) for user_id, room_id in to_prune],
+            )
+
+            self.db_pool.updates._background_update_progress_txn(
+                txn,
+                "beeper_user_notification_counts_prune",
+                {
+                    "last_user_id": rows[-1][0],
+                    "last_room_id": rows[-1][1],
+                    "pruned": pruned + len(to_prune),
+                },
+            )
+
+            return len(rows), len(to_prune)
+
+        count, batch_pruned = await self.db_pool.runInteraction(
+            "_beeper_user_notification_counts_prune",
+            _beeper_user_notification_counts_prune_txn,
         )
 
+        if count < batch_size:
+            logger.info(
+                "Pruned notification counts for %d (user, room) pairs",
+                pruned + batch_pruned,
+            )
+            await self.db_pool.updates._end_background_update(
+                "beeper_user_notification_counts_prune"
+            )
+
+        return count
+
     async def beeper_cleanup_tombstoned_room(self, room_id: str) -> None:
         def beeper_cleanup_tombstoned_room_txn(txn: LoggingTransaction) -> None:
             self.db_pool.simple_delete_txn(
@@ -125,6 +886,18 @@ class BeeperStore(SQLBaseStore):
                 txn, table="event_push_summary", keyvalues={"room_id": room_id}
             )
 
+            if not self.user_notification_counts_enabled:
+                return
+
+            self.db_pool.simple_delete_txn(
+                txn,
+                table="beeper_user_notification_counts",
+                keyvalues={"room_id": room_id},
+            )
+            self._invalidate_cache_and_stream(  # type: ignore[attr-defined]
+                txn, self._beeper_get_notification_count_for_room, (room_id,)
+            )
+
         await self.db_pool.runInteraction(
             "beeper_cleanup_tombstoned_room",
             beeper_cleanup_tombstoned_room_txn,
@@ -160,6 +933,65 @@ class BeeperStore(SQLBaseStore):
             ),
         )
 
+        # The counts cached for the rooms of the events are invalidated on each
+        # worker by the events stream, so there is no need to stream an
+        # invalidation for each user who was notified.
+
+    async def beeper_get_unread_counts_by_room_for_user(
+        self, user_id: str
+    ) -> Mapping[str, int]:
+        """Get the notification count by room for a user from the pre-aggregated
+        `beeper_user_notification_counts` table, for use as the push badge.
+
+        This is equivalent to `get_unread_counts_by_room_for_user`, but only
+        reads the rows for rooms with unread notifications. Receipts clear the
+        rows they cover, so anything left is unread.
+
+        Returns:
+            A map of room ID to notification counts for the given user, only
+            including joined rooms with notifications.
+        """
+        room_ids = await self.get_rooms_for_user(user_id)  # type: ignore[attr-defined]
+        counts = await self._beeper_get_notification_counts_for_rooms(room_ids, user_id)
+        return {room_id: count for room_id, count in counts.items() if count > 0}
+
+    @cached(max_entries=100000, tree=True)
+    async def _beeper_get_notification_count_for_room(
+        self, room_id: str, user_id: str
+    ) -> int:
+        # Keyed by room first, so that the events stream can invalidate the
+        # counts of everyone in a room at once.
+        res = await self._beeper_get_notification_counts_for_rooms([room_id], user_id)
+        return res[room_id]
+
+    @cachedList(
+        cached_method_name="_beeper_get_notification_count_for_room",
+        list_name="room_ids",
+    )
+    async def _beeper_get_notification_counts_for_rooms(
+        self, room_ids: Collection[str], user_id: str
+    ) -> Mapping[str, int]:
+        def _beeper_get_notification_counts_for_rooms_txn(
+            txn: LoggingTransaction,
+        ) -> Dict[str, int]:
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "room_id", room_ids
+            )
+            sql = f"""
+                SELECT room_id, SUM(notifs)
+                FROM beeper_user_notification_counts
+                WHERE user_id = ? AND {clause}
+                GROUP BY room_id
+            """
+            txn.execute(sql, [user_id] + args)
+            return {room_id: int(count) for room_id, count in txn}
+
+        counts = await self.db_pool.runInteraction(
+            "_beeper_get_notification_counts_for_rooms",
+            _beeper_get_notification_counts_for_rooms_txn,
+        )
+        return {room_id: counts.get(room_id, 0) for room_id in room_ids}
+
     def beeper_clear_notification_counts_txn(
         self,
         txn: LoggingTransaction,
@@ -180,111 +1012,256 @@ class BeeperStore(SQLBaseStore):
 
         txn.execute(sql, (user_id, room_id, stream_ordering))
 
+    @wrap_as_background_process("beeper_schedule_notification_counts_prune")
+    async def beeper_schedule_notification_counts_prune(self) -> None:
+        """Schedule the background update pruning notification counts to run
+        again from the start, unless it is still running.
+
+        Counts keep being aggregated for users who go on to leave rooms or be
+        deactivated, so the prune has to be repeated to keep the table small.
+        """
+        scheduled = await self.db_pool.simple_upsert(
+            table="background_updates",
+            keyvalues={"update_name": "beeper_user_notification_counts_prune"},
+            values={},
+            insertion_values={"progress_json": "{}"},
+            desc="beeper_schedule_notification_counts_prune",
+        )
+        if scheduled:
+            self.db_pool.updates.start_doing_background_updates()
+
     @wrap_as_background_process("beeper_aggregate_notification_counts")
     async def beeper_aggregate_notification_counts(self) -> None:
         if not self.user_notification_counts_enabled:
             return
 
-        def aggregate_txn(txn: LoggingTransaction, limit: int) -> int:
-            sql = """
-                WITH recent_rows AS (  -- Aggregate the tables, flag aggregated rows for deletion
-                    SELECT
-                        user_id,
-                        room_id
-                    FROM
-                        beeper_user_notification_counts
-                    WHERE
-                        event_stream_ordering > (
-                            SELECT event_stream_ordering FROM beeper_user_notification_counts_stream_ordering
-                        )
-                        AND event_stream_ordering < (
-                            -- Select highest stream ordering from events over one hour,
-                            -- this is to avoid serialization issues with the most
-                            -- recent events/receipts
-                            SELECT stream_ordering FROM events
-                            WHERE origin_server_ts < (
-                                (EXTRACT(EPOCH from NOW()) - 3600) * 1000
-                            )
-                            ORDER BY stream_ordering DESC
-                            LIMIT 1
-                        )
-                    -- Oldest first, to reduce serialization issues
-                    ORDER BY event_stream_ordering ASC
-                    LIMIT {limit}
+        if self.is_aggregating_notification_counts:
+            return
+
+        self.is_aggregating_notification_counts = True
+
+        try:
+            now = self._clock.time_msec()
+            current_position = self.get_room_max_stream_ordering()  # type: ignore[attr-defined]
+            self._notification_counts_positions.append((now, current_position))
+
+            upper_bound = await self._beeper_notification_counts_upper_bound(now)
+
+            start = self._clock.time()
+            aggregated = await self._beeper_aggregate_notification_counts_up_to(
+                upper_bound
+            )
+            elapsed = max(self._clock.time() - start, 0.001)
+
+            notification_counts_aggregated_rate_gauge.set(aggregated / elapsed)
+            notification_counts_lag_gauge.set(
+                max(current_position - self._notification_counts_watermark, 0)
+            )
+            notification_counts_backlog_gauge.set(
+                await self.db_pool.runInteraction(
+                    "beeper_count_notification_counts_backlog",
+                    self._beeper_count_notification_counts_backlog_txn,
                 )
-                UPDATE
-                    beeper_user_notification_counts AS epc
-                SET
-                    unreads = CASE WHEN epc.event_stream_ordering = agg.max_eso THEN agg.unreads ELSE 0 END,
-                    notifs = CASE WHEN epc.event_stream_ordering = agg.max_eso THEN agg.notifs ELSE 0 END,
-                    highlights = CASE WHEN epc.event_stream_ordering = agg.max_eso THEN agg.highlights ELSE 0 END,
-                    aggregated = epc.event_stream_ordering != agg.max_eso
-                FROM (
-                    SELECT
-                        user_id,
-                        room_id,
-                        SUM(unreads) AS unreads,
-                        SUM(notifs) AS notifs,
-                        SUM(highlights) AS highlights,
-                        MAX(event_stream_ordering) AS max_eso
-                    FROM
-                        beeper_user_notification_counts
-                    WHERE
-                        user_id IN(SELECT user_id FROM recent_rows)
-                        AND room_id IN(SELECT room_id FROM recent_rows)
-                    GROUP BY
-                        user_id,
-                        room_id
-                ) AS agg
-                WHERE
-                    epc.room_id = agg.room_id
-                    AND epc.user_id = agg.user_id
-                RETURNING
-                    event_stream_ordering;
-            """.format(
-                limit=limit
             )
 
-            txn.execute(sql)
-            orders = list(txn)
-            if not orders:
-                logger.info("No user counts aggregated")
-                return 0
+        except self.database.engine.module.OperationalError:
+            logger.exception("Failed to aggregate notifications")
 
-            max_stream_ordering = max(orders)
-            txn.execute(
+        finally:
+            self.is_aggregating_notification_counts = False
+
+    async def _beeper_notification_counts_upper_bound(self, now: int) -> int:
+        """Get the events stream position from `NOTIFICATION_COUNTS_AGGREGATION_DELAY_MS`
+        ago, up to which notification counts can be aggregated.
+        """
+        cutoff = now - NOTIFICATION_COUNTS_AGGREGATION_DELAY_MS
+
+        # Discard samples which are superseded by a later sample that is also
+        # from before the cutoff.
+        positions = self._notification_counts_positions
+        while len(positions) > 1 and positions[1][0] <= cutoff:
+            positions.popleft()
+
+        if positions and positions[0][0] <= cutoff:
+            return positions[0][1]
+
+        # We haven't been running for long enough to have sampled the stream
+        # position, so look it up from the events table instead (once).
+        if self._notification_counts_initial_upper_bound is None:
+            first_after = await self.find_first_stream_ordering_after_ts(  # type: ignore[attr-defined]
+                cutoff
+            )
+            self._notification_counts_initial_upper_bound = max(first_after - 1, 0)
+
+        return self._notification_counts_initial_upper_bound
+
+    async def _beeper_aggregate_notification_counts_up_to(
+        self, upper_bound: int
+    ) -> int:
+        """Aggregate the rows in `beeper_user_notification_counts` between the
+        watermark and `upper_bound`, one batch of (user, room) partitions at a
+        time, then advance the watermark to `upper_bound`.
+
+        The rows for each partition up to `upper_bound` are collapsed into the
+        row with the highest stream ordering. Partitions are paged through in
+        order with a `(user_id, room_id)` cursor, which walks the unique index
+        of the table from where the last batch stopped rather than finding and
+        sorting every partition in the range again for each batch.
+
+        Returns:
+            The number of rows which were aggregated away.
+        """
+        self._notification_counts_watermark = (
+            await self.db_pool.simple_select_one_onecol(
+                table="beeper_user_notification_counts_stream_ordering",
+                keyvalues={},
+                retcol="event_stream_ordering",
+                desc="beeper_get_notification_counts_watermark",
+            )
+        )
+        lower_bound = self._notification_counts_watermark
+        if upper_bound <= lower_bound:
+            return 0
+
+        def aggregate_txn(
+            txn: LoggingTransaction, after: Optional[Tuple[str, str]]
+        ) -> Tuple[Optional[Tuple[str, str]], int]:
+            """Aggregate the next batch of partitions after `after`.
+
+            Returns:
+                The last partition in the batch, or None if there are no more
+                after it, and the number of rows aggregated away.
+            """
+            args: List[Any] = [lower_bound, upper_bound]
+            after_clause = ""
+            if after is not None:
+                clause, after_args = make_tuple_comparison_clause(
+                    [("user_id", after[0]), ("room_id", after[1])]
+                )
+                after_clause = f"AND {clause}"
+                args.extend(after_args)
+
+            # Not DISTINCT, so that the scan can stop once it has found enough
+            # rows. A partition may have several rows in the batch.
+            sql = f"""
+                SELECT user_id, room_id
+                FROM beeper_user_notification_counts
+                WHERE
+                    event_stream_ordering > ?
+                    AND event_stream_ordering <= ?
+                    {after_clause}
+                ORDER BY user_id, room_id
+                LIMIT ?
+            """
+            txn.execute(sql, args + [NOTIFICATION_COUNTS_AGGREGATION_BATCH_SIZE])
+            rows = cast(List[Tuple[str, str]], txn.fetchall())
+            if not rows:
+                return None, 0
+
+            partitions = list(dict.fromkeys(rows))
+
+            clause, args = make_tuple_in_list_sql_clause(
+                self.database_engine, ("user_id", "room_id"), partitions
+            )
+            sql = f"""
+                SELECT
+                    user_id, room_id, MAX(event_stream_ordering),
+                    SUM(notifs), SUM(unreads), SUM(highlights), COUNT(*)
+                FROM beeper_user_notification_counts
+                WHERE event_stream_ordering <= ? AND {clause}
+                GROUP BY user_id, room_id
+                HAVING COUNT(*) > 1
+            """
+            txn.execute(sql, [upper_bound] + args)
+            aggregates = txn.fetchall()
+
+            txn.execute_batch(
                 """
-                    UPDATE beeper_user_notification_counts_stream_ordering
-                    SET event_stream_ordering = ?
+                DELETE FROM beeper_user_notification_counts
+                WHERE user_id = ? AND room_id = ? AND event_stream_ordering < ?
                 """,
-                (max_stream_ordering,),
+                [
+                    (user_id, room_id, max_so)
+                    for user_id, room_id, max_so, *_ in aggregates
+                ],
+            )
+            txn.execute_batch(
+                """
+                UPDATE beeper_user_notification_counts
+                SET notifs = ?, unreads = ?, highlights = ?
+                WHERE user_id = ? AND room_id = ? AND event_stream_ordering = ?
+                """,
+                [
+                    (notifs, unreads, highlights, user_id, room_id, max_so)
+                    for user_id, room_id, max_so, notifs, unreads, highlights, _ in aggregates
+                ],
             )
-            txn.execute("DELETE FROM beeper_user_notification_counts WHERE aggregated")
 
-            logger.info(f"Aggregated {len(orders)} notification count rows")
+            batch_aggregated = sum(row[6] - 1 for row in aggregates)
+            if len(rows) < NOTIFICATION_COUNTS_AGGREGATION_BATCH_SIZE:
+                return None, batch_aggregated
+            return partitions[-1], batch_aggregated
 
-            return txn.rowcount
+        aggregated = 0
+        after: Optional[Tuple[str, str]] = None
+        while True:
+            after, batch_aggregated = await self.db_pool.runInteraction(
+                "beeper_aggregate_notification_counts", aggregate_txn, after
+            )
+            aggregated += batch_aggregated
+            if after is None:
+                break
 
-        if self.is_aggregating_notification_counts:
-            return
+            await self._clock.sleep(0.1)
 
-        self.is_aggregating_notification_counts = True
-        limit = 1000
+        await self.db_pool.runInteraction(
+            "beeper_update_notification_counts_watermark",
+            self._beeper_update_notification_counts_watermark_txn,
+            upper_bound,
+        )
+        self._notification_counts_watermark = upper_bound
 
-        try:
-            logger.info("Aggregating notification counts")
-
-            last_batch = limit + 1
-            while last_batch > limit:
-                last_batch = await self.db_pool.runInteraction(
-                    "beeper_aggregate_notification_counts",
-                    aggregate_txn,
-                    limit=limit,
-                )
-                await self._clock.sleep(1.0)
+        logger.info(
+            "Aggregated %d notification count rows up to stream ordering %d",
+            aggregated,
+            upper_bound,
+        )
 
-        except self.database.engine.module.OperationalError:
-            logger.exception("Failed to aggregate notifications")
+        return aggregated
 
-        finally:
-            self.is_aggregating_notification_counts = False
+    def _beeper_update_notification_counts_watermark_txn(
+        self, txn: LoggingTransaction, watermark: int
+    ) -> None:
+        txn.execute(
+            """
+            UPDATE beeper_user_notification_counts_stream_ordering
+            SET event_stream_ordering = ?
+            """,
+            (watermark,),
+        )
+
+    def _beeper_count_notification_counts_backlog_txn(
+        self, txn: LoggingTransaction
+    ) -> int:
+        """Estimate the number of rows after the aggregation watermark.
+
+        On postgres this is the planner's estimate, rather than counting the
+        rows every time the gauge is updated.
+        """
+        sql = """
+            SELECT COUNT(*) FROM beeper_user_notification_counts
+            WHERE event_stream_ordering > ?
+        """
+        if isinstance(self.database_engine, PostgresEngine):
+            txn.execute(
+                "EXPLAIN (FORMAT JSON) " + sql, (self._notification_counts_watermark,)
+            )
+            plan = cast(Tuple[Any], txn.fetchone())[0]
+            if isinstance(plan, str):
+                plan = json_decoder.decode(plan)
+            # The estimate is of the rows counted, which are the input to the
+            # aggregate at the top of the plan.
+            return int(plan[0]["Plan"]["Plans"][0]["Plan Rows"])
+
+        txn.execute(sql, (self._notification_counts_watermark,))
+        return cast(Tuple[int], txn.fetchone())[0]
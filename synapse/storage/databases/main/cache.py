@@ -22,7 +22,7 @@
 
 import itertools
 import logging
-from typing import TYPE_CHECKING, Any, Collection, Iterable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Collection, Iterable, List, Optional, Set, Tuple
 
 from synapse.api.constants import EventTypes
 from synapse.config._base import Config
@@ -41,6 +41,9 @@ from synapse.storage.database import (
     LoggingDatabaseConnection,
     LoggingTransaction,
 )
+from synapse.storage.databases.main.beeper import (
+    BEEPER_PREVIEW_INVALIDATING_EVENT_TYPES,
+)
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.util.id_generators import MultiWriterIdGenerator
 from synapse.util.caches.descriptors import CachedFunction
@@ -208,7 +211,25 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
                     backfilled=True,
                 )
         elif stream_name == CachesStream.NAME:
+            # A batch of rows often invalidates the same keys many times (e.g.
+            # when they have been coalesced from a burst of updates), so only
+            # invalidate each once. Nothing can be added to the caches while
+            # the batch is processed, so an invalidation of a whole cache makes
+            # any other invalidations of it redundant.
+            invalidated: Set[Tuple[str, Optional[Tuple[Any, ...]]]] = set()
             for row in rows:
+                try:
+                    keys = None if row.keys is None else tuple(row.keys)
+                    if (row.cache_func, keys) in invalidated or (
+                        row.cache_func,
+                        None,
+                    ) in invalidated:
+                        continue
+                    invalidated.add((row.cache_func, keys))
+                except TypeError:
+                    # The keys can't be hashed, so just invalidate them again.
+                    pass
+
                 if row.cache_func == CURRENT_STATE_CACHE_NAME:
                     if row.keys is None:
                         raise Exception(
@@ -306,6 +327,9 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         self._attempt_to_invalidate_cache(
             "get_unread_event_push_actions_by_room_for_user", (room_id,)
         )
+        self._attempt_to_invalidate_cache(
+            "_beeper_get_notification_count_for_room", (room_id,)
+        )
 
         # The `_get_membership_from_event_id` is immutable, except for the
         # case where we look up an event *before* persisting it.
@@ -313,6 +337,13 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
 
         if not backfilled:
             self._events_stream_cache.entity_has_changed(room_id, stream_ordering)  # type: ignore[attr-defined]
+            # Messages (including edits), redactions and reactions can change
+            # the previews of the room.
+            if etype in BEEPER_PREVIEW_INVALIDATING_EVENT_TYPES:
+                self._beeper_preview_stream_cache.entity_has_changed(  # type: ignore[attr-defined]
+                    room_id, stream_ordering
+                )
+                self._attempt_to_invalidate_cache("_beeper_preview_cache", (room_id,))
 
         if redacts:
             self._invalidate_local_get_event_cache(redacts)  # type: ignore[attr-defined]
@@ -380,6 +411,9 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         self._attempt_to_invalidate_cache(
             "get_unread_event_push_actions_by_room_for_user", (room_id,)
         )
+        self._attempt_to_invalidate_cache(
+            "_beeper_get_notification_count_for_room", (room_id,)
+        )
 
         self._attempt_to_invalidate_cache("_get_membership_from_event_id", None)
         self._attempt_to_invalidate_cache("get_relations_for_event", None)
@@ -397,6 +431,7 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         self._attempt_to_invalidate_cache("get_thread_summary", None)
         self._attempt_to_invalidate_cache("get_thread_participated", None)
         self._attempt_to_invalidate_cache("get_threads", (room_id,))
+        self._attempt_to_invalidate_cache("_beeper_preview_cache", (room_id,))
 
         self._attempt_to_invalidate_cache("_get_state_group_for_event", None)
 
@@ -449,6 +484,7 @@ class CacheInvalidationWorkerStore(SQLBaseStore):
         self._attempt_to_invalidate_cache("get_forgotten_rooms_for_user", None)
         self._attempt_to_invalidate_cache("_get_membership_from_event_id", None)
         self._attempt_to_invalidate_cache("get_room_version_id", (room_id,))
+        self._attempt_to_invalidate_cache("_beeper_preview_cache", (room_id,))
 
         # And delete state caches.
 
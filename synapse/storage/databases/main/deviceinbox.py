@@ -59,7 +59,7 @@ from synapse.storage.util.id_generators import (
 from synapse.types import JsonDict
 from synapse.util import json_encoder
 from synapse.util.caches.expiringcache import ExpiringCache
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -128,7 +128,8 @@ class DeviceInboxWorkerStore(SQLBaseStore):
             max_value=max_device_inbox_id,
             limit=1000,
         )
-        self._device_inbox_stream_cache = StreamChangeCache(
+        self._device_inbox_stream_cache = create_stream_change_cache(
+            hs,
             "DeviceInboxStreamChangeCache",
             min_device_inbox_id,
             prefilled_cache=device_inbox_prefill,
@@ -144,7 +145,8 @@ class DeviceInboxWorkerStore(SQLBaseStore):
             max_value=max_device_inbox_id,
             limit=1000,
         )
-        self._device_federation_outbox_stream_cache = StreamChangeCache(
+        self._device_federation_outbox_stream_cache = create_stream_change_cache(
+            hs,
             "DeviceFederationOutboxStreamChangeCache",
             min_device_outbox_id,
             prefilled_cache=device_outbox_prefill,
@@ -72,7 +72,7 @@ from synapse.util.caches.descriptors import cached, cachedList
 from synapse.util.caches.lrucache import LruCache
 from synapse.util.caches.stream_change_cache import (
     AllEntitiesChangedResult,
-    StreamChangeCache,
+    create_stream_change_cache,
 )
 from synapse.util.cancellation import cancellable
 from synapse.util.iterutils import batch_iter
@@ -126,7 +126,8 @@ class DeviceWorkerStore(RoomMemberWorkerStore, EndToEndKeyWorkerStore):
             max_value=device_list_max,
             limit=10000,
         )
-        self._device_list_stream_cache = StreamChangeCache(
+        self._device_list_stream_cache = create_stream_change_cache(
+            hs,
             "DeviceListStreamChangeCache",
             min_device_list_id,
             prefilled_cache=device_list_prefill,
@@ -143,7 +144,8 @@ class DeviceWorkerStore(RoomMemberWorkerStore, EndToEndKeyWorkerStore):
             max_value=device_list_max,
             limit=1000,
         )
-        self._user_signature_stream_cache = StreamChangeCache(
+        self._user_signature_stream_cache = create_stream_change_cache(
+            hs,
             "UserSignatureStreamChangeCache",
             user_signature_stream_list_id,
             prefilled_cache=user_signature_stream_prefill,
@@ -160,7 +162,8 @@ class DeviceWorkerStore(RoomMemberWorkerStore, EndToEndKeyWorkerStore):
             max_value=device_list_max,
             limit=10000,
         )
-        self._device_list_federation_stream_cache = StreamChangeCache(
+        self._device_list_federation_stream_cache = create_stream_change_cache(
+            hs,
             "DeviceListFederationStreamChangeCache",
             device_list_federation_list_id,
             prefilled_cache=device_list_federation_prefill,
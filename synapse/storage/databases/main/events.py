@@ -500,7 +500,7 @@ class PersistEventsStore:
         # event's auth chain, but its easier for now just to store them (and
         # it doesn't take much storage compared to storing the entire event
         # anyway).
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="event_auth",
             keys=("event_id", "room_id", "auth_id"),
@@ -732,7 +732,7 @@ class PersistEventsStore:
         )
         chain_map.update(new_chain_tuples)
 
-        db_pool.simple_insert_many_txn(
+        db_pool.simple_copy_many_txn(
             txn,
             table="event_auth_chains",
             keys=("event_id", "chain_id", "sequence_number"),
@@ -848,7 +848,7 @@ class PersistEventsStore:
                         (chain_id, sequence_number), (target_id, target_seq)
                     )
 
-        db_pool.simple_insert_many_txn(
+        db_pool.simple_copy_many_txn(
             txn,
             table="event_auth_chain_links",
             keys=(
@@ -1478,7 +1478,7 @@ class PersistEventsStore:
             d.pop("redacted_because", None)
             return d
 
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="event_json",
             keys=("event_id", "room_id", "internal_metadata", "json", "format_version"),
@@ -1494,7 +1494,7 @@ class PersistEventsStore:
             ],
         )
 
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="events",
             keys=(
@@ -1552,7 +1552,7 @@ class PersistEventsStore:
         )
         txn.execute(sql + clause, args)
 
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="state_events",
             keys=("event_id", "room_id", "type", "state_key"),
@@ -1672,6 +1672,12 @@ class PersistEventsStore:
                 if type(expiry_ts) is int and not event.is_state():  # noqa: E721
                     self._insert_event_expiry_txn(txn, event.event_id, expiry_ts)
 
+        # Beeper: update the materialized room previews. This must happen after
+        # the redactions and relations tables have been updated above.
+        self.store.beeper_update_room_previews_txn(
+            txn, [event for event, _ in events_and_contexts]
+        )
+
         # Insert into the room_memberships table.
         self._store_room_members_txn(
             txn,
@@ -1809,7 +1815,7 @@ class PersistEventsStore:
                 not affect the current local state.
         """
 
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="room_memberships",
             keys=(
@@ -2274,7 +2280,7 @@ class PersistEventsStore:
         For the given event, update the event edges table and forward and
         backward extremities tables.
         """
-        self.db_pool.simple_insert_many_txn(
+        self.db_pool.simple_copy_many_txn(
             txn,
             table="event_edges",
             keys=("event_id", "prev_event_id"),
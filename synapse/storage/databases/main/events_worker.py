@@ -18,6 +18,7 @@
 #
 #
 
+import itertools
 import logging
 import threading
 import weakref
@@ -53,7 +54,7 @@ from synapse.api.room_versions import (
     RoomVersion,
     RoomVersions,
 )
-from synapse.events import EventBase, make_event_from_dict
+from synapse.events import EventBase, make_compact_event_from_json, make_event_from_dict
 from synapse.events.snapshot import EventContext
 from synapse.events.utils import prune_event
 from synapse.logging.context import (
@@ -89,12 +90,16 @@ from synapse.util import unwrapFirstError
 from synapse.util.async_helpers import ObservableDeferred, delay_cancellation
 from synapse.util.caches.descriptors import cached, cachedList
 from synapse.util.caches.lrucache import AsyncLruCache
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import (
+    StreamChangeCache,
+    create_stream_change_cache,
+)
 from synapse.util.cancellation import cancellable
 from synapse.util.iterutils import batch_iter
 from synapse.util.metrics import Measure
 
 if TYPE_CHECKING:
+    from synapse.replication.tcp.external_cache import ExternalCache
     from synapse.server import HomeServer
 
 logger = logging.getLogger(__name__)
@@ -108,6 +113,10 @@ logger = logging.getLogger(__name__)
 EVENT_QUEUE_THREADS = 3  # Max number of threads that will fetch events
 EVENT_QUEUE_ITERATIONS = 3  # No. times we block waiting for requests for events
 EVENT_QUEUE_TIMEOUT_S = 0.1  # Timeout when waiting for requests for events
+# Max number of events a fetch thread takes from the queue at once. Larger
+# requests are split up, so that they can be fetched by several threads.
+EVENT_QUEUE_MAX_EVENTS = 1000
+EVENT_FETCH_BATCH_SIZE = 200  # No. events fetched in each database transaction
 
 
 event_fetch_ongoing_gauge = Gauge(
@@ -167,6 +176,27 @@ class _EventRow:
     outlier: bool
 
 
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _FetchedEvent:
+    """
+    An event row pulled from the database, along with the event built from it.
+
+    Events are built on the event fetch threads, so that decoding large batches
+    of events doesn't block the reactor. See `_build_fetched_event`.
+    """
+
+    row: _EventRow
+    # The event, or None if the row could not be parsed.
+    event: Optional[EventBase]
+    # The error raised building the event, if any, to be raised when the event
+    # is asked for.
+    error: Optional[Exception] = None
+
+
+# The name of the external cache holding `_EventRow`s, see `_get_event_rows`.
+SHARED_EVENT_CACHE_NAME = "beeper_event_rows"
+
+
 class EventRedactBehaviour(Enum):
     """
     What to do when retrieving a redacted event from the database.
@@ -250,10 +280,13 @@ class EventsWorkerStore(SQLBaseStore):
             max_value=events_max,  # As we share the stream id with events token
             limit=1000,
         )
-        self._curr_state_delta_stream_cache: StreamChangeCache = StreamChangeCache(
-            "_curr_state_delta_stream_cache",
-            min_curr_state_delta_id,
-            prefilled_cache=curr_state_delta_prefill,
+        self._curr_state_delta_stream_cache: StreamChangeCache = (
+            create_stream_change_cache(
+                hs,
+                "_curr_state_delta_stream_cache",
+                min_curr_state_delta_id,
+                prefilled_cache=curr_state_delta_prefill,
+            )
         )
 
         if hs.config.worker.run_background_tasks:
@@ -270,6 +303,22 @@ class EventsWorkerStore(SQLBaseStore):
             max_size=hs.config.caches.event_cache_size,
         )
 
+        # Beeper: a second tier below the event cache, shared between workers,
+        # which holds the database rows of events so that they don't need to be
+        # fetched from the database by every worker.
+        self._shared_event_cache: Optional["ExternalCache"] = None
+        self._shared_event_cache_expiry_ms = (
+            hs.config.experimental.beeper_shared_event_cache_expiry_ms
+        )
+        if hs.config.experimental.beeper_shared_event_cache_enabled:
+            external_cache = hs.get_external_cache()
+            if external_cache.is_enabled():
+                self._shared_event_cache = external_cache
+
+        # Beeper: whether to build events which keep their JSON and decode
+        # fields as they are used, so that more fit in the event cache.
+        self._compact_events = hs.config.experimental.beeper_compact_events
+
         # Map from event ID to a deferred that will result in a map from event
         # ID to cache entry. Note that the returned dict may not have the
         # requested event in it if the event isn't in the DB.
@@ -284,8 +333,15 @@ class EventsWorkerStore(SQLBaseStore):
         self._event_ref: MutableMapping[str, EventBase] = weakref.WeakValueDictionary()
 
         self._event_fetch_lock = threading.Condition()
+        # Requests for events, each of the IDs of events to fetch from the
+        # database, rows already fetched from elsewhere which only need
+        # building into events, and a deferred for the result.
         self._event_fetch_list: List[
-            Tuple[Iterable[str], "defer.Deferred[Dict[str, _EventRow]]"]
+            Tuple[
+                Collection[str],
+                Mapping[str, _EventRow],
+                "defer.Deferred[Dict[str, _FetchedEvent]]",
+            ]
         ] = []
         self._event_fetch_ongoing = 0
         event_fetch_ongoing_gauge.set(self._event_fetch_ongoing)
@@ -790,9 +846,6 @@ class EventsWorkerStore(SQLBaseStore):
                 Also creates entries in `self._current_event_fetches` to allow
                 concurrent `_get_events_from_cache_or_db` calls to reuse the same fetch.
                 """
-                log_ctx = current_context()
-                log_ctx.record_event_fetch(len(missing_events_ids))
-
                 # Add entries to `self._current_event_fetches` for each event we're
                 # going to pull from the DB. We use a single deferred that resolves
                 # to all the events we pulled from the DB (this will result in this
@@ -898,6 +951,11 @@ class EventsWorkerStore(SQLBaseStore):
 
         await self._get_event_cache.invalidate((event_id,))
 
+        if self._shared_event_cache is not None:
+            await self._shared_event_cache.invalidate_many(
+                SHARED_EVENT_CACHE_NAME, [event_id], self._shared_event_cache_expiry_ms
+            )
+
     def _invalidate_local_get_event_cache(self, event_id: str) -> None:
         """
         Invalidates an event in local in-memory get event caches.
@@ -910,6 +968,28 @@ class EventsWorkerStore(SQLBaseStore):
         self._event_ref.pop(event_id, None)
         self._current_event_fetches.pop(event_id, None)
 
+    def _invalidate_shared_event_cache_for_room_after_txn(
+        self, txn: LoggingTransaction, room_id: str
+    ) -> None:
+        """Prepares a database transaction to remove all the events in a room from
+        the shared event cache, if enabled, when executed successfully.
+
+        Used when we delete the whole room.
+        """
+        if self._shared_event_cache is None:
+            return
+
+        event_ids = self.db_pool.simple_select_onecol_txn(
+            txn, table="events", keyvalues={"room_id": room_id}, retcol="event_id"
+        )
+        for batch in batch_iter(event_ids, 1000):
+            txn.async_call_after(
+                self._shared_event_cache.invalidate_many,
+                SHARED_EVENT_CACHE_NAME,
+                batch,
+                self._shared_event_cache_expiry_ms,
+            )
+
     def _invalidate_local_get_event_cache_all(self) -> None:
         """Clears the in-memory get event caches.
 
@@ -1143,7 +1223,7 @@ class EventsWorkerStore(SQLBaseStore):
                 # Fail any outstanding fetches since no one else will handle them.
                 assert exc is not None
                 with PreserveLoggingContext():
-                    for _, deferred in event_fetches_to_fail:
+                    for _, _, deferred in event_fetches_to_fail:
                         deferred.errback(exc)
 
     def _fetch_loop(self, conn: LoggingDatabaseConnection) -> None:
@@ -1153,8 +1233,20 @@ class EventsWorkerStore(SQLBaseStore):
         i = 0
         while True:
             with self._event_fetch_lock:
-                event_list = self._event_fetch_list
-                self._event_fetch_list = []
+                # Take requests from the front of the queue, up to a maximum
+                # number of events, leaving the rest for other fetch threads.
+                num_requests = 0
+                num_events = 0
+                for events, rows, _ in self._event_fetch_list:
+                    if num_events >= EVENT_QUEUE_MAX_EVENTS:
+                        break
+                    num_requests += 1
+                    num_events += len(events) + len(rows)
+
+                event_list = self._event_fetch_list[:num_requests]
+                del self._event_fetch_list[:num_requests]
+                if self._event_fetch_list:
+                    self._event_fetch_lock.notify()
 
                 if not event_list:
                     # There are no requests waiting. If we haven't yet reached the
@@ -1178,51 +1270,106 @@ class EventsWorkerStore(SQLBaseStore):
     def _fetch_event_list(
         self,
         conn: LoggingDatabaseConnection,
-        event_list: List[Tuple[Iterable[str], "defer.Deferred[Dict[str, _EventRow]]"]],
+        event_list: List[
+            Tuple[
+                Collection[str],
+                Mapping[str, _EventRow],
+                "defer.Deferred[Dict[str, _FetchedEvent]]",
+            ]
+        ],
     ) -> None:
         """Handle a load of requests from the _event_fetch_list queue
 
+        Rows which have already been fetched are built into events first. The
+        other events are then fetched in batches, in the order they were
+        requested, and each request is completed as soon as all of its events
+        have been fetched.
+
         Args:
             conn: database connection
 
             event_list:
                 The fetch requests. Each entry consists of a list of event
-                ids to be fetched, and a deferred to be completed once the
-                events have been fetched.
+                ids to be fetched, a map from event id to rows which have
+                already been fetched, and a deferred to be completed once the
+                events have been fetched and built.
 
                 The deferreds are callbacked with a dictionary mapping from event id
-                to event row. Note that it may well contain additional events that
-                were not part of this request.
+                to the fetched event.
         """
         with Measure(self._clock, "_fetch_event_list"):
+            # The index of the first request which hasn't been completed.
+            next_request = 0
             try:
-                events_to_fetch = {
-                    event_id for events, _ in event_list for event_id in events
-                }
-
-                row_dict = self.db_pool.new_transaction(
-                    conn,
-                    "do_fetch",
-                    [],
-                    [],
-                    [],
-                    self._fetch_event_rows,
-                    events_to_fetch,
+                fetched_events: Dict[str, _FetchedEvent] = {}
+                attempted: Set[str] = set()
+
+                for _, rows, _ in event_list:
+                    for event_id, row in rows.items():
+                        fetched_events[event_id] = self._build_fetched_event(row)
+                        attempted.add(event_id)
+
+                events_to_fetch = list(
+                    dict.fromkeys(
+                        event_id
+                        for events, _, _ in event_list
+                        for event_id in events
+                        if event_id not in attempted
+                    )
                 )
 
-                # We only want to resolve deferreds from the main thread
-                def fire() -> None:
-                    for _, d in event_list:
-                        d.callback(row_dict)
+                def complete_requests() -> None:
+                    """Complete the requests all of whose events have been
+                    fetched, in order.
+                    """
+                    nonlocal next_request
+
+                    completed = []
+                    while next_request < len(event_list):
+                        events, rows, d = event_list[next_request]
+                        if not attempted.issuperset(events):
+                            break
+                        result = {
+                            event_id: fetched_events[event_id]
+                            for event_id in itertools.chain(events, rows)
+                            if event_id in fetched_events
+                        }
+                        completed.append((d, result))
+                        next_request += 1
+
+                    # We only want to resolve deferreds from the main thread
+                    def fire() -> None:
+                        for d, result in completed:
+                            d.callback(result)
+
+                    if completed:
+                        with PreserveLoggingContext():
+                            self.hs.get_reactor().callFromThread(fire)
+
+                for batch in batch_iter(events_to_fetch, EVENT_FETCH_BATCH_SIZE):
+                    row_dict = self.db_pool.new_transaction(
+                        conn,
+                        "do_fetch",
+                        [],
+                        [],
+                        [],
+                        self._fetch_event_rows,
+                        batch,
+                    )
+                    for event_id, row in row_dict.items():
+                        fetched_events[event_id] = self._build_fetched_event(row)
+                    attempted.update(batch)
 
-                with PreserveLoggingContext():
-                    self.hs.get_reactor().callFromThread(fire)
+                    complete_requests()
+
+                # Complete any requests for no events at all.
+                complete_requests()
             except Exception as e:
                 logger.exception("do_fetch")
 
                 # We only want to resolve deferreds from the main thread
                 def fire_errback(exc: Exception) -> None:
-                    for _, d in event_list:
+                    for _, _, d in event_list[next_request:]:
                         d.errback(exc)
 
                 with PreserveLoggingContext():
@@ -1247,7 +1394,7 @@ class EventsWorkerStore(SQLBaseStore):
             weren't asked for.
         """
         fetched_event_ids: Set[str] = set()
-        fetched_events: Dict[str, _EventRow] = {}
+        fetched_events: Dict[str, _FetchedEvent] = {}
 
         async def _fetch_event_ids_and_get_outstanding_redactions(
             event_ids_to_fetch: Collection[str],
@@ -1256,16 +1403,16 @@ class EventsWorkerStore(SQLBaseStore):
             Fetch all of the given event_ids and return any associated redaction event_ids
             that we still need to fetch in the next iteration.
             """
-            row_map = await self._enqueue_events(event_ids_to_fetch)
+            fetched_map = await self._get_event_rows(event_ids_to_fetch)
 
             # we need to recursively fetch any redactions of those events
             redaction_ids: Set[str] = set()
             for event_id in event_ids_to_fetch:
-                row = row_map.get(event_id)
+                fetched_event = fetched_map.get(event_id)
                 fetched_event_ids.add(event_id)
-                if row:
-                    fetched_events[event_id] = row
-                    redaction_ids.update(row.redactions)
+                if fetched_event:
+                    fetched_events[event_id] = fetched_event
+                    redaction_ids.update(fetched_event.row.redactions)
 
             event_ids_to_fetch = redaction_ids.difference(fetched_event_ids)
             return event_ids_to_fetch
@@ -1287,122 +1434,17 @@ class EventsWorkerStore(SQLBaseStore):
 
         # build a map from event_id to EventBase
         event_map: Dict[str, EventBase] = {}
-        for event_id, row in fetched_events.items():
-            assert row.event_id == event_id
-
-            rejected_reason = row.rejected_reason
-
-            # If the event or metadata cannot be parsed, log the error and act
-            # as if the event is unknown.
-            try:
-                d = db_to_json(row.json)
-            except ValueError:
-                logger.error("Unable to parse json from event: %s", event_id)
-                continue
-            try:
-                internal_metadata = db_to_json(row.internal_metadata)
-            except ValueError:
-                logger.error(
-                    "Unable to parse internal_metadata from event: %s", event_id
-                )
-                continue
-
-            format_version = row.format_version
-            if format_version is None:
-                # This means that we stored the event before we had the concept
-                # of a event format version, so it must be a V1 event.
-                format_version = EventFormatVersions.ROOM_V1_V2
-
-            room_version_id = row.room_version_id
-
-            room_version: Optional[RoomVersion]
-            if not room_version_id:
-                # this should only happen for out-of-band membership events which
-                # arrived before https://github.com/matrix-org/synapse/issues/6983
-                # landed. For all other events, we should have
-                # an entry in the 'rooms' table.
-                #
-                # However, the 'out_of_band_membership' flag is unreliable for older
-                # invites, so just accept it for all membership events.
-                #
-                if d["type"] != EventTypes.Member:
-                    raise InvalidEventError(
-                        "Room %s for event %s is unknown" % (d["room_id"], event_id)
-                    )
-
-                # so, assuming this is an out-of-band-invite that arrived before
-                # https://github.com/matrix-org/synapse/issues/6983
-                # landed, we know that the room version must be v5 or earlier (because
-                # v6 hadn't been invented at that point, so invites from such rooms
-                # would have been rejected.)
-                #
-                # The main reason we need to know the room version here (other than
-                # choosing the right python Event class) is in case the event later has
-                # to be redacted - and all the room versions up to v5 used the same
-                # redaction algorithm.
-                #
-                # So, the following approximations should be adequate.
-
-                if format_version == EventFormatVersions.ROOM_V1_V2:
-                    # if it's event format v1 then it must be room v1 or v2
-                    room_version = RoomVersions.V1
-                elif format_version == EventFormatVersions.ROOM_V3:
-                    # if it's event format v2 then it must be room v3
-                    room_version = RoomVersions.V3
-                else:
-                    # if it's event format v3 then it must be room v4 or v5
-                    room_version = RoomVersions.V5
-            else:
-                room_version = KNOWN_ROOM_VERSIONS.get(room_version_id)
-                if not room_version:
-                    logger.warning(
-                        "Event %s in room %s has unknown room version %s",
-                        event_id,
-                        d["room_id"],
-                        room_version_id,
-                    )
-                    continue
-
-                if room_version.event_format != format_version:
-                    logger.error(
-                        "Event %s in room %s with version %s has wrong format: "
-                        "expected %s, was %s",
-                        event_id,
-                        d["room_id"],
-                        room_version_id,
-                        room_version.event_format,
-                        format_version,
-                    )
-                    continue
-
-            original_ev = make_event_from_dict(
-                event_dict=d,
-                room_version=room_version,
-                internal_metadata_dict=internal_metadata,
-                rejected_reason=rejected_reason,
-            )
-            original_ev.internal_metadata.stream_ordering = row.stream_ordering
-            original_ev.internal_metadata.outlier = row.outlier
-
-            # Consistency check: if the content of the event has been modified in the
-            # database, then the calculated event ID will not match the event id in the
-            # database.
-            if original_ev.event_id != event_id:
-                # it's difficult to see what to do here. Pretty much all bets are off
-                # if Synapse cannot rely on the consistency of its database.
-                raise RuntimeError(
-                    f"Database corruption: Event {event_id} in room {d['room_id']} "
-                    f"from the database appears to have been modified (calculated "
-                    f"event id {original_ev.event_id})"
-                )
-
-            event_map[event_id] = original_ev
+        for event_id, fetched_event in fetched_events.items():
+            if fetched_event.error is not None:
+                raise fetched_event.error
+            if fetched_event.event is not None:
+                event_map[event_id] = fetched_event.event
 
         # finally, we can decide whether each one needs redacting, and build
         # the cache entries.
         result_map: Dict[str, EventCacheEntry] = {}
         for event_id, original_ev in event_map.items():
-            redactions = fetched_events[event_id].redactions
+            redactions = fetched_events[event_id].row.redactions
             redacted_event = self._maybe_redact_event_row(
                 original_ev, redactions, event_map
             )
@@ -1420,32 +1462,255 @@ class EventsWorkerStore(SQLBaseStore):
 
         return result_map
 
-    async def _enqueue_events(self, events: Collection[str]) -> Dict[str, _EventRow]:
+    def _build_fetched_event(self, row: _EventRow) -> _FetchedEvent:
+        """Build the event from a row pulled from the database.
+
+        This is called on the event fetch threads, so must not touch any state
+        shared with the reactor.
+        """
+        try:
+            event = self._build_event_from_row(row)
+        except Exception as e:
+            # Raise the error to whoever asked for the event, rather than
+            # failing every fetch in the batch.
+            return _FetchedEvent(row=row, event=None, error=e)
+
+        return _FetchedEvent(row=row, event=event)
+
+    def _build_event_from_row(self, row: _EventRow) -> Optional[EventBase]:
+        """Build the event from a row pulled from the database.
+
+        Returns:
+            The event, or None if the row could not be parsed or is for a room
+            of an unknown version.
+
+        Raises:
+            InvalidEventError if the room of the event is unknown.
+            RuntimeError if the event ID doesn't match the event.
+        """
+        event_id = row.event_id
+
+        rejected_reason = row.rejected_reason
+
+        # If the event or metadata cannot be parsed, log the error and act
+        # as if the event is unknown.
+        try:
+            d = db_to_json(row.json)
+        except ValueError:
+            logger.error("Unable to parse json from event: %s", event_id)
+            return None
+        try:
+            internal_metadata = db_to_json(row.internal_metadata)
+        except ValueError:
+            logger.error("Unable to parse internal_metadata from event: %s", event_id)
+            return None
+
+        format_version = row.format_version
+        if format_version is None:
+            # This means that we stored the event before we had the concept
+            # of a event format version, so it must be a V1 event.
+            format_version = EventFormatVersions.ROOM_V1_V2
+
+        room_version_id = row.room_version_id
+
+        room_version: Optional[RoomVersion]
+        if not room_version_id:
+            # this should only happen for out-of-band membership events which
+            # arrived before https://github.com/matrix-org/synapse/issues/6983
+            # landed. For all other events, we should have
+            # an entry in the 'rooms' table.
+            #
+            # However, the 'out_of_band_membership' flag is unreliable for older
+            # invites, so just accept it for all membership events.
+            #
+            if d["type"] != EventTypes.Member:
+                raise InvalidEventError(
+                    "Room %s for event %s is unknown" % (d["room_id"], event_id)
+                )
+
+            # so, assuming this is an out-of-band-invite that arrived before
+            # https://github.com/matrix-org/synapse/issues/6983
+            # landed, we know that the room version must be v5 or earlier (because
+            # v6 hadn't been invented at that point, so invites from such rooms
+            # would have been rejected.)
+            #
+            # The main reason we need to know the room version here (other than
+            # choosing the right python Event class) is in case the event later has
+            # to be redacted - and all the room versions up to v5 used the same
+            # redaction algorithm.
+            #
+            # So, the following approximations should be adequate.
+
+            if format_version == EventFormatVersions.ROOM_V1_V2:
+                # if it's event format v1 then it must be room v1 or v2
+                room_version = RoomVersions.V1
+            elif format_version == EventFormatVersions.ROOM_V3:
+                # if it's event format v2 then it must be room v3
+                room_version = RoomVersions.V3
+            else:
+                # if it's event format v3 then it must be room v4 or v5
+                room_version = RoomVersions.V5
+        else:
+            room_version = KNOWN_ROOM_VERSIONS.get(room_version_id)
+            if not room_version:
+                logger.warning(
+                    "Event %s in room %s has unknown room version %s",
+                    event_id,
+                    d["room_id"],
+                    room_version_id,
+                )
+                return None
+
+            if room_version.event_format != format_version:
+                logger.error(
+                    "Event %s in room %s with version %s has wrong format: "
+                    "expected %s, was %s",
+                    event_id,
+                    d["room_id"],
+                    room_version_id,
+                    room_version.event_format,
+                    format_version,
+                )
+                return None
+
+        original_ev: EventBase
+        if self._compact_events:
+            original_ev = make_compact_event_from_json(
+                event_json=row.json,
+                event_dict=d,
+                room_version=room_version,
+                internal_metadata_dict=internal_metadata,
+                rejected_reason=rejected_reason,
+            )
+        else:
+            original_ev = make_event_from_dict(
+                event_dict=d,
+                room_version=room_version,
+                internal_metadata_dict=internal_metadata,
+                rejected_reason=rejected_reason,
+            )
+        original_ev.internal_metadata.stream_ordering = row.stream_ordering
+        original_ev.internal_metadata.outlier = row.outlier
+
+        # Consistency check: if the content of the event has been modified in the
+        # database, then the calculated event ID will not match the event id in the
+        # database.
+        if original_ev.event_id != event_id:
+            # it's difficult to see what to do here. Pretty much all bets are off
+            # if Synapse cannot rely on the consistency of its database.
+            raise RuntimeError(
+                f"Database corruption: Event {event_id} in room {d['room_id']} "
+                f"from the database appears to have been modified (calculated "
+                f"event id {original_ev.event_id})"
+            )
+
+        return original_ev
+
+    async def _get_event_rows(
+        self, event_ids: Collection[str]
+    ) -> Mapping[str, _FetchedEvent]:
+        """Fetch the rows for the given events from the shared event cache, if
+        enabled, falling back to the database, and build the events from them.
+
+        Rows fetched from the database are added to the shared event cache,
+        unless the event has been invalidated since it was looked up in the
+        shared event cache, in which case the row may be stale.
+
+        Returns:
+            A map from event ID to fetched event. Unknown events are omitted.
+        """
+        if self._shared_event_cache is None:
+            current_context().record_event_fetch(len(event_ids))
+            return await self._enqueue_events(event_ids)
+
+        cached, versions = await self._shared_event_cache.get_many_versioned(
+            SHARED_EVENT_CACHE_NAME, event_ids
+        )
+        cached_rows = {
+            event_id: _EventRow(**value) for event_id, value in cached.items()
+        }
+
+        missing_event_ids = [
+            event_id for event_id in event_ids if event_id not in cached_rows
+        ]
+        current_context().record_event_fetch(len(missing_event_ids))
+
+        # The events are built on the fetch threads, whether or not their rows
+        # were in the shared cache.
+        fetched_map = await self._enqueue_events(missing_event_ids, cached_rows)
+
+        if missing_event_ids:
+            fetched = {
+                event_id: fetched_map[event_id]
+                for event_id in missing_event_ids
+                if event_id in fetched_map
+            }
+            await self._shared_event_cache.set_many_if_unchanged(
+                SHARED_EVENT_CACHE_NAME,
+                {
+                    event_id: attr.asdict(fetched_event.row)
+                    for event_id, fetched_event in fetched.items()
+                },
+                versions,
+                self._shared_event_cache_expiry_ms,
+            )
+
+        return fetched_map
+
+    async def _enqueue_events(
+        self, events: Collection[str], rows: Optional[Mapping[str, _EventRow]] = None
+    ) -> Dict[str, _FetchedEvent]:
         """Fetches events from the database using the _event_fetch_list. This
         allows batch and bulk fetching of events - it allows us to fetch events
         without having to create a new transaction for each request for events.
 
+        Large requests are split up, so that they can be fetched by several
+        fetch threads at once.
+
         Args:
             events: events to be fetched.
+            rows: rows of events which have already been fetched, e.g. from
+                the shared event cache, to be built into events on the fetch
+                threads along with the others.
 
         Returns:
-            A map from event id to row data from the database. May contain events
-            that weren't requested.
+            A map from event id to the event fetched from the database, or
+            built from `rows`.
         """
+        requests: List[Tuple[Collection[str], Mapping[str, _EventRow]]] = [
+            (chunk, {}) for chunk in batch_iter(events, EVENT_QUEUE_MAX_EVENTS)
+        ]
+        if rows:
+            requests.extend(
+                ((), dict(chunk))
+                for chunk in batch_iter(rows.items(), EVENT_QUEUE_MAX_EVENTS)
+            )
+        if not requests:
+            return {}
 
-        events_d: "defer.Deferred[Dict[str, _EventRow]]" = defer.Deferred()
+        deferreds: List["defer.Deferred[Dict[str, _FetchedEvent]]"] = []
         with self._event_fetch_lock:
-            self._event_fetch_list.append((events, events_d))
-            self._event_fetch_lock.notify()
+            for chunk, chunk_rows in requests:
+                events_d: "defer.Deferred[Dict[str, _FetchedEvent]]" = defer.Deferred()
+                self._event_fetch_list.append((chunk, chunk_rows, events_d))
+                deferreds.append(events_d)
+            self._event_fetch_lock.notify(len(deferreds))
 
-        self._maybe_start_fetch_thread()
+        for _ in deferreds:
+            self._maybe_start_fetch_thread()
 
         logger.debug("Loading %d events: %s", len(events), events)
         with PreserveLoggingContext():
-            row_map = await events_d
-        logger.debug("Loaded %d events (%d rows)", len(events), len(row_map))
+            results = await defer.gatherResults(
+                deferreds, consumeErrors=True
+            ).addErrback(unwrapFirstError)
+
+        fetched_map: Dict[str, _FetchedEvent] = {}
+        for result in results:
+            fetched_map.update(result)
+        logger.debug("Loaded %d events (%d rows)", len(events), len(fetched_map))
 
-        return row_map
+        return fetched_map
 
     def _fetch_event_rows(
         self, txn: LoggingTransaction, event_ids: Iterable[str]
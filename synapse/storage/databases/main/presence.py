@@ -49,7 +49,7 @@ from synapse.storage.util.id_generators import (
     StreamIdGenerator,
 )
 from synapse.util.caches.descriptors import cached, cachedList
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 from synapse.util.iterutils import batch_iter
 
 if TYPE_CHECKING:
@@ -117,7 +117,8 @@ class PresenceStore(PresenceBackgroundUpdateStore, CacheInvalidationWorkerStore)
             stream_column="stream_id",
             max_value=self._presence_id_gen.get_current_token(),
         )
-        self.presence_stream_cache = StreamChangeCache(
+        self.presence_stream_cache = create_stream_change_cache(
+            hs,
             "PresenceStreamChangeCache",
             min_presence_val,
             prefilled_cache=presence_cache_prefill,
@@ -380,6 +380,10 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
             # take a while!
             txn.execute("SET LOCAL statement_timeout = 0")
 
+        # Beeper: the events won't be invalidated individually, so drop them
+        # from the shared event cache before we lose track of them.
+        self._invalidate_shared_event_cache_for_room_after_txn(txn, room_id)
+
         # First, fetch all the state groups that should be deleted, before
         # we delete that information.
         txn.execute(
@@ -472,6 +476,8 @@ class PurgeEventsStore(StateGroupWorkerStore, CacheInvalidationWorkerStore):
             "users_who_share_private_rooms",
             # no useful index, but let's clear them anyway
             "appservice_room_list",
+            "beeper_room_previews",
+            "beeper_user_room_previews",
             "e2e_room_keys",
             "event_push_summary",
             "pusher_throttle",
@@ -63,7 +63,7 @@ from synapse.types import JsonDict
 from synapse.util import json_encoder, unwrapFirstError
 from synapse.util.async_helpers import gather_results
 from synapse.util.caches.descriptors import cached, cachedList
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -156,7 +156,8 @@ class PushRulesWorkerStore(
             max_value=self.get_max_push_rules_stream_id(),
         )
 
-        self.push_rules_stream_cache = StreamChangeCache(
+        self.push_rules_stream_cache = create_stream_change_cache(
+            hs,
             "PushRulesStreamChangeCache",
             push_rules_id,
             prefilled_cache=push_rules_prefill,
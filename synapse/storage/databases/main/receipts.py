@@ -59,7 +59,7 @@ from synapse.types import (
 )
 from synapse.util import json_encoder
 from synapse.util.caches.descriptors import cached, cachedList
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from synapse.util.caches.stream_change_cache import create_stream_change_cache
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -121,7 +121,8 @@ class ReceiptsWorkerStore(SQLBaseStore):
             max_value=max_receipts_stream_id.stream,
             limit=10000,
         )
-        self._receipts_stream_cache = StreamChangeCache(
+        self._receipts_stream_cache = create_stream_change_cache(
+            hs,
             "ReceiptsRoomChangeCache",
             min_receipts_stream_id,
             prefilled_cache=receipts_stream_prefill,
@@ -654,6 +655,9 @@ class ReceiptsWorkerStore(SQLBaseStore):
         self._attempt_to_invalidate_cache(
             "get_unread_event_push_actions_by_room_for_user", (room_id,)
         )
+        self._attempt_to_invalidate_cache(
+            "_beeper_get_notification_count_for_room", (room_id, user_id)
+        )
 
     def process_replication_rows(
         self,
@@ -61,6 +61,7 @@ from synapse.storage.database import (
 )
 from synapse.storage.databases.main.cache import CacheInvalidationWorkerStore
 from synapse.storage.engines import PostgresEngine
+from synapse.storage.replicas import replica_safe
 from synapse.storage.types import Cursor
 from synapse.storage.util.id_generators import (
     AbstractStreamIdGenerator,
@@ -333,6 +334,7 @@ class RoomWorkerStore(CacheInvalidationWorkerStore):
 
         return f"({' OR '.join(clauses)})", args
 
+    @replica_safe()
     async def count_public_rooms(
         self,
         network_tuple: Optional[ThirdPartyInstanceID],
@@ -415,6 +417,7 @@ class RoomWorkerStore(CacheInvalidationWorkerStore):
 
         return await self.db_pool.runInteraction("get_rooms", f)
 
+    @replica_safe()
     async def get_largest_public_rooms(
         self,
         network_tuple: Optional[ThirdPartyInstanceID],
@@ -517,7 +517,9 @@ class SearchStore(SearchBackgroundUpdateStore):
         # List of tuples of (rank, room_id, event_id).
         results = cast(
             List[Tuple[Union[int, float], str, str]],
-            await self.db_pool.execute("search_msgs", sql, *args),
+            await self.db_pool.execute(
+                "search_msgs", sql, *args, replica_streams=("events",)
+            ),
         )
 
         results = list(filter(lambda row: row[1] in room_ids, results))
@@ -540,7 +542,12 @@ class SearchStore(SearchBackgroundUpdateStore):
         # List of tuples of (room_id, count).
         count_results = cast(
             List[Tuple[str, int]],
-            await self.db_pool.execute("search_rooms_count", count_sql, *count_args),
+            await self.db_pool.execute(
+                "search_rooms_count",
+                count_sql,
+                *count_args,
+                replica_streams=("events",),
+            ),
         )
 
         count = sum(row[1] for row in count_results if row[0] in room_ids)
@@ -680,7 +687,9 @@ class SearchStore(SearchBackgroundUpdateStore):
         # List of tuples of (rank, room_id, event_id, origin_server_ts, stream_ordering).
         results = cast(
             List[Tuple[Union[int, float], str, str, int, int]],
-            await self.db_pool.execute("search_rooms", sql, *args),
+            await self.db_pool.execute(
+                "search_rooms", sql, *args, replica_streams=("events",)
+            ),
         )
 
         results = list(filter(lambda row: row[1] in room_ids, results))
@@ -703,7 +712,12 @@ class SearchStore(SearchBackgroundUpdateStore):
         # List of tuples of (room_id, count).
         count_results = cast(
             List[Tuple[str, int]],
-            await self.db_pool.execute("search_rooms_count", count_sql, *count_args),
+            await self.db_pool.execute(
+                "search_rooms_count",
+                count_sql,
+                *count_args,
+                replica_streams=("events",),
+            ),
         )
 
         count = sum(row[1] for row in count_results if row[0] in room_ids)
@@ -657,7 +657,7 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
                 values={"id": state_group, "room_id": room_id, "event_id": event_id},
             )
 
-            self.db_pool.simple_insert_many_txn(
+            self.db_pool.simple_copy_many_txn(
                 txn,
                 table="state_groups_state",
                 keys=("state_group", "room_id", "type", "state_key", "event_id"),
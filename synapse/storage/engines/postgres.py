@@ -19,9 +19,24 @@
 #
 #
 
+import itertools
 import logging
-from typing import TYPE_CHECKING, Any, Mapping, NoReturn, Optional, Tuple, cast
+import re
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    Mapping,
+    NoReturn,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+from weakref import WeakKeyDictionary, WeakSet
 
+import psycopg2.errors
 import psycopg2.extensions
 
 from synapse.storage.engines._base import (
@@ -37,6 +52,22 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# The characters which must be escaped in the text format of COPY.
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+# The most statements to keep prepared on each connection. The least recently
+# used statement is deallocated to prepare another.
+_MAX_PREPARED_STATEMENTS = 500
+
+
+class PreparedStatementsInvalidated(psycopg2.OperationalError):
+    """A prepared statement could not be executed as its result type has changed
+    since it was prepared, e.g. by a schema change, which aborts the transaction.
+
+    This is an operational error so that the transaction is retried, and the
+    statements prepared on the connection are deallocated before it is.
+    """
+
 
 class PostgresEngine(
     BaseDatabaseEngine[psycopg2.extensions.connection, psycopg2.extensions.cursor]
@@ -64,6 +95,24 @@ class PostgresEngine(
         )
         self._version: Optional[int] = None  # unknown as yet
 
+        # Statements executed more than this many times are executed as
+        # server-side prepared statements, or None to never prepare them. This
+        # doesn't work through a connection pooler which pools transactions, as
+        # prepared statements belong to a session.
+        self.prepared_statement_threshold: Optional[int] = database_config.get(
+            "prepared_statement_threshold"
+        )
+        # The names of the statements prepared on each connection, least
+        # recently used first.
+        self._prepared_statements: "WeakKeyDictionary[psycopg2.extensions.connection, OrderedDict[str, None]]" = (
+            WeakKeyDictionary()
+        )
+        # The connections whose prepared statements must all be deallocated
+        # before they are used again.
+        self._invalidated_connections: "WeakSet[psycopg2.extensions.connection]" = (
+            WeakSet()
+        )
+
         self.isolation_level_map: Mapping[int, int] = {
             IsolationLevel.READ_COMMITTED: psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED,
             IsolationLevel.REPEATABLE_READ: psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
@@ -161,6 +210,125 @@ class PostgresEngine(
     def convert_param_style(self, sql: str) -> str:
         return sql.replace("?", "%s")
 
+    def execute_prepared(
+        self,
+        cursor: psycopg2.extensions.cursor,
+        name: str,
+        sql: str,
+        parameters: Sequence[Any],
+    ) -> bool:
+        """Execute a statement as a server-side prepared statement, preparing it
+        on the cursor's connection first if needed.
+
+        Args:
+            cursor: The cursor to execute the statement with.
+            name: A name for the statement, derived from the SQL.
+            sql: The statement, with `%s` placeholders and no other `%`.
+            parameters: The values of the placeholders.
+
+        Returns:
+            False if the statement could not be prepared, in which case it has
+            not been executed.
+
+        Raises:
+            PreparedStatementsInvalidated: if the result type of the statement
+                has changed since it was prepared.
+        """
+        conn = cursor.connection
+        if conn in self._invalidated_connections:
+            cursor.execute("DEALLOCATE ALL")
+            self._invalidated_connections.discard(conn)
+            self._prepared_statements.pop(conn, None)
+
+        prepared = self._prepared_statements.get(conn)
+        if prepared is None:
+            prepared = self._prepared_statements[conn] = OrderedDict()
+
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            if len(prepared) >= _MAX_PREPARED_STATEMENTS:
+                evicted, _ = prepared.popitem(last=False)
+                cursor.execute("DEALLOCATE " + evicted)
+
+            params = itertools.count(1)
+            prepare_sql = "PREPARE %s AS %s" % (
+                name,
+                re.sub("%s", lambda _: "$%d" % (next(params),), sql),
+            )
+
+            # A failure to prepare the statement (e.g. because the type of a
+            # parameter can't be inferred) shouldn't fail the transaction.
+            if conn.autocommit:
+                try:
+                    cursor.execute(prepare_sql)
+                except (psycopg2.ProgrammingError, psycopg2.NotSupportedError):
+                    return False
+            else:
+                cursor.execute("SAVEPOINT synapse_prepare")
+                try:
+                    cursor.execute(prepare_sql)
+                except (psycopg2.ProgrammingError, psycopg2.NotSupportedError):
+                    cursor.execute(
+                        "ROLLBACK TO SAVEPOINT synapse_prepare;"
+                        " RELEASE SAVEPOINT synapse_prepare"
+                    )
+                    return False
+                cursor.execute("RELEASE SAVEPOINT synapse_prepare")
+
+            prepared[name] = None
+
+        try:
+            if parameters:
+                cursor.execute(
+                    "EXECUTE %s (%s)" % (name, ", ".join(["%s"] * len(parameters))),
+                    parameters,
+                )
+            else:
+                cursor.execute("EXECUTE " + name)
+        except psycopg2.errors.FeatureNotSupported as e:
+            # "cached plan must not change result type": the statement would
+            # need preparing again, but the transaction has been aborted.
+            self._invalidated_connections.add(conn)
+            raise PreparedStatementsInvalidated(str(e)) from e
+        return True
+
+    @property
+    def supports_copy(self) -> bool:
+        """Can we insert rows with `COPY ... FROM STDIN`?
+
+        psycopg2 doesn't support COPY while a wait callback is set, as it is when
+        running interactions on the reactor.
+        """
+        return psycopg2.extensions.get_wait_callback() is None
+
+    def encode_copy_rows(self, rows: Iterable[Iterable[Any]]) -> Optional[str]:
+        """Encode rows in the text format of `COPY ... FROM STDIN`.
+
+        Returns:
+            The rows, or None if they have a value of a type which can't be
+            encoded, in which case they should be inserted another way.
+        """
+        lines = []
+        for row in rows:
+            fields = []
+            for value in row:
+                if value is None:
+                    fields.append("\\N")
+                elif isinstance(value, str):
+                    fields.append(value.translate(_COPY_ESCAPES))
+                elif isinstance(value, bool):
+                    fields.append("t" if value else "f")
+                elif isinstance(value, (int, float)):
+                    fields.append(str(value))
+                elif isinstance(value, (bytes, memoryview)):
+                    fields.append("\\\\x" + bytes(value).hex())
+                else:
+                    return None
+            lines.append("\t".join(fields))
+        lines.append("")
+        return "\n".join(lines)
+
     def on_new_connection(self, db_conn: "LoggingDatabaseConnection") -> None:
         db_conn.set_isolation_level(self.default_isolation_level)
 
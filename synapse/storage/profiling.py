@@ -0,0 +1,205 @@
+# Beep beep!
+
+"""Profiling of database interactions, to find out which of them are slow.
+
+When enabled for a database with `profile_interactions`, the slowest transaction
+seen for each interaction is kept as a sample, along with the slowest statement
+it executed and that statement's parameters, for the database admin API.
+
+If `explain_threshold_ms` is also set, the slowest statement of a sample slower
+than that is EXPLAINed in the background, and the plan logged and kept with the
+sample, in the same way as Postgres' `auto_explain` module. The parameters of the
+statement are only logged at DEBUG level, on the `synapse.storage.SQL` logger
+along with those of every other statement.
+"""
+
+import logging
+import reprlib
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import attr
+
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.storage.engines import PostgresEngine
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+    from synapse.storage.database import DatabasePool, LoggingTransaction
+
+logger = logging.getLogger(__name__)
+sql_logger = logging.getLogger("synapse.storage.SQL")
+
+# The description of the interactions which EXPLAIN statements, which are never
+# EXPLAINed themselves.
+EXPLAIN_DESC = "explain_slow_interaction"
+
+# Used to describe the parameters of statements, without the cost of
+# stringifying all of a long list of them.
+_params_repr = reprlib.Repr()
+_params_repr.maxlevel = 3
+_params_repr.maxstring = 200
+_params_repr.maxother = 200
+_params_repr.maxlist = 20
+_params_repr.maxtuple = 20
+_params_repr.maxdict = 20
+
+
+@attr.s(slots=True, auto_attribs=True)
+class StatementSample:
+    """The slowest statement executed by a transaction."""
+
+    # The statement, as passed to `execute`.
+    sql: str
+    # The statement on a single line, for logging.
+    one_line_sql: str
+    # The parameters of the statement, or the first batch of them if it was
+    # executed with several.
+    params: Any
+    # How long the statement took, in seconds.
+    duration: float
+    # Whether the statement was executed on its own with `params`, and so can be
+    # EXPLAINed with them.
+    explainable: bool
+
+
+@attr.s(slots=True, auto_attribs=True)
+class InteractionSample:
+    """The slowest transaction seen for an interaction."""
+
+    desc: str
+    # When the transaction finished, in milliseconds since the epoch.
+    ts: int
+    # How long the transaction took, in seconds, including any retries.
+    duration: float
+    # The number of rows returned or affected by its statements.
+    rows: int
+    # Roughly how many bytes of rows were fetched.
+    fetched_bytes: int
+    # The number of statements executed.
+    statements: int
+    # The slowest statement, with a description of its parameters.
+    slowest_sql: Optional[str]
+    slowest_params: Optional[str]
+    slowest_duration: Optional[float]
+    # The query plan of the slowest statement, once it has been EXPLAINed.
+    plan: Optional[List[str]] = None
+
+
+class InteractionProfiler:
+    """Keeps samples of the slowest transaction seen for each interaction on a
+    database.
+
+    Args:
+        hs
+        db_pool: The database the interactions run on.
+        explain_threshold_ms: If given, EXPLAIN the slowest statement of
+            samples that took at least this long.
+    """
+
+    def __init__(
+        self,
+        hs: "HomeServer",
+        db_pool: "DatabasePool",
+        explain_threshold_ms: Optional[int],
+    ):
+        self._reactor = hs.get_reactor()
+        self._db_pool = db_pool
+        self._explain_threshold_ms = explain_threshold_ms
+
+        # Map from interaction description to the slowest transaction seen.
+        # This is updated from the database threads.
+        self._samples: Dict[str, InteractionSample] = {}
+
+    def record(
+        self,
+        desc: str,
+        duration: float,
+        rows: int,
+        fetched_bytes: int,
+        statements: int,
+        slowest_statement: Optional[StatementSample],
+    ) -> None:
+        """Record a transaction, keeping it as the sample for its interaction if
+        it is the slowest yet.
+
+        May be called from any thread.
+        """
+        sample = self._samples.get(desc)
+        if sample is not None and sample.duration >= duration:
+            return
+
+        sample = InteractionSample(
+            desc=desc,
+            ts=int(time.time() * 1000),
+            duration=duration,
+            rows=rows,
+            fetched_bytes=fetched_bytes,
+            statements=statements,
+            slowest_sql=None,
+            slowest_params=None,
+            slowest_duration=None,
+        )
+        if slowest_statement is not None:
+            sample.slowest_sql = slowest_statement.one_line_sql
+            sample.slowest_params = _params_repr.repr(slowest_statement.params)
+            sample.slowest_duration = slowest_statement.duration
+        self._samples[desc] = sample
+
+        if (
+            self._explain_threshold_ms is not None
+            and duration * 1000 >= self._explain_threshold_ms
+            and slowest_statement is not None
+            and slowest_statement.explainable
+            and desc != EXPLAIN_DESC
+        ):
+            self._reactor.callFromThread(
+                run_as_background_process,
+                EXPLAIN_DESC,
+                self._explain,
+                sample,
+                slowest_statement,
+            )
+
+    def get_slowest(self, limit: int) -> List[InteractionSample]:
+        """Get the samples of the slowest interactions, slowest first."""
+        samples = sorted(
+            self._samples.values(), key=lambda sample: sample.duration, reverse=True
+        )
+        return samples[:limit]
+
+    async def _explain(
+        self, sample: InteractionSample, statement: StatementSample
+    ) -> None:
+        try:
+            plan = await self._db_pool.runInteraction(
+                EXPLAIN_DESC, self._explain_txn, statement
+            )
+        except Exception as e:
+            logger.info("Unable to EXPLAIN slow %s: %s", sample.desc, e)
+            return
+
+        sample.plan = plan
+        logger.info(
+            "Slow %s took %.3f sec, the plan of its slowest statement %s (%.3f sec)"
+            " is:\n%s",
+            sample.desc,
+            sample.duration,
+            sample.slowest_sql,
+            statement.duration,
+            "\n".join(plan),
+        )
+        # The parameters may include private data, such as access tokens.
+        sql_logger.debug("[SQL values] {%s} %s", sample.desc, sample.slowest_params)
+
+    def _explain_txn(
+        self, txn: "LoggingTransaction", statement: StatementSample
+    ) -> List[str]:
+        if isinstance(self._db_pool.engine, PostgresEngine):
+            sql = "EXPLAIN " + statement.sql
+        else:
+            sql = "EXPLAIN QUERY PLAN " + statement.sql
+        txn.execute(sql, statement.params)
+
+        # The plan is the only column on postgres, and the last on sqlite.
+        return [str(row[-1]) for row in txn]
@@ -0,0 +1,272 @@
+# Beep beep!
+
+"""Routing of read-only interactions to Postgres streaming replicas.
+
+A replica is only used for an interaction if it has replayed everything that
+this process has seen of the streams the interaction depends on, including
+anything it is still writing to them, so that reads from it are never older
+than the caches they fill.
+
+To know that, the positions of the streams are sampled periodically along with
+the current WAL position of the database. Once a replica has replayed the WAL
+up to the position of a sample, everything written to the streams up to the
+positions in that sample is visible on the replica.
+"""
+
+import collections
+import logging
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    TypeVar,
+)
+
+import attr
+from prometheus_client import Counter
+
+from twisted.enterprise import adbapi
+
+from synapse.metrics.background_process_metrics import wrap_as_background_process
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+    from synapse.storage.database import (
+        DatabasePool,
+        LoggingDatabaseConnection,
+        LoggingTransaction,
+    )
+
+logger = logging.getLogger(__name__)
+
+replica_routing_counter = Counter(
+    "synapse_storage_replica_routing",
+    "Interactions which could run on a read replica, by where they ran",
+    ["desc", "target"],
+)
+
+# The most samples to keep for a replica which is behind. If it falls further
+# behind than this it can only catch up to the later samples.
+_MAX_PENDING_SAMPLES = 1000
+
+F = TypeVar("F", bound=Callable)
+
+# Map from the description of an interaction to the streams it depends on, for
+# interactions marked as safe to run on a replica with `replica_safe`.
+REPLICA_SAFE_INTERACTIONS: Dict[str, FrozenSet[str]] = {}
+
+
+def replica_safe(*streams: str) -> Callable[[F], F]:
+    """Mark the interactions of a store method as safe to run on a read
+    replica, once it has caught up with the given streams.
+
+    The interactions are found by their description, which must be the name of
+    the method, e.g.:
+
+        @cached()
+        @replica_safe("events")
+        async def get_users_in_room(self, room_id: str) -> List[str]:
+            return await self.db_pool.runInteraction(
+                "get_users_in_room", self.get_users_in_room_txn, room_id
+            )
+
+    Args:
+        streams: The names of the streams whose data the method reads, as
+            given to their `MultiWriterIdGenerator`. If none are given the
+            method is happy to read from any replica which isn't too far behind.
+    """
+
+    def decorator(func: F) -> F:
+        REPLICA_SAFE_INTERACTIONS[func.__name__] = frozenset(streams)
+        return func
+
+    return decorator
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _Sample:
+    # The WAL position of the database once the stream positions were read.
+    lsn: int
+    # Map from stream name to the position of each writer to the stream.
+    positions: Mapping[str, Mapping[str, int]]
+    # When the sample was taken.
+    ts: int
+
+
+def _parse_lsn(lsn: str) -> int:
+    """Parse a postgres WAL position, e.g. `16/B374D848`."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class DatabaseReplica:
+    """A read replica of a database, and what it is known to have replayed."""
+
+    def __init__(self, name: str, pool: adbapi.ConnectionPool):
+        self.name = name
+        self.pool = pool
+
+        # Samples taken which the replica hadn't replayed when last checked.
+        self.pending_samples: Deque[_Sample] = collections.deque(
+            maxlen=_MAX_PENDING_SAMPLES
+        )
+        # The latest sample which the replica has replayed.
+        self.replayed: Optional[_Sample] = None
+
+    def is_caught_up(
+        self, positions: Mapping[str, Mapping[str, int]], min_ts: int
+    ) -> bool:
+        """Whether the replica has replayed the given stream positions, and a
+        sample taken no earlier than `min_ts`.
+        """
+        replayed = self.replayed
+        if replayed is None or replayed.ts < min_ts:
+            return False
+
+        for stream_name, writer_positions in positions.items():
+            replayed_positions = replayed.positions.get(stream_name, {})
+            for writer, position in writer_positions.items():
+                if replayed_positions.get(writer, 0) < position:
+                    return False
+
+        return True
+
+
+class DatabaseReplicas:
+    """Tracks the read replicas of a database, and picks one for interactions
+    which are safe to run on a replica.
+    """
+
+    def __init__(
+        self,
+        hs: "HomeServer",
+        db_pool: "DatabasePool",
+        replicas: List[DatabaseReplica],
+        max_lag_ms: int,
+        poll_interval_ms: int,
+    ):
+        self._clock = hs.get_clock()
+        self._db_pool = db_pool
+        self.replicas = replicas
+        self._max_lag_ms = max_lag_ms
+
+        # Map from stream name to a function returning the position of each
+        # writer to the stream.
+        self._streams: Dict[str, Callable[[], Mapping[str, int]]] = {}
+        # Map from stream name to a function returning the position of each
+        # writer to the stream which a replica must have replayed to be used.
+        self._required_positions: Dict[str, Callable[[], Mapping[str, int]]] = {}
+
+        self._next_replica = 0
+
+        if replicas:
+            self._clock.looping_call(self._update_replicas, poll_interval_ms)
+
+    def register_stream(
+        self,
+        stream_name: str,
+        get_positions: Callable[[], Mapping[str, int]],
+        get_required_positions: Optional[Callable[[], Mapping[str, int]]] = None,
+    ) -> None:
+        """Register a stream which interactions can depend on.
+
+        Args:
+            stream_name: The name of the stream.
+            get_positions: A function returning the position of each writer to
+                the stream which this process has seen persisted.
+            get_required_positions: A function returning the position of each
+                writer to the stream which a replica must have replayed before
+                it is used. This must include the positions this process is
+                still writing, as their transactions may have committed and
+                invalidated caches before `get_positions` includes them.
+                Defaults to `get_positions`.
+        """
+        self._streams[stream_name] = get_positions
+        self._required_positions[stream_name] = get_required_positions or get_positions
+
+    def get_replica(self, streams: Collection[str]) -> Optional[DatabaseReplica]:
+        """Pick a replica which has caught up with the given streams, if any."""
+        if not self.replicas:
+            return None
+
+        positions = {}
+        for stream_name in streams:
+            get_positions = self._required_positions.get(stream_name)
+            if get_positions is None:
+                # We can't tell if a replica has caught up with the stream.
+                return None
+            positions[stream_name] = get_positions()
+
+        min_ts = self._clock.time_msec() - self._max_lag_ms
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next_replica]
+            self._next_replica = (self._next_replica + 1) % len(self.replicas)
+            if replica.is_caught_up(positions, min_ts):
+                return replica
+
+        return None
+
+    @wrap_as_background_process("update_replica_positions")
+    async def _update_replicas(self) -> None:
+        # The stream positions must be read before the WAL position, so that
+        # the WAL position includes everything up to them.
+        now = self._clock.time_msec()
+        positions = {
+            stream_name: dict(get_positions())
+            for stream_name, get_positions in self._streams.items()
+        }
+        lsn = await self._db_pool.runInteraction(
+            "get_wal_position", _get_wal_position_txn, db_autocommit=True
+        )
+        sample = _Sample(lsn=_parse_lsn(lsn), positions=positions, ts=now)
+
+        for replica in self.replicas:
+            replica.pending_samples.append(sample)
+            try:
+                replay_lsn = await self._db_pool.runWithConnection(
+                    _get_replay_position, replica=replica
+                )
+            except Exception as e:
+                logger.warning("Failed to check read replica %s: %s", replica.name, e)
+                continue
+
+            if replay_lsn is None:
+                logger.warning(
+                    "Database %s is not a read replica, not using it", replica.name
+                )
+                replica.pending_samples.clear()
+                replica.replayed = None
+                continue
+
+            replayed_lsn = _parse_lsn(replay_lsn)
+            while (
+                replica.pending_samples
+                and replica.pending_samples[0].lsn <= replayed_lsn
+            ):
+                replica.replayed = replica.pending_samples.popleft()
+
+
+def _get_wal_position_txn(txn: "LoggingTransaction") -> str:
+    # The insert position includes WAL which hasn't been written out yet, e.g.
+    # with `synchronous_commit` off.
+    txn.execute("SELECT pg_current_wal_insert_lsn()")
+    row = txn.fetchone()
+    assert row is not None
+    return row[0]
+
+
+def _get_replay_position(conn: "LoggingDatabaseConnection") -> Optional[str]:
+    txn = conn.cursor(txn_name="get_replay_position")
+    try:
+        txn.execute("SELECT pg_last_wal_replay_lsn()")
+        row = txn.fetchone()
+    finally:
+        txn.close()
+    assert row is not None
+    return row[0]
@@ -0,0 +1,4 @@
+-- Partial indexes used to compute room previews directly from the events table.
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+  (8499, 'beeper_events_preview_idx', '{}'),
+  (8499, 'beeper_events_reaction_idx', '{}');
@@ -0,0 +1,32 @@
+-- Materialized inbox previews, maintained by `PersistEventsStore` as events
+-- are persisted so that sync doesn't need to scan `events` to find them.
+
+-- The latest non-edit, non-redacted message/encrypted/sticker event in each
+-- room, along with the latest edit of that event (if any).
+CREATE TABLE beeper_room_previews (
+  room_id               TEXT NOT NULL,
+  event_id              TEXT NOT NULL,
+  event_stream_ordering BIGINT NOT NULL,
+  origin_server_ts      BIGINT NOT NULL,
+  edit_event_id         TEXT,
+  edit_origin_server_ts BIGINT,
+  UNIQUE (room_id)
+);
+
+-- The latest non-redacted reaction to a non-redacted message sent by a local
+-- user, which overrides the room preview for that user if it is more recent.
+CREATE TABLE beeper_user_room_previews (
+  user_id               TEXT NOT NULL,
+  room_id               TEXT NOT NULL,
+  event_id              TEXT NOT NULL,
+  relates_to_id         TEXT NOT NULL,
+  event_stream_ordering BIGINT NOT NULL,
+  origin_server_ts      BIGINT NOT NULL,
+  UNIQUE (user_id, room_id)
+);
+
+CREATE INDEX beeper_user_room_previews_room_id ON beeper_user_room_previews (room_id);
+
+-- Populate the tables for rooms that existed before they were added.
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+  (8499, 'beeper_room_previews_populate', '{}');
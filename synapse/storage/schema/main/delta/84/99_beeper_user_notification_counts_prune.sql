@@ -0,0 +1,4 @@
+-- Deletes notification counts for rooms users have left, tombstoned rooms and
+-- deactivated users.
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+  (8499, 'beeper_user_notification_counts_prune', '{}');
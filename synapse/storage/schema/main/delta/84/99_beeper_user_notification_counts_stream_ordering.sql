@@ -0,0 +1,3 @@
+-- Used by the notification counts aggregation to find rows after its watermark.
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+  (8499, 'beeper_user_notification_counts_stream_ordering_idx', '{}');
@@ -467,6 +467,13 @@ class MultiWriterIdGenerator(AbstractStreamIdGenerator):
             # position with the current minimum.
             self._current_positions[self._instance_name] = self._persisted_upto_position
 
+        # Interactions which depend on the stream can run on read replicas
+        # which have caught up with it.
+        if positive:
+            db.replicas.register_stream(
+                stream_name, self.get_positions, self.get_allocated_positions
+            )
+
     def _load_current_ids(
         self,
         db_conn: LoggingDatabaseConnection,
@@ -819,6 +826,30 @@ class MultiWriterIdGenerator(AbstractStreamIdGenerator):
                 for name, i in self._current_positions.items()
             }
 
+    def get_allocated_positions(self) -> Dict[str, int]:
+        """Get a copy of the current position map, with the position of this
+        instance replaced by the largest ID it has allocated, if that is ahead.
+
+        Unlike the current position, this includes IDs which are still being
+        persisted, and IDs which have been persisted but are ahead of the
+        current position because smaller IDs are still being persisted.
+        """
+
+        with self._lock:
+            positions = dict(self._current_positions)
+
+            local_ids = [
+                positions.get(self._instance_name, self._persisted_upto_position)
+            ]
+            if self._unfinished_ids:
+                local_ids.append(self._unfinished_ids[-1])
+            if self._finished_ids:
+                local_ids.append(max(self._finished_ids))
+            if len(local_ids) > 1:
+                positions[self._instance_name] = max(local_ids)
+
+            return {name: self._return_factor * i for name, i in positions.items()}
+
     def advance(self, instance_name: str, new_id: int) -> None:
         new_id *= self._return_factor
 
@@ -167,9 +167,9 @@ class CacheMetric:
                 if max_size:
                     cache_max_size.labels(self._cache_name).set(max_size)
 
-                if TRACK_MEMORY_USAGE:
+                if TRACK_MEMORY_USAGE or self.memory_usage is not None:
                     # self.memory_usage can be None if nothing has been inserted
-                    # into the cache yet.
+                    # into the cache yet, or if it isn't in a memory budget.
                     cache_memory_usage.labels(self._cache_name).set(
                         self.memory_usage or 0
                     )
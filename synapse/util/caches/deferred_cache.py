@@ -44,6 +44,7 @@ from twisted.internet import defer
 from twisted.python.failure import Failure
 
 from synapse.util.async_helpers import ObservableDeferred
+from synapse.util.caches import trace
 from synapse.util.caches.lrucache import LruCache
 from synapse.util.caches.treecache import TreeCache, iterate_tree_cache_entry
 
@@ -175,6 +176,8 @@ class DeferredCache(Generic[KT, VT]):
                 m = self.cache.metrics
                 assert m  # we always have a name, so should always have metrics
                 m.inc_hits()
+                if self.cache.trace_recorder is not None:
+                    self.cache.trace_recorder.record(trace.HIT, key)
             return val.deferred(key)
 
         callbacks = (callback,) if callback else ()
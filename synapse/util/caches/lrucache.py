@@ -35,6 +35,7 @@ from typing import (
     Iterable,
     List,
     Optional,
+    Set,
     Tuple,
     Type,
     TypeVar,
@@ -52,7 +53,14 @@ from synapse.config import cache as cache_config
 from synapse.metrics.background_process_metrics import wrap_as_background_process
 from synapse.metrics.jemalloc import get_jemalloc_stats
 from synapse.util import Clock, caches
-from synapse.util.caches import CacheMetric, EvictionReason, register_cache
+from synapse.util.caches import CacheMetric, EvictionReason, register_cache, trace
+from synapse.util.caches.memory_budget import (
+    MemoryBudget,
+    estimate_size,
+    get_memory_budget,
+)
+from synapse.util.caches.tinylfu import FrequencySketch
+from synapse.util.caches.trace import CacheTraceRecorder, get_trace_recorder
 from synapse.util.caches.treecache import (
     TreeCache,
     iterate_tree_cache_entry,
@@ -264,6 +272,7 @@ class _Node(Generic[KT, VT]):
         clock: Clock,
         callbacks: Collection[Callable[[], None]] = (),
         prune_unread_entries: bool = True,
+        estimate_memory: bool = False,
     ):
         self._list_node = ListNode.insert_after(self, root)
         self._global_list_node: Optional[_TimedListNode] = None
@@ -306,6 +315,19 @@ class _Node(Generic[KT, VT]):
             if self._global_list_node:
                 self.memory += _get_size_of(self._global_list_node, recurse=False)
                 self.memory += _get_size_of(self._global_list_node.last_access_ts_secs)
+        elif estimate_memory:
+            self.memory = self.estimate_memory()
+
+    def estimate_memory(self) -> int:
+        """Cheaply estimate the memory used by this node, for caches with a
+        memory budget.
+        """
+        return (
+            estimate_size(self.key)
+            + estimate_size(self.value)
+            + _NODE_OVERHEAD
+            + (_NODE_OVERHEAD if self._global_list_node else 0)
+        )
 
     def add_callbacks(self, callbacks: Collection[Callable[[], None]]) -> None:
         """Add to stored list of callbacks, removing duplicates."""
@@ -362,6 +384,17 @@ class _Node(Generic[KT, VT]):
             self._global_list_node.move_after(GLOBAL_ROOT)
             self._global_list_node.update_last_access(clock)
 
+    def move_to_list(self, cache_list_root: ListNode) -> None:
+        """Moves this node to the front of the given cache list, without
+        counting as an access.
+        """
+        self._list_node.move_after(cache_list_root)
+
+
+# The approximate size of a `_Node` and `ListNode`, not including the key and
+# value.
+_NODE_OVERHEAD = 200
+
 
 class _Sentinel(Enum):
     # defining a sentinel in this way allows mypy to correctly handle the
@@ -442,6 +475,25 @@ class LruCache(Generic[KT, VT]):
         # do yet when we get resized.
         self._on_resize: Optional[Callable[[], None]] = None
 
+        # The memory budget this cache shares with other caches, if any, and the
+        # estimated size in bytes of its entries. `memory_bytes` is only
+        # maintained if we have a budget or are tracking memory usage.
+        self._cache_name = cache_name
+        self._memory_budget: Optional[MemoryBudget] = None
+        self._set_memory_budget: Optional[
+            Callable[[Optional[MemoryBudget]], None]
+        ] = None
+        self.memory_bytes = 0
+
+        # The frequency sketch used by the "tinylfu" policy, if this cache uses
+        # it. See `evict`.
+        self._sketch: Optional[FrequencySketch] = None
+        self._set_policy: Optional[Callable[[str], None]] = None
+
+        # Records a trace of lookups of this cache, if configured to. See
+        # `synapse.util.caches.trace`.
+        self.trace_recorder: Optional[CacheTraceRecorder] = None
+
         if cache_name is not None:
             metrics: Optional[CacheMetric] = register_cache(
                 "lru_cache",
@@ -461,27 +513,93 @@ class LruCache(Generic[KT, VT]):
 
         list_root = ListNode[_Node[KT, VT]].create_root_node()
 
+        # With the "tinylfu" policy, new entries are added to the front of a
+        # small "window" list rather than the main list. `window_nodes` holds
+        # the nodes in the window, and `window_len` their total size.
+        window_root = ListNode[_Node[KT, VT]].create_root_node()
+        window_nodes: Set[_Node[KT, VT]] = set()
+        window_len = [0]
+
         lock = threading.Lock()
 
+        def oldest_node(root: ListNode[_Node[KT, VT]]) -> Optional[_Node[KT, VT]]:
+            # Get the last node in the list (i.e. the oldest node).
+            last = root.prev_node
+
+            # The list root should always have a valid `prev_node`, which is
+            # the root itself if the list is empty.
+            assert last is not None
+            if last is root:
+                return None
+
+            # The node should always have a reference to a cache entry, as
+            # we only drop the cache entry when we remove the node from the
+            # list.
+            node = last.get_cache_entry()
+            assert node is not None
+            return node
+
+        def evict_node(node: _Node[KT, VT]) -> None:
+            evicted_len = delete_node(node)
+            cache.pop(node.key, None)
+            if metrics:
+                metrics.inc_evictions(EvictionReason.size, evicted_len)
+            if self.trace_recorder is not None:
+                self.trace_recorder.record(trace.EVICT, node.key)
+
+        def delete_oldest_node() -> bool:
+            """Evict the least recently used entry, returning False if the cache
+            is empty.
+            """
+            node = oldest_node(list_root)
+            if node is None:
+                node = oldest_node(window_root)
+            if node is None:
+                return False
+
+            evict_node(node)
+            return True
+
         def evict() -> None:
-            while cache_len() > self.max_size:
-                # Get the last node in the list (i.e. the oldest node).
-                todelete = list_root.prev_node
+            sketch = self._sketch
+            if sketch is not None:
+                # Move the entries which have fallen out of the window to the
+                # main list. If the cache is full, each of them either replaces
+                # the oldest entry in the main list, or is evicted itself,
+                # depending on which has been used more often recently. This
+                # stops one-off scans from flushing out frequently used entries.
+                window_max_size = max(1, self.max_size // 100)
+                while window_len[0] > window_max_size:
+                    candidate = oldest_node(window_root)
+                    assert candidate is not None
+
+                    window_nodes.remove(candidate)
+                    window_len[0] -= (
+                        size_callback(candidate.value) if size_callback else 1
+                    )
+                    candidate.move_to_list(list_root)
+
+                    if cache_len() <= self.max_size:
+                        continue
+
+                    victim = oldest_node(list_root)
+                    assert victim is not None
+                    if victim is not candidate and sketch.frequency(
+                        candidate.key
+                    ) > sketch.frequency(victim.key):
+                        evict_node(victim)
+                    else:
+                        evict_node(candidate)
 
-                # The list root should always have a valid `prev_node` if the
-                # cache is not empty.
-                assert todelete is not None
+            while cache_len() > self.max_size:
+                delete_oldest_node()
 
-                # The node should always have a reference to a cache entry, as
-                # we only drop the cache entry when we remove the node from the
-                # list.
-                node = todelete.get_cache_entry()
-                assert node is not None
+        def on_resize() -> None:
+            sketch = self._sketch
+            if sketch is not None:
+                sketch.resize(self.max_size)
 
-                evicted_len = delete_node(node)
-                cache.pop(node.key, None)
-                if metrics:
-                    metrics.inc_evictions(EvictionReason.size, evicted_len)
+            evict()
 
         def synchronized(f: FT) -> FT:
             @wraps(f)
@@ -507,25 +625,36 @@ class LruCache(Generic[KT, VT]):
         def add_node(
             key: KT, value: VT, callbacks: Collection[Callable[[], None]] = ()
         ) -> None:
+            in_window = self._sketch is not None
             node: _Node[KT, VT] = _Node(
-                list_root,
+                window_root if in_window else list_root,
                 key,
                 value,
                 weak_ref_to_self,
                 real_clock,
                 callbacks,
                 prune_unread_entries,
+                estimate_memory=self._memory_budget is not None,
             )
             cache[key] = node
 
             if size_callback:
                 cached_cache_len[0] += size_callback(node.value)
 
-            if caches.TRACK_MEMORY_USAGE and metrics:
-                metrics.inc_memory_usage(node.memory)
+            if in_window:
+                window_nodes.add(node)
+                window_len[0] += size_callback(node.value) if size_callback else 1
+
+            if node.memory:
+                self.memory_bytes += node.memory
+                if metrics:
+                    metrics.inc_memory_usage(node.memory)
 
         def move_node_to_front(node: _Node[KT, VT]) -> None:
-            node.move_to_front(real_clock, list_root)
+            if window_nodes and node in window_nodes:
+                node.move_to_front(real_clock, window_root)
+            else:
+                node.move_to_front(real_clock, list_root)
 
         def delete_node(node: _Node[KT, VT]) -> int:
             node.drop_from_lists()
@@ -535,13 +664,26 @@ class LruCache(Generic[KT, VT]):
                 deleted_len = size_callback(node.value)
                 cached_cache_len[0] -= deleted_len
 
+            if window_nodes and node in window_nodes:
+                window_nodes.remove(node)
+                window_len[0] -= deleted_len
+
             node.run_and_clear_callbacks()
 
-            if caches.TRACK_MEMORY_USAGE and metrics:
-                metrics.dec_memory_usage(node.memory)
+            if node.memory:
+                self.memory_bytes -= node.memory
+                if metrics:
+                    metrics.dec_memory_usage(node.memory)
 
             return deleted_len
 
+        def update_node_memory(node: _Node[KT, VT]) -> None:
+            old_memory = node.memory
+            node.memory = node.estimate_memory()
+            self.memory_bytes += node.memory - old_memory
+            if metrics:
+                metrics.inc_memory_usage(node.memory - old_memory)
+
         @overload
         def cache_get(
             key: KT,
@@ -585,6 +727,9 @@ class LruCache(Generic[KT, VT]):
                     to False if this fetch should *not* prevent a node from
                     being expired.
             """
+            if self._sketch is not None:
+                self._sketch.increment(key)
+
             node = cache.get(key, None)
             if node is not None:
                 if update_last_access:
@@ -592,10 +737,14 @@ class LruCache(Generic[KT, VT]):
                 node.add_callbacks(callbacks)
                 if update_metrics and metrics:
                     metrics.inc_hits()
+                if update_metrics and self.trace_recorder is not None:
+                    self.trace_recorder.record(trace.HIT, key)
                 return node.value
             else:
                 if update_metrics and metrics:
                     metrics.inc_misses()
+                if update_metrics and self.trace_recorder is not None:
+                    self.trace_recorder.record(trace.MISS, key)
                 return default
 
         @overload
@@ -658,9 +807,12 @@ class LruCache(Generic[KT, VT]):
                 return default
 
         @synchronized
-        def cache_set(
+        def _cache_set(
             key: KT, value: VT, callbacks: Collection[Callable[[], None]] = ()
         ) -> None:
+            if self._sketch is not None:
+                self._sketch.increment(key)
+
             node = cache.get(key, None)
             if node is not None:
                 # We sometimes store large objects, e.g. dicts, which cause
@@ -677,17 +829,35 @@ class LruCache(Generic[KT, VT]):
                     cached_cache_len[0] -= size_callback(node.value)
                     cached_cache_len[0] += size_callback(value)
 
+                    if window_nodes and node in window_nodes:
+                        window_len[0] -= size_callback(node.value)
+                        window_len[0] += size_callback(value)
+
                 node.add_callbacks(callbacks)
 
                 move_node_to_front(node)
                 node.value = value
+
+                if self._memory_budget is not None:
+                    update_node_memory(node)
             else:
                 add_node(key, value, set(callbacks))
 
             evict()
 
+        def cache_set(
+            key: KT, value: VT, callbacks: Collection[Callable[[], None]] = ()
+        ) -> None:
+            _cache_set(key, value, callbacks)
+
+            # This may evict from other caches, so must be done without holding
+            # our lock.
+            memory_budget = self._memory_budget
+            if memory_budget is not None:
+                memory_budget.evict()
+
         @synchronized
-        def cache_set_default(key: KT, value: VT) -> VT:
+        def _cache_set_default(key: KT, value: VT) -> VT:
             node = cache.get(key, None)
             if node is not None:
                 return node.value
@@ -696,6 +866,15 @@ class LruCache(Generic[KT, VT]):
                 evict()
                 return value
 
+        def cache_set_default(key: KT, value: VT) -> VT:
+            result = _cache_set_default(key, value)
+
+            memory_budget = self._memory_budget
+            if memory_budget is not None:
+                memory_budget.evict()
+
+            return result
+
         @overload
         def cache_pop(key: KT, default: Literal[None] = None) -> Optional[VT]:
             ...
@@ -712,6 +891,8 @@ class LruCache(Generic[KT, VT]):
                 cache.pop(node.key, None)
                 if metrics:
                     metrics.inc_evictions(EvictionReason.invalidation, evicted_len)
+                if self.trace_recorder is not None:
+                    self.trace_recorder.record(trace.INVALIDATE, node.key)
                 return node.value
             else:
                 return default
@@ -734,6 +915,8 @@ class LruCache(Generic[KT, VT]):
             # and run its callbacks.
             for leaf in iterate_tree_cache_entry(popped):
                 delete_node(leaf)
+                if self.trace_recorder is not None:
+                    self.trace_recorder.record(trace.INVALIDATE, leaf.key)
 
         @synchronized
         def cache_clear() -> None:
@@ -743,20 +926,72 @@ class LruCache(Generic[KT, VT]):
 
             assert list_root.next_node == list_root
             assert list_root.prev_node == list_root
+            assert window_root.next_node == window_root
+
+            window_nodes.clear()
+            window_len[0] = 0
 
             cache.clear()
             if size_callback:
                 cached_cache_len[0] = 0
 
-            if caches.TRACK_MEMORY_USAGE and metrics:
+            self.memory_bytes = 0
+            if metrics:
                 metrics.clear_memory_usage()
 
+            if self.trace_recorder is not None:
+                self.trace_recorder.record_clear()
+
         @synchronized
         def cache_contains(key: KT) -> bool:
             return key in cache
 
+        @synchronized
+        def evict_oldest() -> bool:
+            """Evict the least recently used entry, returning False if the cache
+            is empty.
+            """
+            return delete_oldest_node()
+
+        @synchronized
+        def set_memory_budget(memory_budget: Optional[MemoryBudget]) -> None:
+            if self._memory_budget is not None:
+                self._memory_budget.remove_cache(self)
+
+            self._memory_budget = memory_budget
+            if memory_budget is None:
+                return
+
+            memory_budget.add_cache(self)
+
+            # Estimate the size of any entries added before we had a budget.
+            for node in cache.values():
+                if not node.memory:
+                    node.memory = node.estimate_memory()
+                    self.memory_bytes += node.memory
+                    if metrics:
+                        metrics.inc_memory_usage(node.memory)
+
+        @synchronized
+        def set_policy(policy: str) -> None:
+            if policy == "tinylfu":
+                if self._sketch is None:
+                    self._sketch = FrequencySketch(self.max_size)
+                return
+
+            self._sketch = None
+
+            # Move everything in the window to the main list, oldest first.
+            node = oldest_node(window_root)
+            while node is not None:
+                node.move_to_list(list_root)
+                node = oldest_node(window_root)
+
+            window_nodes.clear()
+            window_len[0] = 0
+
         # make sure that we clear out any excess entries after we get resized.
-        self._on_resize = evict
+        self._on_resize = on_resize
 
         self.get = cache_get
         self.set = cache_set
@@ -771,6 +1006,11 @@ class LruCache(Generic[KT, VT]):
         self.len = synchronized(cache_len)
         self.contains = cache_contains
         self.clear = cache_clear
+        self.evict_oldest = evict_oldest
+
+        self._set_memory_budget = set_memory_budget
+        self._set_policy = set_policy
+        self._apply_cache_config()
 
     def __getitem__(self, key: KT) -> VT:
         result = self.get(key, _Sentinel.sentinel)
@@ -800,14 +1040,38 @@ class LruCache(Generic[KT, VT]):
         This will trigger a resize if it changes, which may require evicting
         items from the cache.
         """
-        if not self.apply_cache_factor_from_config:
+        if self.apply_cache_factor_from_config:
+            new_size = int(self._original_max_size * factor)
+            if new_size != self.max_size:
+                self.max_size = new_size
+                if self._on_resize:
+                    self._on_resize()
+
+        self._apply_cache_config()
+
+    def _apply_cache_config(self) -> None:
+        """Apply the eviction policy, memory budget and access tracing given for
+        this cache in the config, if any.
+        """
+        if (
+            self._cache_name is None
+            or self._set_memory_budget is None
+            or self._set_policy is None
+        ):
+            # Either we can't be configured, or we're still being initialised.
             return
 
-        new_size = int(self._original_max_size * factor)
-        if new_size != self.max_size:
-            self.max_size = new_size
-            if self._on_resize:
-                self._on_resize()
+        self._set_policy(cache_config.get_cache_policy(self._cache_name))
+
+        group = cache_config.get_memory_budget_group(self._cache_name)
+        memory_budget = get_memory_budget(group) if group is not None else None
+        if memory_budget is not self._memory_budget:
+            self._set_memory_budget(memory_budget)
+
+        if memory_budget is not None:
+            memory_budget.evict()
+
+        self.trace_recorder = get_trace_recorder(self._cache_name, self.max_size)
 
     def __del__(self) -> None:
         # We're about to be deleted, so we make sure to clear up all the nodes
@@ -0,0 +1,180 @@
+# Beep beep!
+
+"""Support for bounding groups of `LruCache`s by the estimated size of their
+entries in bytes, rather than just by their number of entries.
+
+Caches are put in a group by the `caches.memory_budgets` config option. Each
+group has a single budget, shared between the caches in it: when the entries
+of all the caches in the group add up to more than the budget, entries are
+evicted from the least recently used end of whichever cache is using the most.
+"""
+
+import sys
+import weakref
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+from synapse.config import cache as cache_config
+from synapse.metrics import LaterGauge
+
+if TYPE_CHECKING:
+    from synapse.util.caches.lrucache import LruCache
+
+# When estimating the size of a collection we only look at this many of its
+# items, and scale up by the number of items in it.
+_SAMPLE_SIZE = 8
+
+# How deep to look into nested objects, and the maximum number of objects to
+# look at, when estimating the size of a single value.
+_MAX_DEPTH = 6
+_MAX_OBJECTS = 256
+
+# Types whose size doesn't depend on anything they reference.
+_LEAF_TYPES = (str, bytes, int, float, bool, type(None), type)
+
+# Map from type to the names of the slots of it and its base classes.
+_slots_by_type: Dict[type, Tuple[str, ...]] = {}
+
+
+def _get_slots(cls: type) -> Tuple[str, ...]:
+    slots = _slots_by_type.get(cls)
+    if slots is None:
+        names: List[str] = []
+        for klass in cls.__mro__:
+            klass_slots = klass.__dict__.get("__slots__", ())
+            if isinstance(klass_slots, str):
+                klass_slots = (klass_slots,)
+            names.extend(s for s in klass_slots if s not in ("__dict__", "__weakref__"))
+        slots = _slots_by_type[cls] = tuple(names)
+    return slots
+
+
+def estimate_size(val: Any) -> int:
+    """Cheaply estimate the size in bytes of an object and everything it
+    references.
+
+    Unlike `pympler`, this doesn't look at every object referenced: only a
+    sample of the items in each collection are sized and the result scaled up,
+    and it gives up looking deeper after a fixed number of objects. Objects
+    referenced more than once are counted each time.
+    """
+    remaining = [_MAX_OBJECTS]
+    return _estimate_size(val, _MAX_DEPTH, remaining)
+
+
+def _estimate_size(val: Any, depth: int, remaining: List[int]) -> int:
+    size = sys.getsizeof(val)
+
+    remaining[0] -= 1
+    if depth == 0 or remaining[0] <= 0 or isinstance(val, _LEAF_TYPES):
+        return size
+
+    if isinstance(val, Mapping):
+        count = len(val)
+        sampled = 0
+        items_size = 0
+        for k, v in val.items():
+            items_size += _estimate_size(k, depth - 1, remaining)
+            items_size += _estimate_size(v, depth - 1, remaining)
+            sampled += 1
+            if sampled >= _SAMPLE_SIZE or remaining[0] <= 0:
+                break
+        if sampled:
+            size += items_size * count // sampled
+        return size
+
+    if isinstance(val, (list, tuple, set, frozenset)):
+        count = len(val)
+        sampled = 0
+        items_size = 0
+        for item in val:
+            items_size += _estimate_size(item, depth - 1, remaining)
+            sampled += 1
+            if sampled >= _SAMPLE_SIZE or remaining[0] <= 0:
+                break
+        if sampled:
+            size += items_size * count // sampled
+        return size
+
+    attrs = getattr(val, "__dict__", None)
+    if attrs is not None:
+        size += _estimate_size(attrs, depth - 1, remaining)
+
+    for slot in _get_slots(type(val)):
+        attr = getattr(val, slot, None)
+        if attr is not None:
+            size += _estimate_size(attr, depth - 1, remaining)
+
+    return size
+
+
+class MemoryBudget:
+    """A budget in bytes, shared between a group of `LruCache`s.
+
+    The size of the budget comes from the cache config, so that it can be
+    changed when the config is reloaded.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._caches: "weakref.WeakSet[LruCache]" = weakref.WeakSet()
+
+    @property
+    def max_bytes(self) -> int:
+        return cache_config.properties.memory_budgets.get(self.name, 0)
+
+    def add_cache(self, cache: "LruCache") -> None:
+        self._caches.add(cache)
+
+    def remove_cache(self, cache: "LruCache") -> None:
+        self._caches.discard(cache)
+
+    def total_bytes(self) -> int:
+        """The estimated size of the entries of all the caches in the group."""
+        return sum(cache.memory_bytes for cache in list(self._caches))
+
+    def evict(self) -> None:
+        """Evict entries from the caches in the group until they fit in the
+        budget.
+
+        Must not be called with the lock of any of the caches held.
+        """
+        max_bytes = self.max_bytes
+        if not max_bytes:
+            return
+
+        while True:
+            caches = list(self._caches)
+            if sum(cache.memory_bytes for cache in caches) <= max_bytes:
+                return
+
+            largest = max(caches, key=lambda cache: cache.memory_bytes)
+            if not largest.evict_oldest():
+                return
+
+
+# Map from group name to budget.
+_budgets: Dict[str, MemoryBudget] = {}
+
+
+def get_memory_budget(name: str) -> MemoryBudget:
+    """Get the budget for the named group of caches, creating it if needed."""
+    budget = _budgets.get(name)
+    if budget is None:
+        budget = _budgets[name] = MemoryBudget(name)
+    return budget
+
+
+LaterGauge(
+    "synapse_util_caches_memory_budget_bytes",
+    "Estimated size of the entries of each group of caches sharing a memory budget",
+    ["group"],
+    lambda: {(name,): budget.total_bytes() for name, budget in _budgets.items()},
+)
+
+LaterGauge(
+    "synapse_util_caches_memory_budget_max_bytes",
+    "The memory budget of each group of caches",
+    ["group"],
+    lambda: {(name,): budget.max_bytes for name, budget in _budgets.items()},
+)
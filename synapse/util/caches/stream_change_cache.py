@@ -19,15 +19,31 @@
 #
 #
 
+import bisect
 import logging
 import math
-from typing import Collection, Dict, FrozenSet, List, Mapping, Optional, Set, Union
+import sys
+from array import array
+from typing import (
+    TYPE_CHECKING,
+    Collection,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Union,
+)
 
 import attr
 from sortedcontainers import SortedDict
 
 from synapse.util import caches
 
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
 logger = logging.getLogger(__name__)
 
 # for now, assume all entities in the cache are strings
@@ -321,3 +337,182 @@ class StreamChangeCache:
             the earliest known stream position if the entitiy is unknown.
         """
         return self._entity_to_key.get(entity, self._earliest_known_stream_pos)
+
+
+# How many evicted or superseded entries a `CompactStreamChangeCache` keeps
+# before it considers compacting its arrays.
+_MIN_COMPACT_WASTE = 1024
+
+
+class CompactStreamChangeCache(StreamChangeCache):
+    """A `StreamChangeCache` using less memory, with faster eviction.
+
+    Rather than a sorted map of stream position to a set of entities, this
+    keeps two parallel arrays of every change in stream order: a packed array
+    of stream positions, and a list of (interned) entities. When an entity
+    changes again its earlier entry is replaced with `None`, and evicting the
+    earliest changes just moves the start of the arrays along. The arrays are
+    compacted once at least half of them is unused.
+
+    Unlike `StreamChangeCache`, `max_size` limits the number of entities
+    rather than the number of distinct stream positions.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        current_stream_pos: int,
+        max_size: int = 10000,
+        prefilled_cache: Optional[Mapping[EntityType, int]] = None,
+    ) -> None:
+        # None of the data structures of `StreamChangeCache` are used, so we
+        # don't call its `__init__`.
+        self._original_max_size = max_size
+        self._max_size = math.floor(max_size)
+
+        # The stream position and entity of each change, in stream order.
+        # Entries before `_start` have been evicted, and the entity of an entry
+        # is `None` if the entity has changed again since.
+        self._positions = array("q")
+        self._entities: List[Optional[EntityType]] = []
+        self._start = 0
+        # The number of entries after `_start` whose entity is `None`.
+        self._superseded = 0
+
+        # map from entity to the stream ID of the latest change for that entity.
+        self._entity_to_key: Dict[EntityType, int] = {}
+
+        self._earliest_known_stream_pos = current_stream_pos
+
+        self.name = name
+        self.metrics = caches.register_cache(
+            "cache", self.name, self, resize_callback=self.set_cache_factor
+        )
+
+        if prefilled_cache:
+            # Add the changes in order, so that they are appended to the arrays.
+            for entity, stream_pos in sorted(
+                prefilled_cache.items(), key=lambda item: item[1]
+            ):
+                self.entity_has_changed(entity, stream_pos)
+
+    def __len__(self) -> int:
+        return len(self._entity_to_key)
+
+    def has_any_entity_changed(self, stream_pos: int) -> bool:
+        assert isinstance(stream_pos, int)
+
+        if stream_pos <= self._earliest_known_stream_pos:
+            self.metrics.inc_misses()
+            return True
+
+        if not self._entity_to_key:
+            self.metrics.inc_misses()
+            return False
+
+        # Entities only ever move to later positions, so the last entry is
+        # never superseded.
+        self.metrics.inc_hits()
+        return stream_pos < self._positions[-1]
+
+    def get_all_entities_changed(self, stream_pos: int) -> AllEntitiesChangedResult:
+        assert isinstance(stream_pos, int)
+
+        if stream_pos <= self._earliest_known_stream_pos:
+            return AllEntitiesChangedResult(None)
+
+        index = bisect.bisect_right(self._positions, stream_pos, self._start)
+        return AllEntitiesChangedResult(
+            [entity for entity in self._entities[index:] if entity is not None]
+        )
+
+    def entity_has_changed(self, entity: EntityType, stream_pos: int) -> None:
+        assert isinstance(stream_pos, int)
+
+        if stream_pos <= self._earliest_known_stream_pos:
+            return
+
+        positions = self._positions
+        entities = self._entities
+
+        old_pos = self._entity_to_key.get(entity, None)
+        if old_pos is not None:
+            if old_pos >= stream_pos:
+                # nothing to do
+                return
+
+            # Mark the earlier change as superseded.
+            start = bisect.bisect_left(positions, old_pos, self._start)
+            end = bisect.bisect_right(positions, old_pos, start)
+            entities[entities.index(entity, start, end)] = None
+            self._superseded += 1
+
+        entity = sys.intern(entity)
+
+        if len(positions) == self._start or stream_pos >= positions[-1]:
+            positions.append(stream_pos)
+            entities.append(entity)
+        else:
+            # Changes are occasionally reported out of order.
+            index = bisect.bisect_right(positions, stream_pos, self._start)
+            positions.insert(index, stream_pos)
+            entities.insert(index, entity)
+
+        self._entity_to_key[entity] = stream_pos
+        self._evict()
+
+    def _evict(self) -> None:
+        positions = self._positions
+        entities = self._entities
+
+        while len(self._entity_to_key) > self._max_size:
+            stream_pos = positions[self._start]
+            entity = entities[self._start]
+            self._start += 1
+
+            if entity is None:
+                self._superseded -= 1
+                continue
+
+            del self._entity_to_key[entity]
+            self._earliest_known_stream_pos = max(
+                stream_pos, self._earliest_known_stream_pos
+            )
+
+        unused = self._start + self._superseded
+        if unused >= _MIN_COMPACT_WASTE and unused * 2 >= len(positions):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Drop the evicted and superseded entries from the arrays."""
+        start = self._start
+        live = [
+            (stream_pos, entity)
+            for stream_pos, entity in zip(
+                self._positions[start:], self._entities[start:]
+            )
+            if entity is not None
+        ]
+
+        self._positions = array("q", (stream_pos for stream_pos, _ in live))
+        self._entities = [entity for _, entity in live]
+        self._start = 0
+        self._superseded = 0
+
+
+def create_stream_change_cache(
+    hs: "HomeServer",
+    name: str,
+    current_stream_pos: int,
+    max_size: int = 10000,
+    prefilled_cache: Optional[Mapping[EntityType, int]] = None,
+) -> StreamChangeCache:
+    """Create a `StreamChangeCache`, using the compact implementation if it is
+    enabled in the config.
+    """
+    if hs.config.experimental.beeper_compact_stream_change_cache:
+        return CompactStreamChangeCache(
+            name, current_stream_pos, max_size, prefilled_cache
+        )
+
+    return StreamChangeCache(name, current_stream_pos, max_size, prefilled_cache)
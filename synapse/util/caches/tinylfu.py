@@ -0,0 +1,76 @@
+# Beep beep!
+
+"""A frequency sketch for the "tinylfu" cache policy of `LruCache`.
+
+See "TinyLFU: A Highly Efficient Cache Admission Policy" (Einziger, Friedman
+and Manes), which Caffeine's W-TinyLFU is based on.
+"""
+
+from typing import Hashable, Iterator, Tuple
+
+# The seeds used to pick a counter in each row of the sketch.
+_SEEDS = (0x97CB3127, 0xC2B2AE35, 0x85EBCA6B, 0x27D4EB2F)
+
+# The maximum value of a counter. Counters are halved periodically, so we only
+# need to be able to tell frequently used keys apart from the rest.
+_MAX_COUNT = 15
+
+# The number of counters in each row of the sketch, relative to the size of the
+# cache. Fewer counters means more collisions, which make entries seen once in a
+# scan look more popular than they are.
+_WIDTH_FACTOR = 4
+
+# How many increments, relative to the width of the sketch, before all the
+# counters are halved.
+_RESET_FACTOR = 10
+
+
+class FrequencySketch:
+    """A count-min sketch estimating how often each key has been used recently.
+
+    All counts are halved after a number of increments proportional to the
+    size of the cache, so that keys which were popular a while ago don't stay
+    in the cache forever.
+    """
+
+    def __init__(self, capacity: int):
+        self.resize(capacity)
+
+    def resize(self, capacity: int) -> None:
+        """Resize the sketch for a cache holding `capacity` entries, forgetting
+        the current counts.
+        """
+        width = 16
+        while width < capacity * _WIDTH_FACTOR:
+            width *= 2
+
+        self._mask = width - 1
+        self._rows = [bytearray(width) for _ in _SEEDS]
+        self._additions = 0
+        self._reset_at = width * _RESET_FACTOR
+
+    def _indices(self, key: Hashable) -> Iterator[Tuple[bytearray, int]]:
+        h = hash(key)
+        mask = self._mask
+        return zip(
+            self._rows,
+            (((h ^ seed) * 0x9E3779B1 >> 16) & mask for seed in _SEEDS),
+        )
+
+    def increment(self, key: Hashable) -> None:
+        """Record a use of the key."""
+        for row, index in self._indices(key):
+            if row[index] < _MAX_COUNT:
+                row[index] += 1
+
+        self._additions += 1
+        if self._additions >= self._reset_at:
+            self._reset()
+
+    def frequency(self, key: Hashable) -> int:
+        """Estimate how many times the key has been used recently."""
+        return min(row[index] for row, index in self._indices(key))
+
+    def _reset(self) -> None:
+        self._rows = [bytearray(count >> 1 for count in row) for row in self._rows]
+        self._additions //= 2
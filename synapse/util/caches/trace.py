@@ -0,0 +1,208 @@
+# Beep beep!
+
+"""Recording traces of the keys looked up in caches, so that they can be replayed
+offline against different cache sizes and policies (see
+`synapse/_scripts/replay_cache_trace.py`).
+
+Only a sample of keys are traced, chosen by their hash, so that every access
+to a traced key is recorded. A cache of size N replaying a trace sampled at
+rate R behaves much like a cache of size N * R would on the full trace (see
+"Efficient MRC Construction with SHARDS", Waldspurger et al.).
+
+A trace file starts with a header, followed by a 9-byte record for each
+lookup, invalidation or eviction of a traced key: the kind of record, and a
+hash of the key. Keys are hashed with Python's `hash`, so are only comparable
+between records in the same file.
+"""
+
+import atexit
+import logging
+import os
+import re
+import struct
+import threading
+from typing import BinaryIO, Dict, Hashable, Iterator, Optional, Tuple
+
+import attr
+
+from synapse.config import cache as cache_config
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"SYNTRACE"
+_VERSION = 1
+
+# The header after the magic: version, sample rate, size of the cache when the
+# trace started and length of the cache name, followed by the name.
+_HEADER = struct.Struct("<BdQH")
+
+_RECORD = struct.Struct("<BQ")
+
+# The kinds of record.
+HIT = 0
+MISS = 1
+INVALIDATE = 2
+EVICT = 3
+# The whole cache was cleared. The key hash is always 0.
+CLEAR = 4
+
+# How much to buffer in memory before writing to the trace file.
+_BUFFER_SIZE = 64 * 1024
+
+_MASK_64 = (1 << 64) - 1
+
+# An odd constant used to mix up the bits of hashes, as the hashes of small
+# integers are the integers themselves.
+_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class TraceHeader:
+    cache_name: str
+    sample_rate: float
+    max_size: int
+
+
+class CacheTraceRecorder:
+    """Records a trace of the lookups of a sample of the keys of a cache to a
+    file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_name: str,
+        max_size: int,
+        sample_rate: float,
+        max_bytes: int,
+    ):
+        self.path = path
+        self._threshold = int(sample_rate * (1 << 64))
+        self._max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._written = 0
+
+        self._file: Optional[BinaryIO] = open(path, "wb")
+
+        name = cache_name.encode("utf-8")
+        self._buffer += _MAGIC
+        self._buffer += _HEADER.pack(_VERSION, sample_rate, max_size, len(name))
+        self._buffer += name
+
+    def record(self, kind: int, key: Hashable) -> None:
+        """Record an event for the key, if it is one of the keys traced."""
+        key_hash = (hash(key) * _MULTIPLIER) & _MASK_64
+        if key_hash >= self._threshold or self._file is None:
+            return
+
+        with self._lock:
+            self._buffer += _RECORD.pack(kind, key_hash)
+            if len(self._buffer) >= _BUFFER_SIZE:
+                self._flush()
+
+    def record_clear(self) -> None:
+        with self._lock:
+            self._buffer += _RECORD.pack(CLEAR, 0)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._file is None:
+            self._buffer.clear()
+            return
+
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._written += len(self._buffer)
+        self._buffer.clear()
+
+        if self._written >= self._max_bytes:
+            logger.info(
+                "Cache trace %s has reached its maximum size, stopping", self.path
+            )
+            self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Map from cache name to the recorder tracing it.
+_recorders: Dict[str, CacheTraceRecorder] = {}
+_recorders_lock = threading.Lock()
+
+
+def get_trace_recorder(cache_name: str, max_size: int) -> Optional[CacheTraceRecorder]:
+    """Get the recorder for the named cache, if it is configured to be traced.
+
+    Caches with the same name share a recorder, and so a trace file.
+    """
+    trace_config = cache_config.get_access_trace_config(cache_name)
+    if trace_config is None:
+        return None
+
+    with _recorders_lock:
+        recorder = _recorders.get(cache_name)
+        if recorder is None:
+            os.makedirs(trace_config.directory, exist_ok=True)
+            file_name = "%s.%d.trace" % (
+                re.sub(r"[^\w.-]", "_", cache_name),
+                os.getpid(),
+            )
+            recorder = CacheTraceRecorder(
+                os.path.join(trace_config.directory, file_name),
+                cache_name,
+                max_size,
+                trace_config.sample_rate,
+                trace_config.max_bytes,
+            )
+            _recorders[cache_name] = recorder
+
+    return recorder
+
+
+@atexit.register
+def _flush_recorders() -> None:
+    with _recorders_lock:
+        for recorder in _recorders.values():
+            recorder.flush()
+
+
+def read_trace(trace_file: BinaryIO) -> Tuple[TraceHeader, Iterator[Tuple[int, int]]]:
+    """Read a trace written by `CacheTraceRecorder`.
+
+    Returns:
+        The header of the trace, and an iterator over the (kind, key hash)
+        records in it.
+    """
+    if trace_file.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("Not a cache trace")
+
+    version, sample_rate, max_size, name_length = _HEADER.unpack(
+        trace_file.read(_HEADER.size)
+    )
+    if version != _VERSION:
+        raise ValueError("Unsupported cache trace version %d" % (version,))
+
+    header = TraceHeader(
+        cache_name=trace_file.read(name_length).decode("utf-8"),
+        sample_rate=sample_rate,
+        max_size=max_size,
+    )
+
+    def records() -> Iterator[Tuple[int, int]]:
+        while True:
+            chunk = trace_file.read(_RECORD.size * 4096)
+            if not chunk:
+                return
+            # Ignore any partially written record at the end.
+            end = len(chunk) - len(chunk) % _RECORD.size
+            for kind, key_hash in _RECORD.iter_unpack(chunk[:end]):
+                yield kind, key_hash
+
+    return header, records()
@@ -86,7 +86,7 @@ if __name__ == "__main__":
     runner.parse_args()
 
     orig_loops = runner.args.loops
-    runner.args.inherit_environ = ["SYNAPSE_POSTGRES"]
+    runner.args.inherit_environ = ["SYNAPSE_POSTGRES", "SYNMARK_CACHE_TRACE"]
 
     if runner.args.worker:
         if runner.args.log:
@@ -0,0 +1,310 @@
+# Beep beep!
+
+"""Helpers for the benchmarks of the Beeper sync path.
+
+These build a homeserver against the same database as the unit tests (an
+in-memory SQLite database, or PostgreSQL if `SYNAPSE_POSTGRES` is set), and fill
+it with rooms containing messages, edits, reactions and redactions.
+"""
+
+import itertools
+from typing import Callable, List, Optional, Tuple
+
+import attr
+from pyperf import perf_counter
+
+from synapse.api.constants import EventTypes, Membership, RelationTypes
+from synapse.config.homeserver import HomeServerConfig
+from synapse.handlers.sync import SyncConfig
+from synapse.server import HomeServer
+from synapse.types import ISynapseReactor, Requester, UserID, create_requester
+from synapse.util import Clock
+
+from tests.server import setup_test_homeserver
+from tests.utils import default_config
+
+# The number of rooms to create, and the number of events to send in each.
+ROOMS = 50
+EVENTS_PER_ROOM = 20
+
+# The number of rooms which get a new message between incremental syncs.
+ROOMS_CHANGED_PER_SYNC = 5
+
+_request_key = itertools.count()
+
+
+@attr.s(auto_attribs=True)
+class BeeperFixture:
+    hs: HomeServer
+    # The user who syncs, and the other user in every room.
+    requester: Requester
+    other_requester: Requester
+    room_ids: List[str]
+    cleanups: List[Callable[[], None]]
+
+    def cleanup(self) -> None:
+        for cleanup in self.cleanups:
+            cleanup()
+
+
+async def make_fixture(reactor: ISynapseReactor) -> BeeperFixture:
+    """Create a homeserver and populate `ROOMS` rooms with `EVENTS_PER_ROOM`
+    events each, shared between two users.
+    """
+    config_dict = default_config("synmark")
+    config_dict["event_cache_size"] = 10000
+    config_dict["experimental_features"] = {
+        "beeper_user_notification_counts_enabled": True
+    }
+    config = HomeServerConfig()
+    config.parse_config_dict(config_dict, "", "")
+
+    cleanups: List[Callable[[], None]] = []
+    hs = setup_test_homeserver(
+        cleanups.append,
+        name="synmark",
+        config=config,
+        reactor=reactor,
+        clock=Clock(reactor),
+    )
+
+    registration_handler = hs.get_registration_handler()
+    user_id = await registration_handler.register_user(localpart="alice")
+    other_user_id = await registration_handler.register_user(localpart="bob")
+    requester = create_requester(user_id)
+    other_requester = create_requester(other_user_id)
+
+    room_ids = []
+    for _ in range(ROOMS):
+        room_id, _, _ = await hs.get_room_creation_handler().create_room(
+            requester, config={}, ratelimit=False
+        )
+        await hs.get_room_member_handler().update_membership(
+            other_requester,
+            UserID.from_string(other_user_id),
+            room_id,
+            Membership.JOIN,
+            ratelimit=False,
+        )
+        room_ids.append(room_id)
+
+    fixture = BeeperFixture(hs, requester, other_requester, room_ids, cleanups)
+
+    for room_id in room_ids:
+        await _populate_room(fixture, room_id)
+
+    store = hs.get_datastores().main
+    while not await store.db_pool.updates.has_completed_background_updates():
+        await store.db_pool.updates.do_next_background_update(False)
+
+    return fixture
+
+
+async def send_message(
+    fixture: BeeperFixture, requester: Requester, room_id: str, content: dict
+) -> str:
+    (
+        event,
+        _,
+    ) = await fixture.hs.get_event_creation_handler().create_and_send_nonmember_event(
+        requester,
+        {
+            "type": EventTypes.Message,
+            "room_id": room_id,
+            "sender": requester.user.to_string(),
+            "content": content,
+        },
+        ratelimit=False,
+    )
+    return event.event_id
+
+
+def _last_event_id_from(
+    event_ids: List[Tuple[Requester, str]], requester: Requester
+) -> Optional[str]:
+    for sender, event_id in reversed(event_ids):
+        if sender is requester:
+            return event_id
+    return None
+
+
+async def _populate_room(fixture: BeeperFixture, room_id: str) -> None:
+    """Send a mix of messages, edits, reactions and redactions to a room,
+    alternating between the two users.
+    """
+    event_creation_handler = fixture.hs.get_event_creation_handler()
+    requesters = (fixture.requester, fixture.other_requester)
+
+    message_ids: List[Tuple[Requester, str]] = []
+    for i in range(EVENTS_PER_ROOM):
+        requester = requesters[i % 2]
+        sender = requester.user.to_string()
+
+        if i % 5 == 4 and message_ids:
+            # Edit the last message this user sent.
+            original_id = _last_event_id_from(message_ids, requester)
+            if original_id is None:
+                continue
+
+            await send_message(
+                fixture,
+                requester,
+                room_id,
+                {
+                    "msgtype": "m.text",
+                    "body": f"* edit {i}",
+                    "m.new_content": {"msgtype": "m.text", "body": f"edit {i}"},
+                    "m.relates_to": {
+                        "rel_type": RelationTypes.REPLACE,
+                        "event_id": original_id,
+                    },
+                },
+            )
+        elif i % 7 == 6 and message_ids:
+            # React to the last message in the room.
+            _, target_id = message_ids[-1]
+            await event_creation_handler.create_and_send_nonmember_event(
+                requester,
+                {
+                    "type": EventTypes.Reaction,
+                    "room_id": room_id,
+                    "sender": sender,
+                    "content": {
+                        "m.relates_to": {
+                            "rel_type": RelationTypes.ANNOTATION,
+                            "event_id": target_id,
+                            "key": "👍",
+                        }
+                    },
+                },
+                ratelimit=False,
+            )
+        elif i % 11 == 10 and message_ids:
+            # Redact this user's last message.
+            original_id = _last_event_id_from(message_ids, requester)
+            if original_id is None:
+                continue
+
+            await event_creation_handler.create_and_send_nonmember_event(
+                requester,
+                {
+                    "type": EventTypes.Redaction,
+                    "room_id": room_id,
+                    "sender": sender,
+                    "content": {"redacts": original_id},
+                    "redacts": original_id,
+                },
+                ratelimit=False,
+            )
+        else:
+            event_id = await send_message(
+                fixture,
+                requester,
+                room_id,
+                {"msgtype": "m.text", "body": f"message {i}"},
+            )
+            message_ids.append((requester, event_id))
+
+
+def make_sync_config(fixture: BeeperFixture, beeper_previews: bool) -> SyncConfig:
+    """Make a sync config with a unique request key, so that results aren't
+    served from the sync response cache."""
+    return SyncConfig(
+        user=fixture.requester.user,
+        filter_collection=fixture.hs.get_filtering().DEFAULT_FILTER_COLLECTION,
+        is_guest=False,
+        request_key=("synmark", next(_request_key)),
+        device_id=None,
+        beeper_previews=beeper_previews,
+    )
+
+
+async def bench_initial_sync(
+    reactor: ISynapseReactor, loops: int, beeper_previews: bool
+) -> float:
+    """Benchmark `loops` initial syncs of a user in every room."""
+    fixture = await make_fixture(reactor)
+    sync_handler = fixture.hs.get_sync_handler()
+
+    start = perf_counter()
+
+    for _ in range(loops):
+        await sync_handler.wait_for_sync_for_user(
+            fixture.requester, make_sync_config(fixture, beeper_previews)
+        )
+
+    end = perf_counter() - start
+
+    fixture.cleanup()
+
+    return end
+
+
+async def bench_incremental_sync(
+    reactor: ISynapseReactor, loops: int, beeper_previews: bool
+) -> float:
+    """Benchmark `loops` incremental syncs of a user, with new messages in
+    `ROOMS_CHANGED_PER_SYNC` rooms since the previous sync.
+
+    Only the syncs are timed, not sending the messages.
+    """
+    fixture = await make_fixture(reactor)
+    sync_handler = fixture.hs.get_sync_handler()
+
+    result = await sync_handler.wait_for_sync_for_user(
+        fixture.requester, make_sync_config(fixture, beeper_previews)
+    )
+    since_token = result.next_batch
+
+    rooms = itertools.cycle(fixture.room_ids)
+    elapsed = 0.0
+
+    for i in range(loops):
+        for room_id in itertools.islice(rooms, ROOMS_CHANGED_PER_SYNC):
+            await send_message(
+                fixture,
+                fixture.other_requester,
+                room_id,
+                {"msgtype": "m.text", "body": f"new message {i}"},
+            )
+
+        start = perf_counter()
+        result = await sync_handler.wait_for_sync_for_user(
+            fixture.requester,
+            make_sync_config(fixture, beeper_previews),
+            since_token=since_token,
+        )
+        elapsed += perf_counter() - start
+
+        since_token = result.next_batch
+
+    fixture.cleanup()
+
+    return elapsed
+
+
+async def bench_unread_counts(
+    reactor: ISynapseReactor, loops: int, beeper_counts: bool
+) -> float:
+    """Benchmark `loops` lookups of the per-room unread counts used for push
+    badges, either from the push summaries or the Beeper notification counts.
+    """
+    fixture = await make_fixture(reactor)
+    store = fixture.hs.get_datastores().main
+    user_id = fixture.requester.user.to_string()
+
+    start = perf_counter()
+
+    for _ in range(loops):
+        if beeper_counts:
+            # Skip the cache, to measure the query.
+            store.beeper_get_unread_counts_by_room_for_user.invalidate((user_id,))
+            await store.beeper_get_unread_counts_by_room_for_user(user_id)
+        else:
+            await store.get_unread_counts_by_room_for_user(user_id)
+
+    end = perf_counter() - start
+
+    fixture.cleanup()
+
+    return end
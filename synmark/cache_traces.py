@@ -0,0 +1,106 @@
+# Beep beep!
+
+"""Helpers for benchmarking the hit ratios of cache policies on access traces.
+
+The traces mix lookups of a Zipf-distributed set of keys, like the lookups of
+popular events or rooms, with periodic scans of keys which are only used once,
+like backfill or the initial sync of a large account.
+
+To replay a trace recorded with the `caches.access_trace` config option instead,
+set `SYNMARK_CACHE_TRACE` to the path of the trace file. The cache is then the
+size of the cache the trace was recorded from, scaled down by the sample rate of
+the trace.
+"""
+
+import bisect
+import itertools
+import logging
+import os
+import random
+from typing import List, Optional, Tuple
+
+from pyperf import perf_counter
+
+from synapse._scripts.replay_cache_trace import replay
+from synapse.util.caches import trace
+
+logger = logging.getLogger(__name__)
+
+# The size of the cache, and the number of distinct keys which are looked up
+# repeatedly.
+CACHE_SIZE = 1000
+HOT_KEYS = CACHE_SIZE * 20
+
+# The number of lookups in the trace, and how long and frequent the scans are.
+TRACE_LENGTH = 100000
+SCAN_EVERY = 2000
+SCAN_LENGTH = CACHE_SIZE * 2
+
+# A rough cost of a cache miss, e.g. of fetching an event from the database,
+# which is added to the time taken to replay the trace. This makes the
+# benchmark reflect the hit ratio as well as the overhead of the policy.
+MISS_COST_SECONDS = 50e-6
+
+# The (kind, key) records of the trace to replay, and the size of the cache.
+_trace: Optional[Tuple[List[Tuple[int, int]], int]] = None
+
+
+def make_trace(seed: int = 1) -> List[Tuple[int, int]]:
+    """Generate a trace of cache lookups, with scans of `SCAN_LENGTH` new keys
+    every `SCAN_EVERY` lookups of the Zipf-distributed keys.
+    """
+    rand = random.Random(seed)
+    weights = list(itertools.accumulate(1 / (i + 1) ** 0.9 for i in range(HOT_KEYS)))
+
+    keys: List[int] = []
+    next_scan_key = HOT_KEYS
+    for i in range(TRACE_LENGTH):
+        if i % SCAN_EVERY == 0:
+            keys.extend(range(next_scan_key, next_scan_key + SCAN_LENGTH))
+            next_scan_key += SCAN_LENGTH
+
+        keys.append(bisect.bisect(weights, rand.random() * weights[-1]))
+
+    return [(trace.MISS, key) for key in keys]
+
+
+def load_trace() -> Tuple[List[Tuple[int, int]], int]:
+    """Get the trace to replay, and the size of the cache to replay it against.
+
+    This is the trace file given by `SYNMARK_CACHE_TRACE`, if any, or otherwise
+    a trace from `make_trace`.
+    """
+    path = os.environ.get("SYNMARK_CACHE_TRACE")
+    if not path:
+        return make_trace(), CACHE_SIZE
+
+    with open(path, "rb") as trace_file:
+        header, records = trace.read_trace(trace_file)
+        # Evictions are only recorded for information, and depend on the policy
+        # which was used when recording.
+        lookups = [(kind, key) for kind, key in records if kind != trace.EVICT]
+
+    # Only a sample of the keys were traced, so the cache needs to be scaled
+    # down by the same amount.
+    return lookups, max(1, round(header.max_size * header.sample_rate))
+
+
+def bench_scan(loops: int, policy: str) -> float:
+    """Benchmark `loops` replays of the trace against a cache using the given
+    policy, each starting with an empty cache.
+    """
+    global _trace
+    if _trace is None:
+        _trace = load_trace()
+    records, size = _trace
+
+    elapsed = 0.0
+    hits = misses = 0
+    for _ in range(loops):
+        start = perf_counter()
+        hits, misses = replay(records, size, policy)
+        elapsed += perf_counter() - start + misses * MISS_COST_SECONDS
+
+    logger.info("Hit ratio with %s policy: %.3f", policy, hits / max(1, hits + misses))
+
+    return elapsed
@@ -0,0 +1,104 @@
+# Beep beep!
+
+"""Helpers for benchmarking the implementations of `StreamChangeCache` when full
+of entries, like the device list or receipts caches of a large server.
+"""
+
+import logging
+import random
+import tracemalloc
+from typing import List, Tuple, Type
+
+from pyperf import perf_counter
+
+from synapse.util.caches.stream_change_cache import StreamChangeCache
+
+logger = logging.getLogger(__name__)
+
+# The number of entities in the cache, each with a change at its own stream
+# position.
+ENTRIES = 100000
+
+# The lookups made in each loop of the benchmark.
+HAS_ENTITY_CHANGED_LOOKUPS = 1000
+GET_ENTITIES_CHANGED_LOOKUPS = 10
+GET_ENTITIES_CHANGED_ENTITIES = 100
+GET_ALL_ENTITIES_CHANGED_LOOKUPS = 10
+
+# The number of changes made in each loop of the benchmark, each of which
+# evicts the earliest change.
+CHANGES = 100
+
+
+def _make_entities() -> List[str]:
+    return ["@user%d:example.com" % (i,) for i in range(ENTRIES)]
+
+
+def build_cache(
+    cache_class: Type[StreamChangeCache], entities: List[str]
+) -> Tuple[StreamChangeCache, int]:
+    """Build a cache with a change to each of the entities.
+
+    Returns:
+        The cache, and how much memory in bytes was allocated building it.
+    """
+    tracemalloc.start()
+    try:
+        cache = cache_class("synmark_%s" % (cache_class.__name__,), 0, max_size=ENTRIES)
+        for stream_pos, entity in enumerate(entities, start=1):
+            cache.entity_has_changed(entity, stream_pos)
+        memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return cache, memory
+
+
+def bench(loops: int, cache_class: Type[StreamChangeCache]) -> float:
+    """Benchmark `loops` rounds of lookups and changes against a cache of the
+    given class holding `ENTRIES` entries.
+    """
+    entities = _make_entities()
+    cache, memory = build_cache(cache_class, entities)
+    logger.info(
+        "%s with %d entries used %.1f MiB",
+        cache_class.__name__,
+        ENTRIES,
+        memory / 1024 / 1024,
+    )
+
+    rand = random.Random(1)
+    stream_pos = ENTRIES
+
+    elapsed = 0.0
+    for _ in range(loops):
+        lookups = [
+            (rand.choice(entities), rand.randint(1, stream_pos))
+            for _ in range(HAS_ENTITY_CHANGED_LOOKUPS)
+        ]
+        entity_sets = [
+            set(rand.sample(entities, GET_ENTITIES_CHANGED_ENTITIES))
+            for _ in range(GET_ENTITIES_CHANGED_LOOKUPS)
+        ]
+        changes = [rand.choice(entities) for _ in range(CHANGES)]
+
+        start = perf_counter()
+
+        for entity, since in lookups:
+            cache.has_entity_changed(entity, since)
+
+        # Look for changes since shortly before the end of the stream, as an
+        # incremental sync would.
+        for entity_set in entity_sets:
+            cache.get_entities_changed(entity_set, stream_pos - 1000)
+        for _ in range(GET_ALL_ENTITIES_CHANGED_LOOKUPS):
+            cache.get_all_entities_changed(stream_pos - 100)
+            cache.has_any_entity_changed(stream_pos - 100)
+
+        for entity in changes:
+            stream_pos += 1
+            cache.entity_has_changed(entity, stream_pos)
+
+        elapsed += perf_counter() - start
+
+    return elapsed
@@ -1,4 +1,18 @@
-from . import logging, lrucache, lrucache_evict
+from . import (
+    beeper_sync_incremental,
+    beeper_sync_incremental_previews,
+    beeper_sync_initial,
+    beeper_sync_initial_previews,
+    beeper_unread_counts,
+    beeper_unread_counts_beeper,
+    logging,
+    lrucache,
+    lrucache_evict,
+    lrucache_scan,
+    lrucache_scan_tinylfu,
+    stream_change_cache,
+    stream_change_cache_compact,
+)
 
 SUITES = [
     (logging, 1000),
@@ -6,4 +20,14 @@ SUITES = [
     (logging, None),
     (lrucache, None),
     (lrucache_evict, None),
+    (lrucache_scan, 5),
+    (lrucache_scan_tinylfu, 5),
+    (stream_change_cache, 100),
+    (stream_change_cache_compact, 100),
+    (beeper_sync_initial, 10),
+    (beeper_sync_initial_previews, 10),
+    (beeper_sync_incremental, 10),
+    (beeper_sync_incremental_previews, 10),
+    (beeper_unread_counts, 100),
+    (beeper_unread_counts_beeper, 100),
 ]
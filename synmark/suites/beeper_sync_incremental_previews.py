@@ -0,0 +1,11 @@
+# Beep beep!
+
+from synapse.types import ISynapseReactor
+from synmark.beeper import bench_incremental_sync
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` incremental syncs with Beeper previews.
+    """
+    return await bench_incremental_sync(reactor, loops, beeper_previews=True)
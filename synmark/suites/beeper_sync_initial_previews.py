@@ -0,0 +1,11 @@
+# Beep beep!
+
+from synapse.types import ISynapseReactor
+from synmark.beeper import bench_initial_sync
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` initial syncs with Beeper previews.
+    """
+    return await bench_initial_sync(reactor, loops, beeper_previews=True)
@@ -0,0 +1,11 @@
+# Beep beep!
+
+from synapse.types import ISynapseReactor
+from synmark.beeper import bench_unread_counts
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` unread count lookups from the push summaries.
+    """
+    return await bench_unread_counts(reactor, loops, beeper_counts=False)
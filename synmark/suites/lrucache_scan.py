@@ -0,0 +1,12 @@
+# Beep beep!
+
+from synapse.types import ISynapseReactor
+from synmark.cache_traces import bench_scan
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` replays of an access trace with scans against an LruCache
+    using the "lru" policy.
+    """
+    return bench_scan(loops, policy="lru")
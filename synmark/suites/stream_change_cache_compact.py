@@ -0,0 +1,13 @@
+# Beep beep!
+
+from synapse.types import ISynapseReactor
+from synapse.util.caches.stream_change_cache import CompactStreamChangeCache
+from synmark.stream_change_caches import bench
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` rounds of lookups and changes against a
+    CompactStreamChangeCache holding 100k entries.
+    """
+    return bench(loops, CompactStreamChangeCache)
@@ -19,6 +19,7 @@
 #
 #
 
+from synapse.config import ConfigError
 from synapse.config.cache import CacheConfig, add_resizable_cache
 from synapse.types import JsonDict
 from synapse.util.caches.lrucache import LruCache
@@ -172,3 +173,31 @@ class CacheConfigTests(TestCase):
         add_resizable_cache("event_cache", cache_resize_callback=cache.set_cache_factor)
 
         self.assertEqual(cache.max_size, 10240)
+
+    def test_cache_policies(self) -> None:
+        """Cache policies are read with canonicalised names, and must be known."""
+        config: JsonDict = {"caches": {"per_cache_policies": {"*Cache_A*": "tinylfu"}}}
+        self.config.read_config(config, config_dir_path="", data_dir_path="")
+        self.assertEqual(self.config.cache_policies, {"cache_a": "tinylfu"})
+
+        config = {"caches": {"per_cache_policies": {"cache_a": "lfu"}}}
+        with self.assertRaises(ConfigError):
+            self.config.read_config(config, config_dir_path="", data_dir_path="")
+
+    def test_access_trace(self) -> None:
+        """Traced caches are read with canonicalised names, and the sample rate
+        must be a fraction.
+        """
+        config: JsonDict = {
+            "caches": {
+                "access_trace": {"directory": "/traces", "caches": ["*Cache_A*"]}
+            }
+        }
+        self.config.read_config(config, config_dir_path="", data_dir_path="")
+        assert self.config.access_trace is not None
+        self.assertEqual(self.config.access_trace.caches, {"cache_a"})
+        self.assertEqual(self.config.access_trace.sample_rate, 0.01)
+
+        config["caches"]["access_trace"]["sample_rate"] = 2
+        with self.assertRaises(ConfigError):
+            self.config.read_config(config, config_dir_path="", data_dir_path="")
@@ -20,6 +20,7 @@
 
 import yaml
 
+from synapse.config import ConfigError
 from synapse.config.database import DatabaseConfig
 
 from tests import unittest
@@ -37,3 +38,28 @@ class DatabaseConfigTestCase(unittest.TestCase):
         }
 
         self.assertEqual(conf["database"], expected_database_conf)
+
+    def test_replicas(self) -> None:
+        """Replicas are connected to with the args of the database, apart from
+        their own.
+        """
+        config = DatabaseConfig()
+        config.read_config(
+            {
+                "database": {
+                    "name": "psycopg2",
+                    "args": {"user": "synapse", "host": "primary"},
+                    "replicas": [{"args": {"host": "replica"}}],
+                }
+            }
+        )
+
+        (replica,) = config.databases[0].replicas
+        self.assertEqual(replica.name, "master-replica0")
+        self.assertEqual(replica.config["name"], "psycopg2")
+        self.assertEqual(replica.config["args"], {"user": "synapse", "host": "replica"})
+
+        with self.assertRaises(ConfigError):
+            config.read_config(
+                {"database": {"name": "sqlite3", "replicas": [{"args": {}}]}}
+            )
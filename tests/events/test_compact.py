@@ -0,0 +1,175 @@
+# Beep beep!
+
+import gc
+import json
+import tracemalloc
+import unittest as stdlib_unittest
+from typing import Callable
+from unittest import mock
+
+from synapse import events
+from synapse.api.room_versions import RoomVersions
+from synapse.events import EventBase, make_compact_event_from_json, make_event_from_dict
+from synapse.events.utils import prune_event
+from synapse.types import JsonDict
+
+
+def _event_dict() -> JsonDict:
+    return {
+        "type": "m.room.message",
+        "room_id": "!room:test",
+        "sender": "@alice:test",
+        "content": {"msgtype": "m.text", "body": "hello"},
+        "depth": 5,
+        "origin_server_ts": 1234,
+        "prev_events": ["$prev"],
+        "auth_events": ["$create", "$member"],
+        "hashes": {"sha256": "abcd"},
+        "signatures": {"test": {"ed25519:a": "sig"}},
+        "unsigned": {"age_ts": 1000},
+    }
+
+
+def _retained_size(make_event: Callable[[], EventBase], count: int = 100) -> int:
+    """The memory held by `count` events from `make_event`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        retained = [make_event() for _ in range(count)]
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    del retained
+    return size
+
+
+class CompactEventTestCase(stdlib_unittest.TestCase):
+    def _make_events(self, event_dict: JsonDict) -> tuple:
+        event_json = json.dumps(event_dict)
+        event = make_event_from_dict(event_dict, RoomVersions.V10)
+        compact = make_compact_event_from_json(
+            event_json, json.loads(event_json), RoomVersions.V10
+        )
+        return event, compact
+
+    def test_matches_event(self) -> None:
+        """Compact events look the same as events built from the dict."""
+        event, compact = self._make_events(_event_dict())
+
+        self.assertEqual(compact.event_id, event.event_id)
+        self.assertEqual(compact.content, event.content)
+        self.assertEqual(compact.hashes, event.hashes)
+        self.assertEqual(compact.prev_event_ids(), event.prev_event_ids())
+        self.assertEqual(compact.auth_event_ids(), event.auth_event_ids())
+        self.assertEqual(compact.signatures, event.signatures)
+        self.assertEqual(compact.unsigned, event.unsigned)
+        self.assertIsNone(compact.get_state_key())
+        self.assertNotIn("state_key", compact)
+        self.assertEqual(compact.get_pdu_json(), event.get_pdu_json())
+        self.assertEqual(sorted(compact.items()), sorted(event.items()))
+        self.assertEqual(
+            compact.get_templated_pdu_json(), event.get_templated_pdu_json()
+        )
+        self.assertEqual(prune_event(compact).get_dict(), prune_event(event).get_dict())
+
+    def test_v1_event(self) -> None:
+        event_dict = _event_dict()
+        event_dict["event_id"] = "$event:test"
+        event_dict["prev_events"] = [["$prev", {}]]
+        event_json = json.dumps(event_dict)
+
+        compact = make_compact_event_from_json(
+            event_json, json.loads(event_json), RoomVersions.V1
+        )
+
+        self.assertEqual(compact.event_id, "$event:test")
+        self.assertEqual(compact.prev_event_ids(), ["$prev"])
+
+    def test_fields_decoded_lazily(self) -> None:
+        """Fields other than the common ones and content are only decoded once
+        one of them is used, and then all at once.
+        """
+        _, compact = self._make_events(_event_dict())
+        fields = compact._dict._fields
+
+        self.assertIn("content", fields)
+        self.assertNotIn("hashes", fields)
+        self.assertNotIn("prev_events", fields)
+        self.assertIsNone(compact._dict.signatures)
+
+        self.assertEqual(compact.type, "m.room.message")
+        self.assertEqual(compact.content["body"], "hello")
+        self.assertNotIn("hashes", fields)
+
+        with mock.patch.object(
+            events, "json_decoder", wraps=events.json_decoder
+        ) as decoder:
+            self.assertEqual(compact.hashes, {"sha256": "abcd"})
+            self.assertEqual(compact.prev_event_ids(), ["$prev"])
+            self.assertEqual(compact.auth_event_ids(), ["$create", "$member"])
+            self.assertEqual(compact.signatures, {"test": {"ed25519:a": "sig"}})
+            self.assertEqual(compact.unsigned, {"age_ts": 1000})
+
+        decoder.decode.assert_called_once()
+        fields = compact._dict._fields
+        self.assertIn("hashes", fields)
+        self.assertIn("prev_events", fields)
+
+    def test_changes(self) -> None:
+        """Changes to the fields and unsigned data of compact events are kept."""
+        _, compact = self._make_events(_event_dict())
+
+        compact.unsigned["replaces_state"] = "$old"
+        compact.content["body"] = "changed"
+        del compact._dict["hashes"]
+
+        self.assertEqual(compact.unsigned["replaces_state"], "$old")
+        pdu_json = compact.get_pdu_json()
+        self.assertEqual(pdu_json["content"]["body"], "changed")
+        self.assertEqual(pdu_json["unsigned"]["replaces_state"], "$old")
+        self.assertNotIn("hashes", pdu_json)
+
+    def test_retained_size(self) -> None:
+        """Compact events take less memory than other events once served, and
+        about the same once all their fields have been used.
+        """
+        event_dict = _event_dict()
+        event_dict["prev_events"] = ["$" + "p" * 43]
+        event_dict["auth_events"] = ["$" + c * 43 for c in "abcd"]
+        event_dict["hashes"] = {"sha256": "h" * 43}
+        event_dict["signatures"] = {"test": {"ed25519:a": "s" * 86}}
+        event_json = json.dumps(event_dict)
+
+        def make_event() -> EventBase:
+            event = make_event_from_dict(json.loads(event_json), RoomVersions.V10)
+            # Compact events work out their event ID when they are built.
+            self.assertTrue(event.event_id)
+            return event
+
+        def make_served_compact() -> EventBase:
+            compact = make_compact_event_from_json(
+                event_json, json.loads(event_json), RoomVersions.V10
+            )
+            # What serving an event to clients uses.
+            self.assertEqual(compact.get_dict()["unsigned"], compact.unsigned)
+            return compact
+
+        def make_used_compact() -> EventBase:
+            compact = make_served_compact()
+            self.assertTrue(compact.hashes)
+            return compact
+
+        event_size = _retained_size(make_event)
+        self.assertLess(_retained_size(make_served_compact), event_size)
+        self.assertLess(_retained_size(make_used_compact), event_size * 1.1)
+
+        # Serving an event which has had all its fields used doesn't decode its
+        # JSON again.
+        compact = make_used_compact()
+        with mock.patch.object(
+            events, "json_decoder", wraps=events.json_decoder
+        ) as decoder:
+            self.assertEqual(compact.get_pdu_json(), make_event().get_pdu_json())
+        decoder.decode.assert_not_called()
@@ -25,6 +25,7 @@ from unittest.mock import Mock
 from synapse.replication.tcp.streams._base import ReceiptsStream
 
 from tests.replication._base import BaseStreamTestCase
+from tests.unittest import override_config
 
 USER_ID = "@feeling:blue"
 
@@ -98,3 +99,63 @@ class ReceiptsStreamTestCase(BaseStreamTestCase):
         self.assertEqual(USER_ID, row.user_id)
         self.assertEqual("$event2:foo", row.event_id)
         self.assertEqual({"a": 2}, row.data)
+
+    @override_config(
+        {"experimental_features": {"beeper_replication_rdata_batches": True}}
+    )
+    def test_receipts_batched(self):
+        """Receipts sent in an RDATA_BATCH are handled a token at a time."""
+        self.reconnect()
+
+        store = self.hs.get_datastores().main
+        for i in range(2):
+            self.get_success(
+                store.insert_receipt(
+                    "!room%d:blue" % (i,),
+                    "m.read",
+                    USER_ID,
+                    ["$event%d:blue" % (i,)],
+                    thread_id=None,
+                    data={"a": i},
+                )
+            )
+        self.replicate()
+
+        self.assertEqual(self.test_handler.on_rdata.call_count, 2)
+        for i, call in enumerate(self.test_handler.on_rdata.call_args_list):
+            stream_name, _, token, rdata_rows = call[0]
+            self.assertEqual(stream_name, "receipts")
+            self.assertEqual(token, i + 2)
+            self.assertEqual(1, len(rdata_rows))
+            self.assertEqual("$event%d:blue" % (i,), rdata_rows[0].event_id)
+
+    @override_config(
+        {"experimental_features": {"beeper_replication_coalesce_window_ms": 100}}
+    )
+    def test_receipts_coalesced(self):
+        """Receipts which arrive close together are handled in a single batch."""
+        self.reconnect()
+        self.pump(0.1)
+        self.test_handler.on_rdata.reset_mock()
+
+        store = self.hs.get_datastores().main
+        for i in range(2):
+            self.get_success(
+                store.insert_receipt(
+                    "!room%d:blue" % (i,),
+                    "m.read",
+                    USER_ID,
+                    ["$event%d:blue" % (i,)],
+                    thread_id=None,
+                    data={"a": i},
+                )
+            )
+        self.replicate()
+
+        self.test_handler.on_rdata.assert_called_once()
+        stream_name, _, token, rdata_rows = self.test_handler.on_rdata.call_args[0]
+        self.assertEqual(stream_name, "receipts")
+        self.assertEqual(token, 3)
+        self.assertEqual(
+            ["$event0:blue", "$event1:blue"], [row.event_id for row in rdata_rows]
+        )
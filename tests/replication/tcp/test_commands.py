@@ -19,6 +19,7 @@
 #
 #
 from synapse.replication.tcp.commands import (
+    RdataBatchCommand,
     RdataCommand,
     ReplicateCommand,
     parse_command_from_line,
@@ -48,3 +49,17 @@ class ParseCommandTestCase(TestCase):
         self.assertEqual(cmd.stream_name, "presence")
         self.assertEqual(cmd.instance_name, "master")
         self.assertIsNone(cmd.token)
+
+    def test_parse_rdata_batch_command(self) -> None:
+        line = 'RDATA_BATCH presence master [[5, ["@foo:example.com", "online"]], [5, ["@bar:example.com", "online"]], [6, ["@baz:example.com", "online"]]]'
+        cmd = parse_command_from_line(line)
+        assert isinstance(cmd, RdataBatchCommand)
+        self.assertEqual(cmd.stream_name, "presence")
+        self.assertEqual(cmd.instance_name, "master")
+        self.assertEqual([token for token, _ in cmd.updates], [5, 5, 6])
+        self.assertEqual(cmd.updates[2][1], ["@baz:example.com", "online"])
+
+        # The batch can be split into a batched series of RDATA.
+        rdata_cmds = cmd.to_rdata_commands()
+        self.assertEqual([c.token for c in rdata_cmds], [None, 5, 6])
+        self.assertEqual(rdata_cmds[1].row, ["@bar:example.com", "online"])
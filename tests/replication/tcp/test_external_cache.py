@@ -0,0 +1,56 @@
+# Beep beep!
+
+from immutabledict import immutabledict
+
+from twisted.test.proto_helpers import MemoryReactor
+
+from synapse.replication.tcp.external_cache import _decode_value
+from synapse.server import HomeServer
+from synapse.util import Clock
+
+from tests import unittest
+
+
+class ExternalCacheCodecTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.external_cache = hs.get_external_cache()
+
+    def _roundtrip(self, value: object) -> object:
+        encoded = self.external_cache._encode_value(value)
+        # txredisapi hands back anything which is valid UTF-8 as a string.
+        if isinstance(encoded, bytes):
+            try:
+                return _decode_value(encoded.decode("utf-8"))
+            except UnicodeDecodeError:
+                pass
+        return _decode_value(encoded)
+
+    def test_json(self) -> None:
+        value = {"hosts": ["a.test", "b.test"], "nested": immutabledict({"x": 1})}
+        self.assertEqual(
+            self._roundtrip(value),
+            {"hosts": ["a.test", "b.test"], "nested": {"x": 1}},
+        )
+
+    @unittest.override_config(
+        {"experimental_features": {"beeper_external_cache_codec": "msgpack"}}
+    )
+    def test_msgpack(self) -> None:
+        value = {"hosts": ["a.test", "b.test"], "nested": immutabledict({"x": 1})}
+        self.assertIsInstance(self.external_cache._encode_value(value), bytes)
+        self.assertEqual(
+            self._roundtrip(value),
+            {"hosts": ["a.test", "b.test"], "nested": {"x": 1}},
+        )
+
+        # Values which would look like numbers aren't mangled.
+        self.assertEqual(self._roundtrip(5), 5)
+        self.assertEqual(self._roundtrip("é"), "é")
+
+    def test_read_either_codec(self) -> None:
+        """Values written by a worker using the other codec can still be read."""
+        self.assertEqual(_decode_value('{"a":1}'), {"a": 1})
+        self.assertEqual(_decode_value(b'{"a":1}'), {"a": 1})
+        self.assertEqual(_decode_value(b"\x00\x81\xa1a\x01"), {"a": 1})
+        self.assertEqual(_decode_value("\x00\x05"), 5)
+        self.assertEqual(_decode_value(3), 3)
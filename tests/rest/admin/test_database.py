@@ -0,0 +1,120 @@
+# Beep beep!
+
+from twisted.test.proto_helpers import MemoryReactor
+
+import synapse.rest.admin
+from synapse.api.errors import Codes
+from synapse.rest.client import login
+from synapse.server import HomeServer
+from synapse.storage.database import LoggingTransaction
+from synapse.storage.profiling import InteractionProfiler
+from synapse.util import Clock
+
+from tests import unittest
+
+
+class DatabaseInteractionsTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets,
+        login.register_servlets,
+    ]
+
+    url = "/_synapse/admin/v1/database/interactions"
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.db_pool = hs.get_datastores().main.db_pool
+        self.admin_user = self.register_user("admin", "pass", admin=True)
+        self.admin_user_tok = self.login("admin", "pass")
+
+    def _select_user(self, txn: LoggingTransaction, user_id: str) -> None:
+        txn.execute("SELECT name, admin FROM users WHERE name = ?", (user_id,))
+        txn.fetchall()
+
+    def test_requester_is_no_admin(self) -> None:
+        """If the user is not a server admin, an error 403 is returned."""
+        self.register_user("user", "pass", admin=False)
+        other_user_tok = self.login("user", "pass")
+
+        channel = self.make_request("GET", self.url, access_token=other_user_tok)
+
+        self.assertEqual(403, channel.code, msg=channel.json_body)
+        self.assertEqual(Codes.FORBIDDEN, channel.json_body["errcode"])
+
+    def test_busiest(self) -> None:
+        """Interactions are counted whether or not profiling is enabled."""
+        for _ in range(3):
+            self.get_success(
+                self.db_pool.runInteraction(
+                    "test_select_user", self._select_user, self.admin_user
+                )
+            )
+
+        channel = self.make_request(
+            "GET", self.url + "?limit=1000", access_token=self.admin_user_tok
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+
+        database = channel.json_body["databases"]["master"]
+        self.assertFalse(database["profiling"])
+        self.assertEqual(database["slowest"], [])
+        busiest = {
+            interaction["desc"]: interaction for interaction in database["busiest"]
+        }
+        self.assertEqual(busiest["test_select_user"]["count"], 3)
+
+    def test_slowest(self) -> None:
+        """With profiling, the slowest statement of each interaction is sampled
+        and EXPLAINed.
+        """
+        self.db_pool.profiler = InteractionProfiler(
+            self.hs, self.db_pool, explain_threshold_ms=0
+        )
+
+        self.get_success(
+            self.db_pool.runInteraction(
+                "test_select_user", self._select_user, self.admin_user
+            )
+        )
+        self.pump()
+
+        channel = self.make_request(
+            "GET", self.url + "?limit=1000", access_token=self.admin_user_tok
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+
+        database = channel.json_body["databases"]["master"]
+        self.assertTrue(database["profiling"])
+        slowest = {sample["desc"]: sample for sample in database["slowest"]}
+        sample = slowest["test_select_user"]
+        self.assertEqual(sample["statements"], 1)
+        self.assertGreater(sample["fetched_bytes"], 0)
+
+        statement = sample["slowest_statement"]
+        self.assertEqual(
+            statement["sql"], "SELECT name, admin FROM users WHERE name = ?"
+        )
+        self.assertIsNone(statement["params"])
+        self.assertTrue(statement["plan"])
+
+        # The parameters are only included when asked for.
+        channel = self.make_request(
+            "GET",
+            self.url + "?limit=1000&include_params=true",
+            access_token=self.admin_user_tok,
+        )
+        self.assertEqual(200, channel.code, msg=channel.json_body)
+        slowest = {
+            sample["desc"]: sample
+            for sample in channel.json_body["databases"]["master"]["slowest"]
+        }
+        self.assertEqual(
+            slowest["test_select_user"]["slowest_statement"]["params"],
+            repr((self.admin_user,)),
+        )
+
+    def test_invalid_limit(self) -> None:
+        """A negative limit is rejected."""
+        channel = self.make_request(
+            "GET", self.url + "?limit=-1", access_token=self.admin_user_tok
+        )
+        self.assertEqual(400, channel.code, msg=channel.json_body)
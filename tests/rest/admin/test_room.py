@@ -2907,6 +2907,8 @@ PURGE_TABLES = [
     "users_in_public_rooms",
     "users_who_share_private_rooms",
     "appservice_room_list",
+    "beeper_room_previews",
+    "beeper_user_room_previews",
     "e2e_room_keys",
     "event_push_summary",
     "pusher_throttle",
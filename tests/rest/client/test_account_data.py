@@ -214,3 +214,93 @@ class AccountDataTestCase(unittest.HomeserverTestCase):
             )
         )
         self.assertNotEqual(existing_read_marker, new_read_marker)
+
+    def test_beeper_inbox_state_endpoint_single_transaction(self) -> None:
+        store = self.hs.get_datastores().main
+
+        user_id = self.register_user("user", "password")
+        tok = self.login("user", "password")
+
+        room_id = self.helper.create_room_as(user_id, tok=tok)
+        res = self.helper.send(room_id, "hello", tok=tok)
+        stream_id = store.get_max_account_data_stream_id()
+
+        store.add_account_data_to_room = AsyncMock(  # type: ignore[method-assign]
+            side_effect=store.add_account_data_to_room
+        )
+        store.add_account_data_types_to_room = AsyncMock(  # type: ignore[method-assign]
+            side_effect=store.add_account_data_types_to_room
+        )
+
+        channel = self.make_request(
+            "PUT",
+            f"/_matrix/client/unstable/com.beeper.inbox/user/{user_id}/rooms/{room_id}/inbox_state",
+            {
+                "done": {"at_delta": 0},
+                "marked_unread": False,
+                "read_markers": {
+                    ReceiptTypes.FULLY_READ: res["event_id"],
+                },
+            },
+            access_token=tok,
+        )
+        self.assertEqual(channel.code, 200, channel.result)
+
+        # All three types are written together in one call to the store.
+        store.add_account_data_to_room.assert_not_called()
+        store.add_account_data_types_to_room.assert_called_once()
+        self.assertEqual(store.get_max_account_data_stream_id(), stream_id + 3)
+
+        for account_data_type in (
+            "com.beeper.inbox.done",
+            "m.marked_unread",
+            ReceiptTypes.FULLY_READ,
+        ):
+            self.assertIsNotNone(
+                self.get_success(
+                    store.get_account_data_for_room_and_type(
+                        user_id, room_id, account_data_type
+                    )
+                )
+            )
+
+    def test_beeper_inbox_batch_archive_endpoint(self) -> None:
+        store = self.hs.get_datastores().main
+
+        user_id = self.register_user("user", "password")
+        tok = self.login("user", "password")
+
+        room_ids = [self.helper.create_room_as(user_id, tok=tok) for _ in range(3)]
+        stream_id = store.get_max_account_data_stream_id()
+
+        channel = self.make_request(
+            "POST",
+            "/_matrix/client/unstable/com.beeper.inbox/batch_archive",
+            {"room_ids": room_ids},
+            access_token=tok,
+        )
+        self.assertEqual(channel.code, 200, channel.result)
+
+        # All the rooms are archived with a contiguous range of stream IDs.
+        self.assertEqual(store.get_max_account_data_stream_id(), stream_id + 3)
+        updated = self.get_success(
+            store.get_updated_room_account_data_for_user(user_id, stream_id)
+        )
+        self.assertEqual(set(updated), set(room_ids))
+
+        for room_id in room_ids:
+            done = self.get_success(
+                store.get_account_data_for_room_and_type(
+                    user_id, room_id, "com.beeper.inbox.done"
+                )
+            )
+            assert done is not None
+            self.assertEqual(done["updated_ts"], done["at_ts"])
+
+        channel = self.make_request(
+            "POST",
+            "/_matrix/client/unstable/com.beeper.inbox/batch_archive",
+            {"room_ids": "!notalist:test"},
+            access_token=tok,
+        )
+        self.assertEqual(channel.code, 400, channel.result)
@@ -20,7 +20,7 @@
 #
 import json
 from contextlib import contextmanager
-from typing import Generator, List, Tuple
+from typing import Any, Collection, Dict, Generator, List, Mapping, Tuple
 from unittest import mock
 
 from twisted.enterprise.adbapi import ConnectionPool
@@ -33,11 +33,14 @@ from synapse.logging.context import LoggingContext
 from synapse.rest import admin
 from synapse.rest.client import login, room
 from synapse.server import HomeServer
+from synapse.storage.databases.main import events_worker
 from synapse.storage.databases.main.events_worker import (
     EVENT_QUEUE_THREADS,
     EventsWorkerStore,
+    _FetchedEvent,
 )
 from synapse.storage.types import Connection
+from synapse.types import JsonDict
 from synapse.util import Clock
 from synapse.util.async_helpers import yieldable_gather_results
 
@@ -295,6 +298,220 @@ class EventCacheTestCase(unittest.HomeserverTestCase):
             self.assertEqual(ctx.get_resource_usage().evt_db_fetch_count, 1)
 
 
+class SharedEventCacheTestCase(unittest.HomeserverTestCase):
+    """Test that event rows are shared between workers through the external cache."""
+
+    servlets = [
+        admin.register_servlets,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def default_config(self) -> JsonDict:
+        config = super().default_config()
+        config["experimental_features"] = {"beeper_shared_event_cache_enabled": True}
+        return config
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.store: EventsWorkerStore = hs.get_datastores().main
+
+        # Stand in for redis with dicts of the values and their versions.
+        self.shared: Dict[str, Any] = {}
+        self.versions: Dict[str, int] = {}
+
+        async def get_many_versioned(
+            cache_name: str, keys: Collection[str]
+        ) -> Tuple[Dict[str, Any], Dict[str, int]]:
+            return (
+                {key: self.shared[key] for key in keys if key in self.shared},
+                {key: self.versions[key] for key in keys if key in self.versions},
+            )
+
+        async def set_many_if_unchanged(
+            cache_name: str,
+            values: Mapping[str, Any],
+            versions: Mapping[str, int],
+            expiry_ms: int,
+        ) -> None:
+            for key, value in values.items():
+                if self.versions.get(key) == versions.get(key):
+                    self.shared[key] = value
+
+        async def invalidate_many(
+            cache_name: str, keys: Collection[str], expiry_ms: int
+        ) -> None:
+            for key in keys:
+                self.shared.pop(key, None)
+                self.versions[key] = self.versions.get(key, 0) + 1
+
+        external_cache = mock.Mock(
+            get_many_versioned=get_many_versioned,
+            set_many_if_unchanged=set_many_if_unchanged,
+            invalidate_many=invalidate_many,
+        )
+        self.store._shared_event_cache = external_cache
+
+        self.user = self.register_user("user", "pass")
+        self.token = self.login(self.user, "pass")
+
+        self.room = self.helper.create_room_as(self.user, tok=self.token)
+
+        res = self.helper.send(self.room, tok=self.token)
+        self.event_id = res["event_id"]
+
+        self.store._invalidate_local_get_event_cache(self.event_id)
+
+    def test_shared_between_workers(self) -> None:
+        """Test that rows fetched from the DB are shared, and that a cold local
+        cache is filled from the shared cache rather than the DB.
+        """
+
+        with LoggingContext("test") as ctx:
+            self.get_success(self.store.get_event(self.event_id))
+            self.assertEqual(ctx.get_resource_usage().evt_db_fetch_count, 1)
+
+        self.assertIn(self.event_id, self.shared)
+
+        # Simulate another worker, which has nothing cached locally.
+        self.store._invalidate_local_get_event_cache(self.event_id)
+
+        with LoggingContext("test") as ctx, mock.patch.object(
+            self.store, "_fetch_event_list", wraps=self.store._fetch_event_list
+        ) as fetch_event_list:
+            event = self.get_success(self.store.get_event(self.event_id))
+            self.assertEqual(ctx.get_resource_usage().evt_db_fetch_count, 0)
+
+        # The event was built from the shared row on a fetch thread.
+        ((_, event_list), _) = fetch_event_list.call_args
+        ((event_ids, rows, _),) = event_list
+        self.assertEqual(list(event_ids), [])
+        self.assertEqual(list(rows), [self.event_id])
+
+        self.assertEqual(event.event_id, self.event_id)
+        self.assertEqual(event.room_id, self.room)
+
+    def test_invalidation(self) -> None:
+        """Test that invalidating an event removes it from the shared cache."""
+
+        self.get_success(self.store.get_event(self.event_id))
+        self.assertIn(self.event_id, self.shared)
+
+        self.get_success(self.store._invalidate_async_get_event_cache(self.event_id))
+        self.assertNotIn(self.event_id, self.shared)
+
+        # The event is fetched from the DB again, and shared again.
+        self.store._invalidate_local_get_event_cache(self.event_id)
+        with LoggingContext("test") as ctx:
+            self.get_success(self.store.get_event(self.event_id))
+            self.assertEqual(ctx.get_resource_usage().evt_db_fetch_count, 1)
+
+        self.assertIn(self.event_id, self.shared)
+
+    def test_invalidation_during_fetch(self) -> None:
+        """Test that a row fetched from the DB before the event was invalidated
+        isn't written back to the shared cache.
+        """
+        enqueue_events = self.store._enqueue_events
+
+        async def _enqueue_events(events: Collection[str], rows: Any = None) -> Any:
+            fetched = await enqueue_events(events, rows)
+            # The event is, say, redacted by another worker after its row was
+            # fetched.
+            await self.store._invalidate_async_get_event_cache(self.event_id)
+            return fetched
+
+        with mock.patch.object(self.store, "_enqueue_events", _enqueue_events):
+            self.get_success(self.store.get_event(self.event_id))
+
+        self.assertNotIn(self.event_id, self.shared)
+
+
+class EventFetchTestCase(unittest.HomeserverTestCase):
+    """Test fetching batches of events from the database."""
+
+    servlets = [
+        admin.register_servlets,
+        room.register_servlets,
+        login.register_servlets,
+    ]
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.store: EventsWorkerStore = hs.get_datastores().main
+
+        self.user = self.register_user("user", "pass")
+        self.token = self.login(self.user, "pass")
+
+        self.room = self.helper.create_room_as(self.user, tok=self.token)
+
+        self.event_ids = [
+            self.helper.send(self.room, body=str(i), tok=self.token)["event_id"]
+            for i in range(5)
+        ]
+
+        self.store._get_event_cache.clear()
+
+    @mock.patch.object(events_worker, "EVENT_FETCH_BATCH_SIZE", 1)
+    def test_stream_results(self) -> None:
+        """Test that each request is completed as soon as its events have been
+        fetched, with the events built on the fetch thread.
+        """
+        batches: List[Collection[str]] = []
+        fetch_event_rows = self.store._fetch_event_rows
+
+        def _fetch_event_rows(txn: Any, event_ids: Collection[str]) -> Any:
+            batches.append(event_ids)
+            return fetch_event_rows(txn, event_ids)
+
+        # Record how many batches had been fetched each time requests were
+        # completed.
+        completed_after: List[int] = []
+        call_from_thread = self.reactor.callFromThread
+
+        def _call_from_thread(f: Any, *args: Any) -> None:
+            if "_fetch_event_list" in f.__qualname__:
+                completed_after.append(len(batches))
+            call_from_thread(f, *args)
+
+        first: "Deferred[Dict[str, _FetchedEvent]]" = Deferred()
+        second: "Deferred[Dict[str, _FetchedEvent]]" = Deferred()
+        with mock.patch.object(
+            self.store, "_fetch_event_rows", _fetch_event_rows
+        ), mock.patch.object(self.reactor, "callFromThread", _call_from_thread):
+            self.get_success(
+                self.store.db_pool.runWithConnection(
+                    self.store._fetch_event_list,
+                    [
+                        (self.event_ids[:1], {}, first),
+                        (self.event_ids[:3] + ["$unknown"], {}, second),
+                    ],
+                )
+            )
+
+        self.assertEqual(completed_after, [1, 4])
+
+        result = self.successResultOf(first)
+        self.assertEqual(list(result), self.event_ids[:1])
+
+        result = self.successResultOf(second)
+        self.assertEqual(list(result), self.event_ids[:3])
+        event = result[self.event_ids[2]].event
+        assert event is not None
+        self.assertEqual(event.content["body"], "2")
+
+    @mock.patch.object(events_worker, "EVENT_QUEUE_MAX_EVENTS", 2)
+    def test_split_request(self) -> None:
+        """Test that large requests are split up between fetch threads."""
+        with LoggingContext("test"):
+            d = ensureDeferred(self.store.get_events_as_list(self.event_ids))
+
+            # The request was split up, and a thread started for each part.
+            self.assertEqual(self.store._event_fetch_ongoing, EVENT_QUEUE_THREADS)
+
+            events = self.get_success(d)
+
+        self.assertEqual([e.event_id for e in events], self.event_ids)
+
+
 class DatabaseOutageTestCase(unittest.HomeserverTestCase):
     """Test event fetching during a database outage."""
 
@@ -0,0 +1,124 @@
+# Beep beep!
+
+from typing import Any, List, Tuple
+from unittest.mock import Mock
+
+from twisted.internet import defer
+
+from synapse.logging.context import LoggingContext, current_context
+
+from tests import unittest
+from tests.server import ThreadedMemoryReactorClock
+
+try:
+    import greenlet  # noqa: F401
+    import psycopg2.extensions
+
+    from synapse.storage.async_pool import AsyncConnectionPool, _wait_callback
+
+    HAS_GREENLET = True
+except ImportError:
+    HAS_GREENLET = False
+
+
+class _FakeConnection:
+    """Pretends to wait for the database until told it has replied."""
+
+    closed = 0
+
+    def __init__(self) -> None:
+        self.replied = False
+
+    def poll(self) -> int:
+        if self.replied:
+            self.replied = False
+            return psycopg2.extensions.POLL_OK
+        return psycopg2.extensions.POLL_READ
+
+    def fileno(self) -> int:
+        return id(self)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def cursor(self) -> Mock:
+        return Mock()
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+class AsyncConnectionPoolTestCase(unittest.TestCase):
+    if not HAS_GREENLET:
+        skip = "requires greenlet and psycopg2"
+
+    def setUp(self) -> None:
+        self.reactor = ThreadedMemoryReactorClock()
+        self.pool = AsyncConnectionPool(
+            self.reactor, max_connections=2, openfun=lambda conn: None, connkw={}
+        )
+        self.connections: List[_FakeConnection] = []
+
+        def connect() -> _FakeConnection:
+            conn = _FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+        self.pool.connect = connect  # type: ignore[method-assign,assignment]
+
+    def tearDown(self) -> None:
+        psycopg2.extensions.set_wait_callback(None)
+
+    def _reply(self) -> None:
+        """Reply to every connection waiting for the database."""
+        for reader in list(self.reactor.readers):
+            reader._greenlet.conn._connection.replied = True
+            reader.doRead()
+
+    def test_interactions(self) -> None:
+        """Interactions run concurrently while they wait for the database, up to
+        the limit on connections.
+        """
+        calls: List[Tuple[str, int]] = []
+
+        def interaction(conn: Any, name: str) -> str:
+            for i in range(2):
+                calls.append((name, i))
+                _wait_callback(conn._connection)
+            if name == "fail":
+                raise ValueError(name)
+            return name
+
+        with LoggingContext("test") as context:
+            d1 = self.pool.runWithConnection(interaction, "a")
+            d2 = self.pool.runWithConnection(interaction, "b")
+            d3 = self.pool.runWithConnection(interaction, "fail")
+            self.assertIs(current_context(), context)
+
+        # The first two interactions are waiting for the database, and the
+        # third for a connection.
+        self.assertEqual(calls, [("a", 0), ("b", 0)])
+        self.assertEqual(len(self.connections), 2)
+
+        self._reply()
+        self.assertCountEqual(calls[2:], [("a", 1), ("b", 1)])
+        self._reply()
+        self.assertEqual(self.successResultOf(d1), "a")
+        self.assertEqual(self.successResultOf(d2), "b")
+
+        self._reply()
+        self._reply()
+        self.failureResultOf(d3, ValueError)
+
+        # The connections are reused.
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(len(self.pool._free_connections), 2)
+
+    def test_no_wait(self) -> None:
+        """Interactions which don't wait for the database finish straight away."""
+        d: "defer.Deferred[Any]" = self.pool.runWithConnection(lambda conn: 1)
+        self.assertEqual(self.successResultOf(d), 1)
+        self.assertEqual(len(self.connections), 1)
@@ -41,6 +41,8 @@ class SQLBaseStoreTestCase(unittest.TestCase):
         # This is the Twisted connection pool.
         conn_pool = Mock(spec=["runInteraction", "runWithConnection"])
         self.mock_txn = Mock()
+        # As for a SELECT on sqlite, unless a test says otherwise.
+        self.mock_txn.rowcount = -1
         if USE_POSTGRES_FOR_TESTS:
             # To avoid testing psycopg2 itself, patch execute_batch/execute_values
             # to assert how it is called.
@@ -102,10 +104,15 @@ class SQLBaseStoreTestCase(unittest.TestCase):
         fake_engine.module.IntegrityError = engine.module.IntegrityError
         # Don't convert param style to make assertions easier.
         fake_engine.convert_param_style = lambda sql: sql
+        fake_engine.prepared_statement_threshold = None
         # To fix isinstance(...) checks.
         fake_engine.__class__ = engine.__class__  # type: ignore[assignment]
 
-        db = DatabasePool(Mock(), Mock(config=db_config), fake_engine)
+        db = DatabasePool(
+            Mock(),
+            Mock(config=db_config, replicas=[], profile_interactions=False),
+            fake_engine,
+        )
         db._db_pool = conn_pool
 
         self.datastore = SQLBaseStore(db, None, hs)  # type: ignore[arg-type]
@@ -0,0 +1,421 @@
+from typing import List, Mapping, Optional, Tuple, cast
+from unittest.mock import patch
+
+from twisted.test.proto_helpers import MemoryReactor
+
+import synapse.rest.admin
+from synapse.api.constants import EventTypes, RelationTypes
+from synapse.rest.client import login, receipts, room
+from synapse.server import HomeServer
+from synapse.types import JsonDict
+from synapse.util import Clock
+
+from tests import unittest
+
+
+class BeeperRoomPreviewsStoreTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets,
+        login.register_servlets,
+        room.register_servlets,
+    ]
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.store = hs.get_datastores().main
+
+        self.user_id = self.register_user("kermit", "monkey")
+        self.tok = self.login("kermit", "monkey")
+        self.user_id_2 = self.register_user("kermit2", "monkey")
+        self.tok_2 = self.login("kermit2", "monkey")
+
+        self.room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+        self.helper.join(self.room_id, self.user_id_2, tok=self.tok_2)
+
+    def _get_preview(self, user_id: str) -> Optional[Tuple[str, int]]:
+        return self.get_success(
+            self.store.beeper_preview_event_for_room_id_and_user_id(
+                self.room_id, user_id, self.store.get_room_max_token()
+            )
+        )
+
+    def _compute_preview(self, user_id: str) -> Optional[Tuple[str, int]]:
+        return self.get_success(
+            self.store.db_pool.runInteraction(
+                "_compute_preview",
+                self.store._beeper_compute_preview_txn,
+                self.room_id,
+                user_id,
+                self.store.get_room_max_token().stream,
+            )
+        )
+
+    def _assert_previews(self, expected_1: str, expected_2: str) -> None:
+        """Check the materialized previews for both users match the expected event
+        IDs and those computed directly from the events table."""
+        for user_id, expected in (
+            (self.user_id, expected_1),
+            (self.user_id_2, expected_2),
+        ):
+            preview = self._get_preview(user_id)
+            assert preview is not None
+            self.assertEqual(preview[0], expected)
+            self.assertEqual(preview, self._compute_preview(user_id))
+
+    def _react(self, event_id: str, tok: str) -> str:
+        return self.helper.send_event(
+            self.room_id,
+            EventTypes.Reaction,
+            {
+                "m.relates_to": {
+                    "rel_type": RelationTypes.ANNOTATION,
+                    "event_id": event_id,
+                    "key": "👍",
+                }
+            },
+            tok=tok,
+        )["event_id"]
+
+    def _edit(self, event_id: str, tok: str) -> str:
+        return self.helper.send_event(
+            self.room_id,
+            EventTypes.Message,
+            {
+                "body": "edit",
+                "msgtype": "m.text",
+                "m.relates_to": {
+                    "rel_type": RelationTypes.REPLACE,
+                    "event_id": event_id,
+                },
+            },
+            tok=tok,
+        )["event_id"]
+
+    def _redact(self, event_id: str, tok: str) -> None:
+        channel = self.make_request(
+            "POST",
+            f"/_matrix/client/r0/rooms/{self.room_id}/redact/{event_id}",
+            {},
+            access_token=tok,
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+
+    def test_materialized_previews(self) -> None:
+        """The materialized previews track messages, edits, reactions and
+        redactions."""
+        self.assertIsNone(self._get_preview(self.user_id))
+
+        message_1 = self.helper.send(self.room_id, "hello", tok=self.tok)["event_id"]
+        message_2 = self.helper.send(self.room_id, "hi", tok=self.tok_2)["event_id"]
+        self._assert_previews(message_2, message_2)
+
+        # Edits of the preview replace it, edits of other events are ignored.
+        self._edit(message_1, self.tok)
+        self._assert_previews(message_2, message_2)
+        edit = self._edit(message_2, self.tok_2)
+        self._assert_previews(edit, edit)
+
+        # Reactions are only the preview for the sender of the reacted-to event.
+        reaction_1 = self._react(message_1, self.tok_2)
+        self._assert_previews(reaction_1, edit)
+        reaction_2 = self._react(message_2, self.tok)
+        self._assert_previews(reaction_1, reaction_2)
+
+        # Redacting the edit falls back to the original message.
+        self._redact(reaction_2, self.tok)
+        self._redact(edit, self.tok_2)
+        self._assert_previews(reaction_1, message_2)
+
+        # Redacting a reacted-to event removes its reactions from the preview.
+        self._redact(message_1, self.tok)
+        self._assert_previews(message_2, message_2)
+
+        self._redact(message_2, self.tok_2)
+        self.assertIsNone(self._get_preview(self.user_id))
+        self.assertIsNone(self._compute_preview(self.user_id))
+
+    def test_populate_background_update(self) -> None:
+        """The background update fills in previews for existing rooms."""
+        message = self.helper.send(self.room_id, "hello", tok=self.tok)["event_id"]
+        edit = self._edit(message, self.tok)
+        reaction = self._react(message, self.tok_2)
+
+        for table in ("beeper_room_previews", "beeper_user_room_previews"):
+            self.get_success(
+                self.store.db_pool.simple_delete(
+                    table=table,
+                    keyvalues={"room_id": self.room_id},
+                    desc="delete_previews",
+                )
+            )
+
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                table="background_updates",
+                values={
+                    "update_name": "beeper_room_previews_populate",
+                    "progress_json": "{}",
+                },
+            )
+        )
+        self.store.db_pool.updates._all_done = False
+        self.store._beeper_previews_populated = False
+
+        # Until the update completes previews are computed from the events table.
+        self._assert_previews(reaction, edit)
+
+        self.wait_for_background_updates()
+
+        self._assert_previews(reaction, edit)
+        self.assertTrue(
+            self.get_success(self.store._beeper_have_materialized_previews())
+        )
+
+    def test_bulk_previews(self) -> None:
+        """Previews for many rooms can be fetched at once."""
+        room_id_2 = self.helper.create_room_as(self.user_id, tok=self.tok)
+        room_id_3 = self.helper.create_room_as(self.user_id, tok=self.tok)
+
+        message_1 = self.helper.send(self.room_id, "hello", tok=self.tok)["event_id"]
+        message_2 = self.helper.send(room_id_2, "hello", tok=self.tok)["event_id"]
+        reaction = self._react(message_1, self.tok_2)
+
+        previews = self.get_success(
+            self.store.beeper_preview_events_for_room_ids_and_user_id(
+                [self.room_id, room_id_2, room_id_3],
+                self.user_id,
+                self.store.get_room_max_token(),
+            )
+        )
+        self.assertEqual(
+            {room_id: preview and preview[0] for room_id, preview in previews.items()},
+            {self.room_id: reaction, room_id_2: message_2, room_id_3: None},
+        )
+        self.assertEqual(previews[self.room_id], self._get_preview(self.user_id))
+
+    def test_preview_cache(self) -> None:
+        """Cached previews are reused until an event which may change the preview
+        is persisted in the room."""
+        message = self.helper.send(self.room_id, "hello", tok=self.tok)["event_id"]
+        self._assert_previews(message, message)
+        cached_at, _ = self.store._beeper_preview_cache[(self.room_id, self.user_id)]
+
+        # State events don't change the preview, so the cached entry is used.
+        self.helper.send_state(
+            self.room_id, EventTypes.Topic, {"topic": "topic"}, tok=self.tok
+        )
+        self._assert_previews(message, message)
+        self.assertEqual(
+            self.store._beeper_preview_cache[(self.room_id, self.user_id)][0],
+            cached_at,
+        )
+
+        # Reactions may, so the preview is recomputed.
+        reaction = self._react(message, self.tok_2)
+        self._assert_previews(reaction, message)
+        self.assertGreater(
+            self.store._beeper_preview_cache[(self.room_id, self.user_id)][0],
+            cached_at,
+        )
+
+        # Purging the room's history drops its entries.
+        self.store._invalidate_caches_for_room_events(self.room_id)
+        self.assertNotIn((self.room_id, self.user_id), self.store._beeper_preview_cache)
+
+
+class BeeperNotificationCountsStoreTestCase(unittest.HomeserverTestCase):
+    servlets = [
+        synapse.rest.admin.register_servlets,
+        login.register_servlets,
+        receipts.register_servlets,
+        room.register_servlets,
+    ]
+
+    def default_config(self) -> JsonDict:
+        config = super().default_config()
+        config["experimental_features"] = {
+            "beeper_user_notification_counts_enabled": True
+        }
+        return config
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.store = hs.get_datastores().main
+
+    def _insert_counts(self, user_id: str, room_id: str, stream_ordering: int) -> None:
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                table="beeper_user_notification_counts",
+                values={
+                    "user_id": user_id,
+                    "room_id": room_id,
+                    "thread_id": "main",
+                    "event_stream_ordering": stream_ordering,
+                    "notifs": 1,
+                    "unreads": 1,
+                    "highlights": 0,
+                },
+            )
+        )
+
+    def _get_counts(self) -> List[Tuple[str, str, int, int]]:
+        rows = self.get_success(
+            self.store.db_pool.simple_select_list(
+                table="beeper_user_notification_counts",
+                keyvalues=None,
+                retcols=("user_id", "room_id", "event_stream_ordering", "notifs"),
+            )
+        )
+        return sorted(cast(List[Tuple[str, str, int, int]], rows))
+
+    def test_aggregate_up_to_watermark(self) -> None:
+        """Rows up to the upper bound are collapsed per (user, room) and the
+        watermark advances, rows after it are left alone."""
+        for stream_ordering in (1, 2, 3, 5):
+            self._insert_counts("@a:test", "!r1:test", stream_ordering)
+        self._insert_counts("@a:test", "!r2:test", 2)
+        for stream_ordering in (3, 4):
+            self._insert_counts("@b:test", "!r1:test", stream_ordering)
+
+        aggregated = self.get_success(
+            self.store._beeper_aggregate_notification_counts_up_to(4)
+        )
+        self.assertEqual(aggregated, 3)
+        self.assertEqual(
+            self._get_counts(),
+            [
+                ("@a:test", "!r1:test", 3, 3),
+                ("@a:test", "!r1:test", 5, 1),
+                ("@a:test", "!r2:test", 2, 1),
+                ("@b:test", "!r1:test", 4, 2),
+            ],
+        )
+        self.assertEqual(self.store._notification_counts_watermark, 4)
+
+        # Only partitions with new rows since the watermark are aggregated again.
+        self._insert_counts("@a:test", "!r1:test", 6)
+        aggregated = self.get_success(
+            self.store._beeper_aggregate_notification_counts_up_to(6)
+        )
+        self.assertEqual(aggregated, 2)
+        self.assertEqual(
+            self._get_counts(),
+            [
+                ("@a:test", "!r1:test", 6, 5),
+                ("@a:test", "!r2:test", 2, 1),
+                ("@b:test", "!r1:test", 4, 2),
+            ],
+        )
+
+    @patch(
+        "synapse.storage.databases.main.beeper.NOTIFICATION_COUNTS_AGGREGATION_BATCH_SIZE",
+        2,
+    )
+    def test_aggregate_in_batches(self) -> None:
+        """Partitions are aggregated a batch at a time, carrying on after the
+        last partition of the previous batch."""
+        for user_id in ("@a:test", "@b:test", "@c:test"):
+            for stream_ordering in (1, 2, 3):
+                self._insert_counts(user_id, "!r1:test", stream_ordering)
+
+        aggregated = self.get_success(
+            self.store._beeper_aggregate_notification_counts_up_to(3), by=0.1
+        )
+        self.assertEqual(aggregated, 6)
+        self.assertEqual(
+            self._get_counts(),
+            [
+                ("@a:test", "!r1:test", 3, 3),
+                ("@b:test", "!r1:test", 3, 3),
+                ("@c:test", "!r1:test", 3, 3),
+            ],
+        )
+
+        backlog = self.get_success(
+            self.store.db_pool.runInteraction(
+                "backlog", self.store._beeper_count_notification_counts_backlog_txn
+            )
+        )
+        self.assertEqual(backlog, 0)
+
+    def test_unread_counts_by_room(self) -> None:
+        """Badge counts are read from the notification counts and the cache is
+        invalidated by new notifications, receipts and leaving the room."""
+        user_id = self.register_user("kermit", "monkey")
+        tok = self.login("kermit", "monkey")
+        self.register_user("kermit2", "monkey")
+        tok_2 = self.login("kermit2", "monkey")
+
+        room_id = self.helper.create_room_as(user_id, tok=tok)
+        self.helper.join(room_id, "@kermit2:test", tok=tok_2)
+
+        def get_counts() -> Mapping[str, int]:
+            return self.get_success(
+                self.store.beeper_get_unread_counts_by_room_for_user(user_id)
+            )
+
+        self.assertEqual(get_counts(), {})
+
+        self.helper.send(room_id, "hello", tok=tok_2)
+        self.assertEqual(get_counts(), {room_id: 1})
+        last_event_id = self.helper.send(room_id, "hi", tok=tok_2)["event_id"]
+        self.assertEqual(get_counts(), {room_id: 2})
+        self.assertEqual(
+            get_counts(),
+            self.get_success(self.store.get_unread_counts_by_room_for_user(user_id)),
+        )
+
+        channel = self.make_request(
+            "POST",
+            f"/rooms/{room_id}/receipt/m.read/{last_event_id}",
+            {},
+            access_token=tok,
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+        self.assertEqual(get_counts(), {})
+
+        self.helper.send(room_id, "hello again", tok=tok_2)
+        self.assertEqual(get_counts(), {room_id: 1})
+        self.helper.leave(room_id, user_id, tok=tok)
+        self.assertEqual(get_counts(), {})
+
+    def test_prune_background_update(self) -> None:
+        """The background update deletes counts for rooms the user isn't joined
+        to and tombstoned rooms."""
+        user_id = self.register_user("kermit", "monkey")
+        tok = self.login("kermit", "monkey")
+
+        joined_room_id = self.helper.create_room_as(user_id, tok=tok)
+        left_room_id = self.helper.create_room_as(user_id, tok=tok)
+        self.helper.leave(left_room_id, user_id, tok=tok)
+        tombstoned_room_id = self.helper.create_room_as(user_id, tok=tok)
+        self.helper.send_state(
+            tombstoned_room_id,
+            EventTypes.Tombstone,
+            {"replacement_room": joined_room_id},
+            tok=tok,
+        )
+
+        for room_id in (joined_room_id, left_room_id, tombstoned_room_id):
+            self._insert_counts(user_id, room_id, 1)
+        self._insert_counts("@other:test", joined_room_id, 1)
+
+        self.get_success(
+            self.store.db_pool.simple_insert(
+                table="background_updates",
+                values={
+                    "update_name": "beeper_user_notification_counts_prune",
+                    "progress_json": "{}",
+                },
+            )
+        )
+        self.store.db_pool.updates._all_done = False
+        self.wait_for_background_updates()
+
+        self.assertEqual(self._get_counts(), [(user_id, joined_room_id, 1, 1)])
+
+        # The prune is scheduled again periodically, for users who have left
+        # since it last ran.
+        self.helper.leave(joined_room_id, user_id, tok=tok)
+        self.get_success(self.store.beeper_schedule_notification_counts_prune())
+        self.wait_for_background_updates()
+
+        self.assertEqual(self._get_counts(), [])
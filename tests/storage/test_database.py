@@ -19,8 +19,9 @@
 #
 #
 
-from typing import Callable, Tuple
-from unittest.mock import Mock, call
+from typing import Callable, List, Tuple
+from unittest import SkipTest
+from unittest.mock import Mock, call, patch
 
 from twisted.internet import defer
 from twisted.internet.defer import CancelledError, Deferred
@@ -31,8 +32,11 @@ from synapse.storage.database import (
     DatabasePool,
     LoggingDatabaseConnection,
     LoggingTransaction,
+    _get_statement_cache,
+    _Statement,
     make_tuple_comparison_clause,
 )
+from synapse.storage.engines import PostgresEngine, create_engine
 from synapse.util import Clock
 
 from tests import unittest
@@ -286,3 +290,228 @@ class CancellationTestCase(unittest.HomeserverTestCase):
             ]
         )
         self.assertEqual(exception_callback.call_count, 6)  # no additional calls
+
+
+class StatementCacheTestCase(unittest.HomeserverTestCase):
+    """Tests for the statements cached by `LoggingTransaction`."""
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.store = hs.get_datastores().main
+        self.db_pool: DatabasePool = self.store.db_pool
+        self.get_success(
+            self.db_pool.runInteraction(
+                "create",
+                lambda txn: txn.execute(
+                    "CREATE TABLE foo (name TEXT PRIMARY KEY, value INTEGER)"
+                ),
+            )
+        )
+        self.get_success(
+            self.db_pool.simple_insert_many(
+                "foo",
+                keys=("name", "value"),
+                values=[("a", 1), ("b", 2)],
+                desc="insert",
+            )
+        )
+
+    def test_statement_cached(self) -> None:
+        """Statements are normalised once, and shared between transactions."""
+        sql = """
+            SELECT value
+            FROM foo WHERE name = ?
+        """
+
+        def get_statement(txn: LoggingTransaction) -> _Statement:
+            txn.execute(sql, ("a",))
+            self.assertEqual(txn.fetchall(), [(1,)])
+            return txn._get_statement(sql)
+
+        statement = self.get_success(
+            self.db_pool.runInteraction("get_statement", get_statement)
+        )
+        self.assertEqual(statement.one_line_sql, "SELECT value FROM foo WHERE name = ?")
+        self.assertEqual(
+            statement.engine_sql, self.db_pool.engine.convert_param_style(sql)
+        )
+        self.assertEqual(statement.verb, "SELECT")
+        self.assertTrue(statement.preparable)
+
+        self.assertIs(
+            self.get_success(
+                self.db_pool.runInteraction("get_statement", get_statement)
+            ),
+            statement,
+        )
+
+    def test_prepared_statements(self) -> None:
+        """Statements executed often enough are prepared, and give the same
+        results as when they are not prepared.
+        """
+        if not isinstance(self.db_pool.engine, PostgresEngine):
+            raise SkipTest("Prepared statements are only used on postgres")
+        self.db_pool.engine.prepared_statement_threshold = 1
+
+        def select(txn: LoggingTransaction) -> List[Tuple[int, ...]]:
+            results: List[Tuple[int, ...]] = []
+            for name in ("a", "b", "a"):
+                txn.execute("SELECT value FROM foo WHERE name = ?", (name,))
+                results.extend(txn.fetchall())
+            return results
+
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("select", select)),
+            [(1,), (2,), (1,)],
+        )
+
+    def test_statement_name(self) -> None:
+        """Statements keep the same name if they are cached again."""
+
+        def get_name(txn: LoggingTransaction) -> str:
+            return txn._get_statement("SELECT value FROM foo").name
+
+        name = self.get_success(self.db_pool.runInteraction("get_name", get_name))
+        _get_statement_cache(self.db_pool.engine).clear()
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("get_name", get_name)), name
+        )
+
+    @patch("synapse.storage.engines.postgres._MAX_PREPARED_STATEMENTS", 1)
+    def test_prepared_statements_deallocated(self) -> None:
+        """Statements are deallocated when too many are prepared."""
+        if not isinstance(self.db_pool.engine, PostgresEngine):
+            raise SkipTest("Prepared statements are only used on postgres")
+        self.db_pool.engine.prepared_statement_threshold = 0
+
+        def select(txn: LoggingTransaction) -> List[Tuple[int, ...]]:
+            results: List[Tuple[int, ...]] = []
+            for column in ("value", "name", "value"):
+                txn.execute(f"SELECT {column} FROM foo WHERE name = ?", ("a",))
+                results.extend(txn.fetchall())
+
+            txn.execute("SELECT COUNT(*) FROM pg_prepared_statements")
+            results.extend(txn.fetchall())
+            return results
+
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("select", select)),
+            [(1,), ("a",), (1,), (1,)],
+        )
+
+    def test_prepared_statement_result_type_changed(self) -> None:
+        """Transactions are retried if a prepared statement must be prepared
+        again, as its result type has changed.
+        """
+        if not isinstance(self.db_pool.engine, PostgresEngine):
+            raise SkipTest("Prepared statements are only used on postgres")
+        self.db_pool.engine.prepared_statement_threshold = 0
+
+        def select(txn: LoggingTransaction) -> List[Tuple[int, ...]]:
+            txn.execute("SELECT * FROM foo WHERE name = ?", ("a",))
+            return txn.fetchall()
+
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("select", select)),
+            [("a", 1)],
+        )
+
+        self.get_success(
+            self.db_pool.runInteraction(
+                "alter",
+                lambda txn: txn.execute("ALTER TABLE foo ADD COLUMN extra INTEGER"),
+            )
+        )
+
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("select", select)),
+            [("a", 1, None)],
+        )
+
+
+class CopyManyTestCase(unittest.HomeserverTestCase):
+    """Tests for `simple_copy_many_txn`."""
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.db_pool: DatabasePool = hs.get_datastores().main.db_pool
+        self.get_success(
+            self.db_pool.runInteraction(
+                "create",
+                lambda txn: txn.execute(
+                    "CREATE TABLE foo (id BIGINT, name TEXT, flag BOOLEAN, data BYTEA)"
+                ),
+            )
+        )
+
+    def _copy_many(self, rows: List[Tuple]) -> bool:
+        """Insert the rows with `simple_copy_many_txn`, and check that they
+        were all inserted intact.
+
+        Returns:
+            Whether the rows were inserted with COPY.
+        """
+        copy_from = Mock(wraps=LoggingTransaction.copy_from)
+
+        def copy(txn: LoggingTransaction) -> None:
+            with patch.object(LoggingTransaction, "copy_from", copy_from):
+                self.db_pool.simple_copy_many_txn(
+                    txn, "foo", ("id", "name", "flag", "data"), rows
+                )
+
+        self.get_success(self.db_pool.runInteraction("copy", copy))
+
+        def select(txn: LoggingTransaction) -> List[Tuple]:
+            txn.execute("SELECT id, name, flag, data FROM foo ORDER BY id")
+            return [
+                (id, name, None if flag is None else bool(flag), data and bytes(data))
+                for id, name, flag, data in txn
+            ]
+
+        self.assertEqual(
+            self.get_success(self.db_pool.runInteraction("select", select)), rows
+        )
+
+        return copy_from.called
+
+    @patch("synapse.storage.database.COPY_MIN_ROWS", 3)
+    def test_copy_many(self) -> None:
+        """Rows are inserted with all of their values intact."""
+        rows: List[Tuple] = [
+            (1, "plain", True, b"\x00\x01"),
+            (2, "tab\tnew\nline\rback\\slash \\N", False, b"\\"),
+            (3, None, None, None),
+        ]
+
+        # Rows are only copied on postgres.
+        self.assertEqual(
+            self._copy_many(rows), isinstance(self.db_pool.engine, PostgresEngine)
+        )
+
+    @patch("synapse.storage.database.COPY_MIN_ROWS", 3)
+    def test_insert_few(self) -> None:
+        """Fewer rows than `COPY_MIN_ROWS` are inserted without COPY."""
+        rows: List[Tuple] = [(1, "plain", True, b"\x00\x01"), (2, None, None, None)]
+
+        self.assertFalse(self._copy_many(rows))
+
+
+class EncodeCopyRowsTestCase(unittest.TestCase):
+    """Tests for `PostgresEngine.encode_copy_rows`."""
+
+    def setUp(self) -> None:
+        try:
+            self.engine = create_engine({"name": "psycopg2", "args": {}})
+        except ImportError:
+            raise SkipTest("requires psycopg2")
+
+    def test_encode(self) -> None:
+        """Values are escaped for the text format of COPY."""
+        assert isinstance(self.engine, PostgresEngine)
+        self.assertEqual(
+            self.engine.encode_copy_rows([(1, "a\tb\\c", 1.5), (None, True, b"\x01")]),
+            "1\ta\\tb\\\\c\t1.5\n\\N\tt\t\\\\x01\n",
+        )
+
+    def test_unsupported(self) -> None:
+        """Rows with a value which can't be encoded are not."""
+        assert isinstance(self.engine, PostgresEngine)
+        self.assertIsNone(self.engine.encode_copy_rows([(1, "a"), (2, ["b"])]))
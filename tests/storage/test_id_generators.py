@@ -347,6 +347,39 @@ class MultiWriterIdGeneratorTestCase(HomeserverTestCase):
         self.assertEqual(id_gen.get_positions(), {"master": 11})
         self.assertEqual(id_gen.get_current_token_for_writer("master"), 11)
 
+    def test_allocated_positions(self) -> None:
+        """Test that the allocated positions include IDs which are still being
+        persisted, or have been persisted out of order.
+        """
+
+        # Prefill table with 7 rows written by 'master'
+        self._insert_rows("master", 7)
+
+        id_gen = self._create_id_generator()
+
+        self.assertEqual(id_gen.get_allocated_positions(), {"master": 7})
+
+        ctx1 = id_gen.get_next()
+        ctx2 = id_gen.get_next()
+
+        self.get_success(ctx1.__aenter__())
+        self.get_success(ctx2.__aenter__())
+
+        self.assertEqual(id_gen.get_positions(), {"master": 7})
+        self.assertEqual(id_gen.get_allocated_positions(), {"master": 9})
+
+        # The second ID has been persisted, but the current position can't
+        # advance past the first.
+        self.get_success(ctx2.__aexit__(None, None, None))
+
+        self.assertEqual(id_gen.get_positions(), {"master": 7})
+        self.assertEqual(id_gen.get_allocated_positions(), {"master": 9})
+
+        self.get_success(ctx1.__aexit__(None, None, None))
+
+        self.assertEqual(id_gen.get_positions(), {"master": 9})
+        self.assertEqual(id_gen.get_allocated_positions(), {"master": 9})
+
     def test_multi_instance(self) -> None:
         """Test that reads and writes from multiple processes are handled
         correctly.
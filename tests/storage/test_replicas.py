@@ -0,0 +1,84 @@
+# Beep beep!
+
+from typing import Dict, List
+from unittest.mock import Mock
+
+from twisted.test.proto_helpers import MemoryReactor
+
+from synapse.server import HomeServer
+from synapse.storage.replicas import (
+    REPLICA_SAFE_INTERACTIONS,
+    DatabaseReplica,
+    DatabaseReplicas,
+    _Sample,
+    replica_safe,
+)
+from synapse.util import Clock
+
+from tests import unittest
+
+
+class DatabaseReplicasTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        self.replica = DatabaseReplica("replica", Mock())
+        self.replicas = DatabaseReplicas(
+            hs, Mock(), [self.replica], max_lag_ms=5000, poll_interval_ms=100
+        )
+
+        self.positions: Dict[str, int] = {"writer1": 10, "writer2": 20}
+        self.replicas.register_stream("events", lambda: self.positions)
+
+    def _replay(self, positions: Dict[str, int], ts: int) -> None:
+        self.replica.replayed = _Sample(lsn=1, positions={"events": positions}, ts=ts)
+
+    def test_caught_up(self) -> None:
+        """A replica is used once it has replayed the positions of every writer
+        to the streams depended on.
+        """
+        self.assertIsNone(self.replicas.get_replica(["events"]))
+
+        now = self.clock.time_msec()
+        self._replay({"writer1": 10, "writer2": 19}, now)
+        self.assertIsNone(self.replicas.get_replica(["events"]))
+        self.assertIs(self.replicas.get_replica([]), self.replica)
+
+        self._replay({"writer1": 10, "writer2": 20}, now)
+        self.assertIs(self.replicas.get_replica(["events"]), self.replica)
+
+        # A new writer must have been replayed too.
+        self.positions["writer3"] = 5
+        self.assertIsNone(self.replicas.get_replica(["events"]))
+
+    def test_required_positions(self) -> None:
+        """A replica must have replayed the positions still being written by
+        this process, not just those it has seen persisted.
+        """
+        required_positions = {"writer1": 12, "writer2": 20}
+        self.replicas.register_stream(
+            "events", lambda: self.positions, lambda: required_positions
+        )
+
+        now = self.clock.time_msec()
+        self._replay({"writer1": 10, "writer2": 20}, now)
+        self.assertIsNone(self.replicas.get_replica(["events"]))
+
+        self._replay({"writer1": 12, "writer2": 20}, now)
+        self.assertIs(self.replicas.get_replica(["events"]), self.replica)
+
+    def test_unknown_stream(self) -> None:
+        """A replica isn't used for streams it can't be compared with."""
+        self._replay({"writer1": 10, "writer2": 20}, self.clock.time_msec())
+        self.assertIsNone(self.replicas.get_replica(["events", "unknown"]))
+
+    def test_lag(self) -> None:
+        """A replica isn't used once it has fallen too far behind."""
+        self._replay({"writer1": 10, "writer2": 20}, self.clock.time_msec() - 6000)
+        self.assertIsNone(self.replicas.get_replica([]))
+
+    def test_replica_safe(self) -> None:
+        @replica_safe("events")
+        async def get_things(self: object) -> List[str]:
+            return []
+
+        self.assertEqual(REPLICA_SAFE_INTERACTIONS["get_things"], {"events"})
+        del REPLICA_SAFE_INTERACTIONS["get_things"]
@@ -23,8 +23,14 @@
 from typing import List, Tuple
 from unittest.mock import Mock, patch
 
+from twisted.test.proto_helpers import MemoryReactor
+
+from synapse._scripts.replay_cache_trace import replay
 from synapse.metrics.jemalloc import JemallocStats
+from synapse.server import HomeServer
 from synapse.types import JsonDict
+from synapse.util import Clock
+from synapse.util.caches import memory_budget, trace
 from synapse.util.caches.lrucache import LruCache, setup_expire_lru_cache_entries
 from synapse.util.caches.treecache import TreeCache
 
@@ -286,6 +292,216 @@ class LruCacheSizedTestCase(unittest.HomeserverTestCase):
         )
 
 
+class MemoryBudgetTestCase(unittest.HomeserverTestCase):
+    """Test that caches sharing a memory budget are evicted by size."""
+
+    def default_config(self) -> JsonDict:
+        config = super().default_config()
+
+        config.setdefault("caches", {})["memory_budgets"] = {
+            "test": {"max_size": "10K", "caches": ["cache_a", "*cache_b*"]}
+        }
+
+        return config
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        # Make sure caches from other tests don't count against the budget.
+        memory_budget._budgets.clear()
+
+    def test_evict_across_caches(self) -> None:
+        cache_a: LruCache[str, str] = LruCache(100, "cache_a")
+        cache_b: LruCache[str, str] = LruCache(100, "*cache_b*")
+        other_cache: LruCache[str, str] = LruCache(100, "other_cache")
+
+        # Each of these entries uses a bit over 4K.
+        cache_a["key1"] = "x" * 4000
+        cache_a["key2"] = "x" * 4000
+        other_cache["key1"] = "x" * 4000
+        self.assertGreater(cache_a.memory_bytes, 8000)
+        self.assertEqual(other_cache.memory_bytes, 0)
+
+        # Adding a third entry to the group should evict the oldest entry from
+        # the cache using the most memory.
+        cache_b["key1"] = "x" * 4000
+
+        self.assertIsNone(cache_a.get("key1"))
+        self.assertIsNotNone(cache_a.get("key2"))
+        self.assertIsNotNone(cache_b.get("key1"))
+        self.assertIsNotNone(other_cache.get("key1"))
+        self.assertLessEqual(cache_a.memory_bytes + cache_b.memory_bytes, 10240)
+
+    def test_update_value(self) -> None:
+        cache: LruCache[str, str] = LruCache(100, "cache_a")
+        cache["key1"] = "x"
+        cache["key2"] = "x"
+        small = cache.memory_bytes
+
+        # Replacing a value with a larger one is accounted for.
+        cache["key2"] = "x" * 4000
+        self.assertGreater(cache.memory_bytes, small + 3000)
+
+        # ... and a value too big for the budget empties the cache.
+        cache["key2"] = "x" * 20000
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.memory_bytes, 0)
+
+    def test_config_reload(self) -> None:
+        """Test that caches join and leave a budget when the config changes."""
+        cache: LruCache[str, str] = LruCache(100, "other_cache")
+        cache["key1"] = "x" * 4000
+        cache["key2"] = "x" * 4000
+        self.assertEqual(cache.memory_bytes, 0)
+
+        # Replace the dict rather than changing it, as it is shared with the
+        # config of other tests.
+        self.hs.config.caches.memory_budget_caches = {
+            **self.hs.config.caches.memory_budget_caches,
+            "other_cache": "test",
+        }
+        self.hs.config.caches.resize_all_caches()
+
+        self.assertGreater(cache.memory_bytes, 8000)
+
+        cache["key3"] = "x" * 4000
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(len(cache), 2)
+
+
+class TinyLfuTestCase(unittest.HomeserverTestCase):
+    """Test the "tinylfu" cache policy."""
+
+    def _scan(self, cache: LruCache[int, int]) -> None:
+        # Use a set of keys often, then insert lots of keys just once.
+        for key in range(50):
+            cache[key] = key
+        for _ in range(5):
+            for key in range(50):
+                cache.get(key)
+
+        for key in range(1000, 2000):
+            cache[key] = key
+
+        self.assertEqual(len(cache), 100)
+
+    def test_lru(self) -> None:
+        cache: LruCache[int, int] = LruCache(
+            100, "tinylfu_cache", apply_cache_factor_from_config=False
+        )
+        self._scan(cache)
+
+        # The scan flushed out the frequently used keys.
+        self.assertFalse(any(key in cache for key in range(50)))
+
+    @override_config({"caches": {"per_cache_policies": {"tinylfu_cache": "tinylfu"}}})
+    def test_scan_resistance(self) -> None:
+        cache: LruCache[int, int] = LruCache(
+            100, "tinylfu_cache", apply_cache_factor_from_config=False
+        )
+        self._scan(cache)
+
+        # The frequently used keys survived the scan.
+        self.assertTrue(all(key in cache for key in range(50)))
+
+        # The most recently inserted key is always kept, in the window.
+        self.assertIn(1999, cache)
+
+    @override_config({"caches": {"per_cache_policies": {"tinylfu_cache": "tinylfu"}}})
+    def test_change_policy(self) -> None:
+        cache: LruCache[int, int] = LruCache(
+            100, "tinylfu_cache", apply_cache_factor_from_config=False
+        )
+        self._scan(cache)
+
+        # Replace the dict rather than clearing it, as it is shared with the
+        # config of other tests.
+        self.hs.config.caches.cache_policies = {}
+        self.hs.config.caches.resize_all_caches()
+
+        # Nothing is lost when switching back to LRU, and newly added entries
+        # evict the least recently used entry.
+        self.assertEqual(len(cache), 100)
+        cache[2000] = 2000
+        self.assertEqual(len(cache), 100)
+        self.assertIn(1999, cache)
+        self.assertIn(2000, cache)
+
+
+class CacheTraceTestCase(unittest.HomeserverTestCase):
+    """Test recording traces of cache lookups, and replaying them."""
+
+    def default_config(self) -> JsonDict:
+        config = super().default_config()
+
+        self.trace_dir = self.mktemp()
+        config.setdefault("caches", {})["access_trace"] = {
+            "directory": self.trace_dir,
+            "caches": ["traced_cache"],
+            "sample_rate": 1,
+        }
+
+        return config
+
+    def prepare(self, reactor: MemoryReactor, clock: Clock, hs: HomeServer) -> None:
+        trace._recorders.clear()
+
+    def _read_trace(self, cache: LruCache) -> Tuple[trace.TraceHeader, List[int]]:
+        recorder = cache.trace_recorder
+        assert recorder is not None
+        recorder.flush()
+        with open(recorder.path, "rb") as f:
+            header, records = trace.read_trace(f)
+            return header, [kind for kind, _ in records]
+
+    def test_record(self) -> None:
+        cache: LruCache[str, str] = LruCache(
+            2, "traced_cache", apply_cache_factor_from_config=False
+        )
+        untraced_cache: LruCache[str, str] = LruCache(2, "other_cache")
+        self.assertIsNone(untraced_cache.trace_recorder)
+
+        cache.get("key1")
+        cache["key1"] = "value"
+        cache.get("key1")
+        cache.get("key1", update_metrics=False)
+        cache.pop("key1")
+        cache["key2"] = "value"
+        cache["key3"] = "value"
+        cache["key4"] = "value"
+        cache.clear()
+
+        header, kinds = self._read_trace(cache)
+        self.assertEqual(header.cache_name, "traced_cache")
+        self.assertEqual(header.max_size, 2)
+        self.assertEqual(header.sample_rate, 1.0)
+        self.assertEqual(
+            kinds,
+            [trace.MISS, trace.HIT, trace.INVALIDATE, trace.EVICT, trace.CLEAR],
+        )
+
+    def test_replay(self) -> None:
+        cache: LruCache[int, int] = LruCache(
+            10, "traced_cache", apply_cache_factor_from_config=False
+        )
+        for i in range(100):
+            key = i % 15
+            if cache.get(key) is None:
+                cache[key] = key
+
+        recorder = cache.trace_recorder
+        assert recorder is not None
+        recorder.flush()
+        with open(recorder.path, "rb") as f:
+            _, records = trace.read_trace(f)
+            record_list = list(records)
+
+        # Replaying against the same size gives the same results, and a cache
+        # big enough for every key only misses each key once.
+        metrics = cache.metrics
+        assert metrics is not None
+        self.assertEqual(replay(record_list, 10, "lru"), (metrics.hits, metrics.misses))
+        self.assertEqual(replay(record_list, 15, "lru"), (85, 15))
+
+
 class TimeEvictionTestCase(unittest.HomeserverTestCase):
     """Test that time based eviction works correctly."""
 
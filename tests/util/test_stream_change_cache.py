@@ -1,4 +1,10 @@
-from synapse.util.caches.stream_change_cache import StreamChangeCache
+from unittest.mock import patch
+
+from synapse.util.caches import stream_change_cache
+from synapse.util.caches.stream_change_cache import (
+    CompactStreamChangeCache,
+    StreamChangeCache,
+)
 
 from tests import unittest
 
@@ -240,3 +246,86 @@ class StreamChangeCacheTests(unittest.HomeserverTestCase):
 
         # Unknown entities will return the stream start position.
         self.assertEqual(cache.get_max_pos_of_last_change("not@here.website"), 1)
+
+
+class CompactStreamChangeCacheTests(unittest.HomeserverTestCase):
+    """
+    Tests for CompactStreamChangeCache.
+    """
+
+    def test_matches_stream_change_cache(self) -> None:
+        """
+        CompactStreamChangeCache gives the same answers as StreamChangeCache,
+        including when changes arrive out of order.
+        """
+        caches = [
+            StreamChangeCache("#test", 1, prefilled_cache={"user@foo.com": 2}),
+            CompactStreamChangeCache("#test", 1, prefilled_cache={"user@foo.com": 2}),
+        ]
+        for cache in caches:
+            cache.entity_has_changed("bar@baz.net", 3)
+            cache.entity_has_changed("user2@foo.com", 5)
+            cache.entity_has_changed("user@foo.com", 5)
+            cache.entity_has_changed("bar2@baz.net", 4)
+            cache.entity_has_changed("bar@baz.net", 2)
+
+        for stream_pos in range(7):
+            results = [c.get_all_entities_changed(stream_pos) for c in caches]
+            self.assertEqual(results[0].hit, results[1].hit)
+            if results[0].hit:
+                self.assertCountEqual(results[0].entities, results[1].entities)
+
+            self.assertEqual(
+                caches[0].has_any_entity_changed(stream_pos),
+                caches[1].has_any_entity_changed(stream_pos),
+            )
+            for entity in ("user@foo.com", "bar@baz.net", "not@here.website"):
+                self.assertEqual(
+                    caches[0].has_entity_changed(entity, stream_pos),
+                    caches[1].has_entity_changed(entity, stream_pos),
+                )
+
+        self.assertEqual(
+            caches[1].get_all_entities_changed(3).entities,
+            ["bar2@baz.net", "user2@foo.com", "user@foo.com"],
+        )
+
+    def test_evict(self) -> None:
+        """
+        CompactStreamChangeCache evicts the earliest changes once it has more
+        than max size entities.
+        """
+        cache = CompactStreamChangeCache("#test", 1, max_size=2)
+
+        cache.entity_has_changed("user@foo.com", 2)
+        cache.entity_has_changed("bar@baz.net", 3)
+        cache.entity_has_changed("user@foo.com", 4)
+        cache.entity_has_changed("user@elsewhere.org", 5)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache._earliest_known_stream_pos, 3)
+        self.assertFalse(cache.get_all_entities_changed(3).hit)
+        self.assertEqual(
+            cache.get_all_entities_changed(4).entities, ["user@elsewhere.org"]
+        )
+        self.assertEqual(cache.get_max_pos_of_last_change("bar@baz.net"), 3)
+
+    def test_compact(self) -> None:
+        """
+        CompactStreamChangeCache drops superseded and evicted entries from its
+        arrays.
+        """
+        with patch.object(stream_change_cache, "_MIN_COMPACT_WASTE", 4):
+            cache = CompactStreamChangeCache("#test", 1, max_size=3)
+            for stream_pos in range(2, 20):
+                cache.entity_has_changed(
+                    "user%d@foo.com" % (stream_pos % 4), stream_pos
+                )
+
+        self.assertLess(len(cache._positions), 10)
+        self.assertEqual(len(cache), 3)
+        self.assertFalse(cache.get_all_entities_changed(16).hit)
+        self.assertEqual(
+            cache.get_all_entities_changed(17).entities,
+            ["user2@foo.com", "user3@foo.com"],
+        )